@@ -0,0 +1,64 @@
+"""Initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-06-12 10:00:00
+
+Matches what Base.metadata.create_all used to build at startup. Databases that were
+created that way should be stamped rather than upgraded: `alembic stamp 0001`.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _created_at():
+    return sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.func.now())
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("username", sa.String(), nullable=False, unique=True),
+        sa.Column("password", sa.String(), nullable=False),
+        _created_at(),
+    )
+    op.create_table(
+        "genres",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("name", sa.String(), nullable=False, unique=True),
+        _created_at(),
+    )
+    op.create_table(
+        "animes",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("description", sa.String(), nullable=False),
+        sa.Column("rating", sa.Integer(), nullable=False),
+        _created_at(),
+    )
+    op.create_table(
+        "favourites",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("anime_id", sa.Integer(), sa.ForeignKey("animes.id", ondelete="CASCADE"), primary_key=True),
+    )
+    op.create_table(
+        "prefereces",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("genre_id", sa.Integer(), sa.ForeignKey("genres.id", ondelete="CASCADE"), primary_key=True),
+    )
+    op.create_table(
+        "genreAnimes",
+        sa.Column("genre_id", sa.Integer(), sa.ForeignKey("genres.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("anime_id", sa.Integer(), sa.ForeignKey("animes.id", ondelete="CASCADE"), primary_key=True),
+    )
+
+
+def downgrade():
+    for table in ("genreAnimes", "prefereces", "favourites", "animes", "genres", "users"):
+        op.drop_table(table)
@@ -0,0 +1,37 @@
+"""Reverse lookup indexes on the association tables
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-06-12 10:30:00
+
+The composite primary keys lead with user_id / genre_id, so lookups by the second
+column (favourites and links by anime, preferences by genre) fell back to seq scans.
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_favourites_anime_id", "favourites", "anime_id"),
+    ("ix_prefereces_genre_id", "prefereces", "genre_id"),
+    ("ix_genreAnimes_anime_id", "genreAnimes", "anime_id"),
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == "postgresql":
+        # Build without holding a write lock on tables that are already populated.
+        with op.get_context().autocommit_block():
+            for name, table, column in INDEXES:
+                op.create_index(name, table, [column], postgresql_concurrently=True, if_not_exists=True)
+    else:
+        for name, table, column in INDEXES:
+            op.create_index(name, table, [column])
+
+
+def downgrade():
+    for name, table, _ in INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,35 @@
+"""Per-anime popularity counters
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-06-20 09:00:00
+
+Favourite and view counts plus the trending key, flushed in batches by
+anirecs.popularity. Favourite counts are backfilled from the favourites table.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "anime_stats",
+        sa.Column("anime_id", sa.Integer(), sa.ForeignKey("animes.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("favourites", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("views", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("trending", sa.Float(), nullable=True),
+    )
+    op.create_index("ix_anime_stats_favourites", "anime_stats", ["favourites", "anime_id"])
+    op.create_index("ix_anime_stats_trending", "anime_stats", ["trending", "anime_id"])
+    op.execute("INSERT INTO anime_stats (anime_id, favourites) SELECT anime_id, count(*) FROM favourites GROUP BY anime_id")
+
+
+def downgrade():
+    op.drop_index("ix_anime_stats_trending", table_name="anime_stats")
+    op.drop_index("ix_anime_stats_favourites", table_name="anime_stats")
+    op.drop_table("anime_stats")
@@ -0,0 +1,33 @@
+"""Revoked token ids
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-06-24 09:00:00
+
+Token and session ids revoked by /logout. Every worker keeps the unexpired ones
+in memory (anirecs.revocation) and picks up new rows by revoked_at.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "revoked_tokens",
+        sa.Column("jti", sa.String(), primary_key=True),
+        sa.Column("revoked_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("expires_at", sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+    op.create_index("ix_revoked_tokens_revoked_at", "revoked_tokens", ["revoked_at"])
+    op.create_index("ix_revoked_tokens_expires_at", "revoked_tokens", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("ix_revoked_tokens_expires_at", table_name="revoked_tokens")
+    op.drop_index("ix_revoked_tokens_revoked_at", table_name="revoked_tokens")
+    op.drop_table("revoked_tokens")
@@ -0,0 +1,52 @@
+"""Search indexes and materialized recommendations
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-06-26 09:00:00
+
+The pg_trgm and full-text indexes behind anirecs.search, and the table that
+anirecs.materialize writes. They used to be part of 0001, so a database stamped
+0001 after create_all never got them; it gets them from this revision.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+ANIME_DOCUMENT = "to_tsvector('english', title || ' ' || description)"
+
+TRIGRAM_INDEXES = [
+    ("ix_users_username_trgm", "users", "username"),
+    ("ix_genres_name_trgm", "genres", "name"),
+    ("ix_animes_title_trgm", "animes", "title"),
+]
+
+
+def upgrade():
+    op.create_table(
+        "user_recommendations",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("anime_ids", sa.LargeBinary(), nullable=False),
+        sa.Column("scores", sa.LargeBinary(), nullable=False),
+        sa.Column("updated_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        # Build without holding a write lock on tables that are already populated.
+        with op.get_context().autocommit_block():
+            for name, table, column in TRIGRAM_INDEXES:
+                op.create_index(name, table, [column], postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"}, postgresql_concurrently=True, if_not_exists=True)
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_animes_document ON animes USING gin (({ANIME_DOCUMENT}))")
+    else:
+        for name, table, column in TRIGRAM_INDEXES:
+            op.create_index(name, table, [column])
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_animes_document")
+    for name, table, _ in TRIGRAM_INDEXES:
+        op.drop_index(name, table_name=table)
+    op.drop_table("user_recommendations")
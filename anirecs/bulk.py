@@ -0,0 +1,127 @@
+from fastapi import HTTPException, status
+from sqlalchemy import delete, insert, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+
+CREATED = "created"
+DELETED = "deleted"
+CONFLICT = "conflict"
+DUPLICATE = "duplicate"
+NOT_FOUND = "not_found"
+FORBIDDEN = "forbidden"
+
+
+def check_size(items):
+    if len(items) > settings.bulk_max_items:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {settings.bulk_max_items} items per request")
+
+
+def supports_returning(db: AsyncSession):
+    return db.bind.dialect.name == "postgresql"
+
+
+def insert_ignore(db: AsyncSession, model):
+    # INSERT ... ON CONFLICT DO NOTHING for the dialects that spell it that way.
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(model).on_conflict_do_nothing()
+    return insert(model).prefix_with("IGNORE")
+
+
+def upsert(dialect: str, model, values, index_elements, update_columns):
+    # INSERT ... ON CONFLICT (index_elements) DO UPDATE SET column = excluded.column
+    insert_ = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert_(model).values(values)
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: getattr(statement.excluded, column) for column in update_columns},
+    )
+
+
+async def existing_ids(db: AsyncSession, model, ids):
+    if not ids:
+        return set()
+    return set((await db.execute(select(model.id).where(model.id.in_(set(ids))))).scalars())
+
+
+async def existing_keys(db: AsyncSession, columns, keys):
+    if not keys:
+        return set()
+    rows = (await db.execute(select(*columns).where(tuple_(*columns).in_(keys)))).all()
+    return {tuple(row) for row in rows}
+
+
+async def create_link(db: AsyncSession, model, values: dict, parents):
+    # One INSERT ... ON CONFLICT DO NOTHING; returns False when the row already existed.
+    # parents maps a key name to (parent model, detail of the 404 raised when it's missing),
+    # which is only looked up after the foreign key has already rejected the insert.
+    statement = insert_ignore(db, model).values(values)
+    try:
+        if supports_returning(db):
+            created = (await db.execute(statement.returning(*model.__table__.primary_key.columns))).first() is not None
+        else:
+            created = (await db.execute(statement)).rowcount == 1
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        for name, (parent, detail) in parents.items():
+            if not await existing_ids(db, parent, [values[name]]):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+        raise
+    return created
+
+
+async def create_links(db: AsyncSession, model, items, parents):
+    # items are dicts of the link's key columns; parents maps a key name to
+    # (parent model, status reported when that parent doesn't exist).
+    key_names = list(items[0]) if items else []
+    columns = [getattr(model, name) for name in key_names]
+    keys = [tuple(item[name] for name in key_names) for item in items]
+
+    statuses = [None] * len(items)
+    seen = set()
+    for position, key in enumerate(keys):
+        if key in seen:
+            statuses[position] = DUPLICATE
+        seen.add(key)
+    for name, (parent, missing_status) in parents.items():
+        found = await existing_ids(db, parent, [item[name] for item in items])
+        for position, item in enumerate(items):
+            if statuses[position] is None and item[name] not in found:
+                statuses[position] = missing_status
+
+    pending = [position for position, state in enumerate(statuses) if state is None]
+    if pending:
+        values = [items[position] for position in pending]
+        statement = insert_ignore(db, model).values(values)
+        if supports_returning(db):
+            created = {tuple(row) for row in (await db.execute(statement.returning(*columns))).all()}
+        else:
+            existing = await existing_keys(db, columns, [keys[position] for position in pending])
+            await db.execute(statement)
+            created = {keys[position] for position in pending} - existing
+        for position in pending:
+            statuses[position] = CREATED if keys[position] in created else CONFLICT
+    await db.commit()
+    return statuses
+
+
+async def delete_links(db: AsyncSession, model, items):
+    key_names = list(items[0]) if items else []
+    columns = [getattr(model, name) for name in key_names]
+    keys = list({tuple(item[name] for name in key_names) for item in items})
+    if not keys:
+        return []
+    statement = delete(model).where(tuple_(*columns).in_(keys)).execution_options(synchronize_session=False)
+    if supports_returning(db):
+        deleted = {tuple(row) for row in (await db.execute(statement.returning(*columns))).all()}
+    else:
+        deleted = await existing_keys(db, columns, keys)
+        await db.execute(statement)
+    await db.commit()
+    return [DELETED if tuple(item[name] for name in key_names) in deleted else NOT_FOUND for item in items]
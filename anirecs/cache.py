@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    # Bounded LRU mapping whose entries also expire ttl seconds after being set.
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MemoryBackend:
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize, ttl)
+        self._counters = {}
+
+    async def get(self, key: str):
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self._cache.set(key, value, ttl)
+
+    async def delete(self, key: str):
+        self._cache.delete(key)
+
+    async def incr(self, key: str):
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def get_counter(self, key: str):
+        return self._counters.get(key, 0)
+
+
+class RedisBackend:
+    # Works with redis.asyncio.Redis or anything exposing the same coroutines
+    # (get/set/delete/incr), e.g. an in-memory fake.
+    def __init__(self, client, prefix: str = "anirecs:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str):
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(self.prefix + key, value, ex=max(int(ttl), 1))
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def incr(self, key: str):
+        return await self.client.incr(self.prefix + key)
+
+    async def get_counter(self, key: str):
+        value = await self.client.get(self.prefix + key)
+        return int(value) if value is not None else 0
+
+
+def create_backend(kind: str, redis_url: str, maxsize: int, ttl: float):
+    if kind == "redis":
+        from redis import asyncio as redis_asyncio
+
+        return RedisBackend(redis_asyncio.from_url(redis_url))
+    return MemoryBackend(maxsize, ttl)
@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ANICAT01"
+# Magic, then the byte length of the JSON header that follows it.
+PREAMBLE = struct.Struct("<8sQ")
+ALIGNMENT = 64
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def _timestamps(values):
+    # Microseconds since the epoch. SQLite hands back naive datetimes; those are kept
+    # naive on the way out so responses look the same as when read from the database.
+    naive = any(value.tzinfo is None for value in values)
+    epoch = EPOCH.replace(tzinfo=None) if naive else EPOCH
+    return np.asarray([(value - epoch) // MICROSECOND for value in values], dtype=np.int64), naive
+
+
+def _strings(values):
+    # Concatenated UTF-8 plus offsets, CSR style.
+    encoded = [value.encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _adjacency(rows, columns, n_rows):
+    # CSR over dense positions: row r's neighbours are columns[indptr[r]:indptr[r + 1]].
+    order = np.lexsort((columns, rows))
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, columns[order].astype(np.int32)
+
+
+class CatalogSnapshot:
+    # Read-only view of animes, genres and the links between them, backed by one
+    # memory-mapped file. Every array is a zero-copy window into the mapping, so all
+    # workers on a host share a single page cache copy.
+    def __init__(self, mapping, header, arrays):
+        self.mapping = mapping
+        self.version = header["version"]
+        self.built_at = datetime.fromisoformat(header["built_at"])
+        self.epoch = EPOCH.replace(tzinfo=None) if header["naive_timestamps"] else EPOCH
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "rb") as file:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = PREAMBLE.unpack_from(mapping)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        header = json.loads(mapping[PREAMBLE.size:PREAMBLE.size + header_size])
+        data_start = _aligned(PREAMBLE.size + header_size)
+        arrays = {
+            name: np.frombuffer(mapping, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+            for name, (dtype, offset, count) in header["arrays"].items()
+        }
+        return cls(mapping, header, arrays)
+
+    @staticmethod
+    def _position(ids, key: int):
+        position = int(np.searchsorted(ids, key))
+        if position < len(ids) and ids[position] == key:
+            return position
+        return None
+
+    def _string(self, offsets, data, position: int):
+        return bytes(data[offsets[position]:offsets[position + 1]]).decode()
+
+    def _timestamp(self, values, position: int):
+        return self.epoch + int(values[position]) * MICROSECOND
+
+    def anime(self, position: int):
+        return {
+            "id": int(self.anime_ids[position]),
+            "title": self._string(self.anime_title_offsets, self.anime_titles, position),
+            "description": self._string(self.anime_description_offsets, self.anime_descriptions, position),
+            "rating": int(self.anime_ratings[position]),
+            "created_at": self._timestamp(self.anime_created_at, position),
+        }
+
+    def genre(self, position: int):
+        return {
+            "name": self._string(self.genre_name_offsets, self.genre_names, position),
+            "id": int(self.genre_ids[position]),
+            "created_at": self._timestamp(self.genre_created_at, position),
+        }
+
+    def animes_in_genre(self, genre_id: int):
+        position = self._position(self.genre_ids, genre_id)
+        if position is None:
+            return []
+        members = self.genre_animes[self.genre_anime_indptr[position]:self.genre_anime_indptr[position + 1]]
+        return [self.anime(member) for member in members]
+
+    def genres_of_anime(self, anime_id: int):
+        position = self._position(self.anime_ids, anime_id)
+        if position is None:
+            return []
+        members = self.anime_genres[self.anime_genre_indptr[position]:self.anime_genre_indptr[position + 1]]
+        return [self.genre(member) for member in members]
+
+
+def _arrays(db: Session):
+    animes = db.execute(select(models.Anime.id, models.Anime.title, models.Anime.description, models.Anime.rating, models.Anime.created_at).order_by(models.Anime.id)).all()
+    genres = db.execute(select(models.Genre.id, models.Genre.name, models.Genre.created_at).order_by(models.Genre.id)).all()
+    links = db.execute(select(models.GenreAnime.genre_id, models.GenreAnime.anime_id)).all()
+
+    anime_ids = np.asarray([row.id for row in animes], dtype=np.int32)
+    genre_ids = np.asarray([row.id for row in genres], dtype=np.int32)
+    anime_created_at, naive = _timestamps([row.created_at for row in animes])
+    genre_created_at, genre_naive = _timestamps([row.created_at for row in genres])
+    arrays = {"anime_ids": anime_ids, "anime_ratings": np.asarray([row.rating for row in animes], dtype=np.int32), "anime_created_at": anime_created_at}
+    arrays["anime_title_offsets"], arrays["anime_titles"] = _strings([row.title for row in animes])
+    arrays["anime_description_offsets"], arrays["anime_descriptions"] = _strings([row.description for row in animes])
+    arrays.update(genre_ids=genre_ids, genre_created_at=genre_created_at)
+    arrays["genre_name_offsets"], arrays["genre_names"] = _strings([row.name for row in genres])
+
+    link_pairs = np.asarray(links, dtype=np.int64).reshape(-1, 2)
+    # Both id lists are sorted, so searchsorted gives dense positions directly.
+    genre_positions = np.searchsorted(genre_ids, link_pairs[:, 0])
+    anime_positions = np.searchsorted(anime_ids, link_pairs[:, 1])
+    arrays["genre_anime_indptr"], arrays["genre_animes"] = _adjacency(genre_positions, anime_positions, len(genre_ids))
+    arrays["anime_genre_indptr"], arrays["anime_genres"] = _adjacency(anime_positions, genre_positions, len(anime_ids))
+    return arrays, naive or genre_naive
+
+
+def _aligned(size: int):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def _write(path: str, arrays, naive: bool):
+    # Array offsets are relative to the start of the data section, which begins at the
+    # first aligned byte after the header.
+    layout, size = {}, 0
+    for name, array in arrays.items():
+        layout[name] = (array.dtype.str, size, len(array))
+        size += _aligned(array.nbytes)
+    header = {
+        "version": uuid.uuid4().hex,
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "naive_timestamps": naive,
+        "arrays": layout,
+    }
+    encoded = json.dumps(header).encode()
+    data_start = _aligned(PREAMBLE.size + len(encoded))
+
+    tmp_path = f"{path}.{header['version']}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(PREAMBLE.pack(MAGIC, len(encoded)))
+        file.write(encoded)
+        for name, array in arrays.items():
+            file.seek(data_start + layout[name][1])
+            file.write(np.ascontiguousarray(array).tobytes())
+        file.truncate(data_start + size)
+        file.flush()
+        os.fsync(file.fileno())
+    # Workers that still map the previous file keep reading it until they reload.
+    os.replace(tmp_path, path)
+    return header["version"]
+
+
+def build(db: Session, path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Serialize builders across workers, and read the tables only once the lock is
+    # held, so the last snapshot to land is never older than the one it replaces.
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        arrays, naive = _arrays(db)
+        db.rollback()
+        _write(path, arrays, naive)
+    return len(arrays["anime_ids"]), len(arrays["genre_ids"]), len(arrays["genre_animes"])
+
+
+_snapshot = None
+_snapshot_key = None
+_lock = threading.Lock()
+
+
+def get_snapshot():
+    global _snapshot, _snapshot_key
+    if not settings.catalog_snapshot:
+        return None
+    try:
+        stat = os.stat(settings.catalog_snapshot_path)
+    except FileNotFoundError:
+        return None
+    # os.replace gives every new version a new inode.
+    key = (stat.st_ino, stat.st_mtime_ns)
+    if _snapshot is not None and _snapshot_key == key:
+        return _snapshot
+    with _lock:
+        if _snapshot is None or _snapshot_key != key:
+            _snapshot = CatalogSnapshot.load(settings.catalog_snapshot_path)
+            _snapshot_key = key
+        return _snapshot
+
+
+class _Staleness:
+    # Catalog writes flag the snapshot; the refresher rebuilds at most once per interval.
+    def __init__(self):
+        self.dirty = False
+
+    def mark(self):
+        if settings.catalog_snapshot:
+            self.dirty = True
+
+
+stale = _Staleness()
+_task = None
+
+
+def _rebuild():
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return build(db, settings.catalog_snapshot_path)
+    finally:
+        db.close()
+
+
+async def _refresh_loop():
+    while True:
+        if stale.dirty:
+            stale.dirty = False
+            try:
+                await run_in_threadpool(_rebuild)
+            except Exception:
+                logger.exception("Rebuilding the catalog snapshot failed")
+                stale.dirty = True
+        await asyncio.sleep(settings.catalog_snapshot_refresh_seconds)
+
+
+def start():
+    global _task
+    if settings.catalog_snapshot and _task is None:
+        if not os.path.exists(settings.catalog_snapshot_path):
+            stale.mark()
+        _task = asyncio.get_running_loop().create_task(_refresh_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m anirecs.catalog")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_parser = subcommands.add_parser("build", help="Write the memory-mapped catalog snapshot")
+    build_parser.add_argument("--output", default=settings.catalog_snapshot_path)
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        animes, genres, links = build(db, args.output)
+    finally:
+        db.close()
+    print(f"Wrote {animes} animes, {genres} genres and {links} links to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,9 +11,108 @@ class Settings(BaseSettings):
     algorithm: str
     access_token_expire_minutes: int
     refresh_token_expire_days: int
+    database_url: str = ""
+    database_async: bool = True
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout: float = 30.0
+    database_pool_recycle: int = 1800
+    database_pool_pre_ping: bool = True
+    database_pgbouncer: bool = False
+    password_hash_executor: str = "thread"
+    password_hash_workers: int = 4
+    password_hash_queue_size: int = 32
+    password_retry_after_seconds: int = 1
+    # "db", "cache" or "claims". The "cache" mode keeps a per-worker cache: an update
+    # or delete evicts only in the worker that served it, so the others may serve the
+    # old user for up to auth_user_cache_ttl_seconds. Keep the TTL at what's acceptable.
+    auth_user_mode: str = "db"
+    auth_user_cache_size: int = 10000
+    auth_user_cache_ttl_seconds: int = 60
+    page_size_default: int = 100
+    page_size_max: int = 1000
+    batch_get_max_ids: int = 1000
+    response_fast_json: bool = False
+    search_backend: str = "postgres"
+    search_similarity_threshold: float = 0.3
+    # The "memory" backend's index is per worker and rebuilt from the database this
+    # often, which bounds how long another worker's writes stay unsearchable.
+    search_memory_refresh_seconds: float = 60.0
+    export_batch_size: int = 1000
+    bulk_max_items: int = 1000
+    server_timing: bool = False
+    # Statements per request at which query_pattern_flags() reports a pattern.
+    query_pattern_threshold: int = 3
+    cache_backend: str = "memory"
+    cache_redis_url: str = "redis://localhost:6379/0"
+    cache_ttl_seconds: int = 60
+    cache_max_entries: int = 10000
+    recommendation_refresh_seconds: int = 300
+    recommendation_limit_max: int = 200
+    recommendation_materialized: bool = False
+    recommendation_materialized_size: int = 200
+    recommendation_materialize_interval_seconds: float = 5.0
+    neighbor_index_path: str = "var/anime_neighbors.npz"
+    neighbor_top_k: int = 50
+    embedding_index_path: str = "var/anime_embeddings.npz"
+    embedding_dim: int = 256
+    embedding_hash_features: int = 262144
+    embedding_lsh_tables: int = 16
+    embedding_lsh_bits: int = 10
+    catalog_snapshot: bool = False
+    catalog_snapshot_path: str = "var/catalog.snapshot"
+    catalog_snapshot_refresh_seconds: float = 5.0
+    lazy_routers: bool = False
+    popularity_enabled: bool = False
+    popularity_flush_seconds: float = 5.0
+    popularity_top_size: int = 200
+    trending_half_life_hours: float = 24.0
+    trending_favourite_weight: float = 1.0
+    trending_view_weight: float = 0.1
+    rate_limit_enabled: bool = False
+    # "memory" (per worker) or "redis" (shared, at cache_redis_url).
+    rate_limit_backend: str = "memory"
+    rate_limit_default: str = "100/second"
+    # "METHOD /path" -> "N/second|minute|hour|day" or "unlimited"; the path may be a route template.
+    rate_limit_rules: dict = {
+        "POST /login": "10/minute",
+        "POST /register": "5/minute",
+        "GET /animes": "20/second",
+        "GET /metrics": "unlimited",
+    }
+    rate_limit_max_keys: int = 100000
+    token_revocation: bool = True
+    token_revocation_sync_seconds: float = 1.0
+    token_revocation_prune_seconds: float = 300.0
+    token_revocation_bloom_capacity: int = 100000
+    token_revocation_bloom_error_rate: float = 0.001
 
     class Config:
         env_file = ".env"
 
 
-settings = Settings()
\ No newline at end of file
+class LazySettings:
+    # Settings() reads the environment and .env on first attribute access instead of at
+    # import, and configure() can install an explicit instance before that happens.
+    __slots__ = ("_settings",)
+
+    def __init__(self):
+        object.__setattr__(self, "_settings", None)
+
+    def _resolve(self):
+        if self._settings is None:
+            object.__setattr__(self, "_settings", Settings())
+        return self._settings
+
+    def __getattr__(self, name: str):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._resolve(), name, value)
+
+
+settings = LazySettings()
+
+
+def configure(new_settings: Settings):
+    object.__setattr__(settings, "_settings", new_settings)
\ No newline at end of file
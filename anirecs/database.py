@@ -1,20 +1,241 @@
-from sqlalchemy import create_engine
+import threading
+import time
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+from starlette.concurrency import run_in_threadpool
+from . import metrics
 from .config import settings
 
-SQLALCHEMY_DATABASE_URL = f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}'
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def database_url():
+    return settings.database_url or f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}'
+
+
+def async_url(url: str):
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS[scheme.split('+')[0]]}://{rest}"
+
+pool_checkout_seconds = metrics.Histogram("anirecs_db_pool_checkout_seconds", "Time spent getting a connection from the pool", ["engine"])
+pool_waits = metrics.Counter("anirecs_db_pool_waits_total", "Checkouts that had to wait for a connection to be returned", ["engine"])
+pool_timeouts = metrics.Counter("anirecs_db_pool_timeouts_total", "Checkouts that gave up after pool_timeout", ["engine"])
+pool_in_use = metrics.Gauge("anirecs_db_pool_in_use", "Connections currently checked out", ["engine"])
+
+
+def _instrumented(pool_class, label: str):
+    # A subclass rather than pool events alone: there is no "before checkout" event
+    # to time the wait from, and recreate() keeps the class across dispose().
+    class InstrumentedPool(pool_class):
+        def connect(self):
+            if pool_class is not NullPool and self._max_overflow > -1 and self._overflow >= self._max_overflow and not self.checkedin():
+                pool_waits.inc(engine=label)
+            started = time.perf_counter()
+            try:
+                return super().connect()
+            except exc.TimeoutError:
+                pool_timeouts.inc(engine=label)
+                raise
+            finally:
+                pool_checkout_seconds.observe(time.perf_counter() - started, engine=label)
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_class.__name__}"
+    return InstrumentedPool
+
+
+def _sqlite_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def _track_in_use(sync_engine, label: str):
+    event.listen(sync_engine, "checkout", lambda *args: pool_in_use.inc(engine=label))
+    event.listen(sync_engine, "checkin", lambda *args: pool_in_use.dec(engine=label))
+
+
+def engine_options(label: str, pool_class):
+    options = {"pool_pre_ping": settings.database_pool_pre_ping}
+    if database_url().startswith("sqlite"):
+        # Local/benchmark databases only; connections move between threadpool threads.
+        options["connect_args"] = {"check_same_thread": False}
+    if settings.database_pgbouncer:
+        # PgBouncer in transaction mode owns pooling, and server-side prepared
+        # statements don't survive a connection being handed to another client.
+        options["poolclass"] = _instrumented(NullPool, label)
+        if label == "async":
+            options["connect_args"] = {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+        return options
+    options.update(
+        poolclass=_instrumented(pool_class, label),
+        pool_size=settings.database_pool_size,
+        max_overflow=settings.database_max_overflow,
+        pool_timeout=settings.database_pool_timeout,
+        pool_recycle=settings.database_pool_recycle,
+    )
+    return options
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _create_engines():
+    url = database_url()
+    engine = create_engine(url, **engine_options("sync", QueuePool))
+    async_engine = create_async_engine(async_url(url), **engine_options("async", AsyncAdaptedQueuePool)) if settings.database_async else None
+    sync_engines = {"sync": engine}
+    if async_engine is not None:
+        sync_engines["async"] = async_engine.sync_engine
+    for label, sync_engine in sync_engines.items():
+        _track_in_use(sync_engine, label)
+        if url.startswith("sqlite"):
+            event.listen(sync_engine, "connect", _sqlite_foreign_keys)
+    return {
+        "engine": engine,
+        "SessionLocal": sessionmaker(autocommit=False, autoflush=False, bind=engine),
+        "async_engine": async_engine,
+        "AsyncSessionLocal": sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, class_=AsyncSession, bind=async_engine),
+    }
+
+
+def engines():
+    # Created on first use rather than at import, so importing the app needs neither
+    # a reachable database nor its driver, and create_app(settings) can still change them.
+    if not _engines:
+        with _engines_lock:
+            if not _engines:
+                _engines.update(_create_engines())
+    return _engines
+
+
+async def dispose():
+    # Closes pooled connections; the next use creates fresh engines from the current settings.
+    with _engines_lock:
+        current = dict(_engines)
+        _engines.clear()
+    if current.get("async_engine") is not None:
+        await current["async_engine"].dispose()
+    if current.get("engine") is not None:
+        current["engine"].dispose()
+
+
+def __getattr__(name: str):
+    # Module attributes kept for existing callers (alembic/env.py, benchmarks, CLIs).
+    if name == "SQLALCHEMY_DATABASE_URL":
+        return database_url()
+    if name == "SQLALCHEMY_ASYNC_DATABASE_URL":
+        return async_url(database_url())
+    if name == "IS_SQLITE":
+        return database_url().startswith("sqlite")
+    if name in ("engine", "SessionLocal", "async_engine", "AsyncSessionLocal"):
+        return engines()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _idle_connections():
+    if not _engines:
+        return {}
+    pools = {"sync": _engines["engine"].pool}
+    if _engines["async_engine"] is not None:
+        pools["async"] = _engines["async_engine"].sync_engine.pool
+    return {(label,): pool.checkedin() for label, pool in pools.items() if hasattr(pool, "checkedin")}
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+pool_idle = metrics.Gauge("anirecs_db_pool_idle", "Connections sitting idle in the pool", ["engine"], callback=_idle_connections)
 
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
+class ThreadedSession:
+    # Exposes the AsyncSession API on top of a blocking Session, running every
+    # database call in the threadpool so the event loop is never blocked.
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    @property
+    def bind(self):
+        return self.sync_session.bind
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, statement, params, **kwargs)
+
+    async def stream(self, statement, params=None, **kwargs):
+        statement = statement.execution_options(stream_results=True)
+        return ThreadedResult(await run_in_threadpool(self.sync_session.execute, statement, params, **kwargs))
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self, objects=None):
+        await run_in_threadpool(self.sync_session.flush, objects)
+
+    async def refresh(self, instance, attribute_names=None):
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+
+class ThreadedResult:
+    # The part of AsyncResult that streaming callers use, over a server-side cursor.
+    def __init__(self, result):
+        self.result = result
+
+    async def partitions(self, size: int):
+        while True:
+            rows = await run_in_threadpool(self.result.fetchmany, size)
+            if not rows:
+                break
+            yield rows
+
+    async def close(self):
+        await run_in_threadpool(self.result.close)
+
+
+def open_session():
+    current = engines()
+    if current["async_engine"] is None:
+        return ThreadedSession(current["SessionLocal"]())
+    return current["AsyncSessionLocal"]()
+
+
+async def get_db():
+    db = open_session()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+def get_sync_db():
+    db = engines()["SessionLocal"]()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,240 @@
+import argparse
+import glob
+import os
+import re
+import threading
+import uuid
+import zlib
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from scipy import sparse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config import settings
+
+# Fixed so query-time embeddings of new titles land in the same space as the build.
+PROJECTION_SEED = 20240611
+BUILD_BATCH_SIZE = 4096
+
+_WORD = re.compile(r"\w+")
+
+
+def _hashed_terms(text: str, n_features: int):
+    # Unigrams and bigrams, signed feature hashing (crc32 so it's stable across processes).
+    words = _WORD.findall(text.lower())
+    counts = {}
+    for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        h = zlib.crc32(term.encode())
+        column = h % n_features
+        counts[column] = counts.get(column, 0) + (1 if h & 0x80000000 else -1)
+    return counts
+
+
+def _term_matrix(documents, n_features: int):
+    indptr, indices, data = [0], [], []
+    for text in documents:
+        counts = {column: count for column, count in _hashed_terms(text, n_features).items() if count}
+        indices.extend(counts)
+        # Sublinear tf, keeping the hash sign.
+        data.extend(np.sign(count) * (1.0 + np.log(abs(count))) for count in counts.values())
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.asarray(data, dtype=np.float32), indices, indptr), shape=(len(indptr) - 1, n_features))
+
+
+def _projection(columns, dim: int):
+    # One Gaussian row per hashed feature, derived from the feature itself, so the
+    # projection never has to be materialized for all n_features.
+    rows = np.empty((len(columns), dim), dtype=np.float32)
+    for position, column in enumerate(columns):
+        rows[position] = np.random.default_rng((PROJECTION_SEED, int(column))).standard_normal(dim, dtype=np.float32)
+    return rows / np.sqrt(dim)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def embed(documents, idf, dim: int):
+    terms = _term_matrix(documents, len(idf)).multiply(idf).tocsr()
+    columns, remapped = np.unique(terms.indices, return_inverse=True)
+    terms = sparse.csr_matrix((terms.data, remapped, terms.indptr), shape=(terms.shape[0], len(columns)))
+    return _normalize(terms @ _projection(columns, dim)).astype(np.float32)
+
+
+def document(title: str, description: str):
+    # Title repeated so it outweighs a long description.
+    return f"{title} {title} {description}"
+
+
+class ContentIndex:
+    # Random-hyperplane LSH over L2-normalized embeddings. Each table keeps the bucket
+    # code of every row sorted, so a bucket lookup is two searchsorted calls.
+    def __init__(self, anime_ids, vectors, idf, planes, codes, order):
+        self.anime_ids = anime_ids
+        self.vectors = vectors
+        self.idf = idf
+        self.planes = planes
+        self.codes = codes
+        self.order = order
+
+    @staticmethod
+    def hash(planes, vectors):
+        bits = np.einsum("tbd,nd->tnb", planes, vectors) > 0
+        return (bits.astype(np.uint32) << np.arange(planes.shape[1], dtype=np.uint32)).sum(axis=2, dtype=np.uint32)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in ("anime_ids", "idf", "planes", "codes", "order")}
+            vectors_file = str(data["vectors_file"])
+        # Memory-mapped read-only: every worker shares the page cache copy.
+        vectors = np.load(os.path.join(os.path.dirname(path), vectors_file), mmap_mode="r")
+        return cls(arrays["anime_ids"], vectors, arrays["idf"], arrays["planes"], arrays["codes"], arrays["order"])
+
+    def embed(self, title: str, description: str):
+        return embed([document(title, description)], self.idf, self.vectors.shape[1])[0]
+
+    def vector(self, anime_id: int):
+        position = np.searchsorted(self.anime_ids, anime_id)
+        if position < len(self.anime_ids) and self.anime_ids[position] == anime_id:
+            return np.asarray(self.vectors[position])
+        return None
+
+    def candidates(self, vector):
+        codes = self.hash(self.planes, vector[None, :])[:, 0]
+        n_bits = self.planes.shape[1]
+        # Multi-probe: the query's own bucket plus every bucket one bit away.
+        probes = codes[:, None] ^ np.concatenate(([0], np.uint32(1) << np.arange(n_bits, dtype=np.uint32))).astype(np.uint32)
+        found = []
+        for table, table_probes in enumerate(probes):
+            lo = np.searchsorted(self.codes[table], table_probes, side="left")
+            hi = np.searchsorted(self.codes[table], table_probes, side="right")
+            found.extend(self.order[table, start:stop] for start, stop in zip(lo, hi) if stop > start)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def similar(self, anime_id: int, title: str, description: str, limit: int):
+        vector = self.vector(anime_id)
+        if vector is None:
+            vector = self.embed(title, description)
+        positions = self.candidates(vector)
+        if len(positions) <= limit:
+            # Sparse buckets can't fill the page; an exact scan of the mapping can.
+            positions = np.arange(len(self.anime_ids))
+        positions = positions[self.anime_ids[positions] != anime_id]
+        if not len(positions):
+            return [], []
+        # Exact re-rank of the candidate set (sorted, so reads walk the mapping forward).
+        scores = np.asarray(self.vectors[positions] @ vector)
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return self.anime_ids[positions[top]].tolist(), scores[top].tolist()
+
+
+def build(db: Session, path: str, dim: int, n_features: int, tables: int, bits: int):
+    # Offline build on a blocking Session. Vectors are written straight into a new
+    # .npy next to the index, then the small index file is swapped in atomically.
+    rows = db.execute(select(models.Anime.id, models.Anime.title, models.Anime.description).order_by(models.Anime.id)).all()
+    anime_ids = np.asarray([row.id for row in rows], dtype=np.int32)
+
+    document_frequency = np.zeros(n_features, dtype=np.int64)
+    for start in range(0, len(rows), BUILD_BATCH_SIZE):
+        terms = _term_matrix([document(row.title, row.description) for row in rows[start:start + BUILD_BATCH_SIZE]], n_features)
+        document_frequency += np.bincount(terms.indices, minlength=n_features)
+    idf = (np.log((1 + len(rows)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(path)[0]
+    previous = _vectors_file(path)
+    vectors_path = f"{stem}.{uuid.uuid4().hex}.npy"
+    vectors = open_memmap(vectors_path, mode="w+", dtype=np.float32, shape=(len(rows), dim))
+    for start in range(0, len(rows), BUILD_BATCH_SIZE):
+        batch = rows[start:start + BUILD_BATCH_SIZE]
+        vectors[start:start + len(batch)] = embed([document(row.title, row.description) for row in batch], idf, dim)
+    vectors.flush()
+
+    planes = np.random.default_rng().standard_normal((tables, bits, dim)).astype(np.float32)
+    codes = ContentIndex.hash(planes, vectors) if len(rows) else np.empty((tables, 0), dtype=np.uint32)
+    order = np.argsort(codes, axis=1, kind="stable").astype(np.int32)
+    codes = np.take_along_axis(codes, order, axis=1)
+    del vectors
+
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, anime_ids=anime_ids, idf=idf, planes=planes, codes=codes, order=order, vectors_file=os.path.basename(vectors_path))
+    os.replace(tmp_path, path)
+    # Workers still mapping an older file keep it alive until they reload. The previous
+    # generation's file stays on disk: a worker that has just read the old index file
+    # may not have opened its vectors yet.
+    keep = {os.path.basename(vectors_path), previous}
+    for stale in glob.glob(f"{glob.escape(stem)}.*.npy"):
+        if os.path.basename(stale) not in keep:
+            os.remove(stale)
+    return len(rows)
+
+
+def _vectors_file(path: str):
+    try:
+        with np.load(path) as data:
+            return str(data["vectors_file"])
+    except FileNotFoundError:
+        return None
+
+
+_index = None
+_index_mtime = None
+_lock = threading.Lock()
+
+
+async def get_index():
+    path = settings.embedding_index_path
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+    if _index is not None and _index_mtime == mtime:
+        return _index
+    # Reading the arrays blocks, so it runs in a worker thread rather than on the event loop.
+    return await run_in_threadpool(_load, path, mtime)
+
+
+def _load(path: str, mtime: float):
+    global _index, _index_mtime
+    with _lock:
+        if _index is None or _index_mtime != mtime:
+            _index = ContentIndex.load(path)
+            _index_mtime = mtime
+        return _index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m anirecs.embeddings")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_parser = subcommands.add_parser("build", help="Embed anime titles and descriptions and build the similarity index")
+    build_parser.add_argument("--dim", type=int, default=settings.embedding_dim)
+    build_parser.add_argument("--features", type=int, default=settings.embedding_hash_features)
+    build_parser.add_argument("--tables", type=int, default=settings.embedding_lsh_tables)
+    build_parser.add_argument("--bits", type=int, default=settings.embedding_lsh_bits)
+    build_parser.add_argument("--output", default=settings.embedding_index_path)
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        count = build(db, args.output, args.dim, args.features, args.tables, args.bits)
+    finally:
+        db.close()
+    print(f"Embedded {count} animes into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import logging
+import re
+import time
+from collections import Counter as Tally
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import metrics
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+request_seconds = metrics.Histogram("anirecs_http_request_seconds", "Request latency by route", ["method", "route", "status"])
+requests_total = metrics.Counter("anirecs_http_requests_total", "Requests by route and status", ["method", "route", "status"])
+requests_in_flight = metrics.Gauge("anirecs_http_requests_in_flight", "Requests currently being handled", ["method"])
+request_queries = metrics.Histogram("anirecs_db_queries_per_request", "SQL statements executed per request", ["route"], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+request_db_seconds = metrics.Histogram("anirecs_db_seconds_per_request", "Time spent in SQL statements per request", ["route"])
+query_patterns = metrics.Counter("anirecs_db_query_patterns_total", "Requests flagged for an N+1 style query pattern", ["route", "pattern"])
+
+UNMATCHED_ROUTE = "unmatched"
+
+_IN_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+|:\w+))*\s*\)")
+_SPACE = re.compile(r"\s+")
+# SELECT ... FROM t WHERE t.id = <param> -- what Session.get() and most existence checks emit.
+_POINT_LOOKUP = re.compile(r"^SELECT .* WHERE \"?(\w+)\"?\.id = (?:\?|%\(\w+\)s|\$\d+|:\w+)$", re.IGNORECASE)
+# WHERE ... IN (...) / = ANY(...): already batched, e.g. by the loader, so running it
+# again for another batch isn't a per-item loop.
+_BATCHED = re.compile(r" IN \(\.\.\.\)| = ANY ?\(", re.IGNORECASE)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = Tally()
+
+
+_stats: ContextVar = ContextVar("anirecs_request_stats", default=None)
+
+
+def _shape(statement: str):
+    return _IN_LIST.sub("(...)", _SPACE.sub(" ", statement).strip())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _stats.get() is not None and context is not None:
+        context.anirecs_query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _stats.get()
+    started = getattr(context, "anirecs_query_started", None)
+    if stats is None or started is None:
+        return
+    stats.queries += 1
+    stats.db_seconds += time.perf_counter() - started
+    stats.statements[_shape(statement)] += 1
+
+
+# On the Engine class, so engines created lazily after this import (and the sync side
+# of async engines) are covered too. Statements outside a request aren't recorded.
+event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def query_pattern_flags(stats: RequestStats):
+    threshold = settings.query_pattern_threshold
+    flags = []
+    if any(count >= threshold for shape, count in stats.statements.items() if not _BATCHED.search(shape)):
+        # The same statement over and over: a loop issuing one query per item.
+        flags.append("repeated_statement")
+    lookups = sum(count for shape, count in stats.statements.items() if _POINT_LOOKUP.match(shape))
+    if lookups >= threshold:
+        # Several separate primary key fetches that a join or a single write could replace.
+        flags.append("point_lookups")
+    return flags
+
+
+_reported = set()
+
+
+def _route(scope):
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE)
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        stats = RequestStats()
+        token = _stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.server_timing:
+                    elapsed = (time.perf_counter() - started) * 1000
+                    timing = f'app;dur={elapsed:.1f}, db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"'
+                    message["headers"] = [*message.get("headers", ()), (b"server-timing", timing.encode("latin-1"))]
+            await send(message)
+
+        requests_in_flight.inc(method=method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            requests_in_flight.dec(method=method)
+            _stats.reset(token)
+            route = _route(scope)
+            request_seconds.observe(time.perf_counter() - started, method=method, route=route, status=status_code)
+            requests_total.inc(method=method, route=route, status=status_code)
+            request_queries.observe(stats.queries, route=route)
+            request_db_seconds.observe(stats.db_seconds, route=route)
+            for pattern in query_pattern_flags(stats):
+                query_patterns.inc(route=route, pattern=pattern)
+                if (route, pattern) not in _reported:
+                    _reported.add((route, pattern))
+                    logger.warning("%s %s: %s (%d queries)", method, route, pattern, stats.queries)
@@ -0,0 +1,63 @@
+import asyncio
+
+from fastapi import Depends
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.util import identity_key
+
+from . import database
+from .pagination import id_in
+
+
+class Loader:
+    # Request-scoped DataLoader. load() calls queue up until the handler next yields to
+    # the event loop, then go out together as one `id = ANY(...)` query per model. Each
+    # (model, id) is looked up at most once per request, misses included.
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self._futures = {}
+        self._queued = {}
+        self._dispatch = None
+
+    def load(self, model, id_):
+        key = (model, id_)
+        future = self._futures.get(key)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = self._futures[key] = loop.create_future()
+        # Rows the session already holds (e.g. current_user's) cost nothing.
+        instance = self.db.sync_session.identity_map.get(identity_key(model, id_))
+        if instance is not None and not inspect(instance).expired_attributes:
+            future.set_result(instance)
+            return future
+        self._queued.setdefault(model, []).append(id_)
+        if self._dispatch is None:
+            self._dispatch = loop.create_task(self._run())
+        return future
+
+    async def load_many(self, model, ids):
+        # In the order asked for, None where there is no such row.
+        return list(await asyncio.gather(*(self.load(model, id_) for id_ in ids)))
+
+    async def _run(self):
+        # One query at a time: the session can't run two at once. Loads queued while a
+        # query is in flight go out with the next one.
+        try:
+            while self._queued:
+                model, ids = self._queued.popitem()
+                try:
+                    rows = (await self.db.execute(select(model).where(id_in(self.db, model.id, ids)))).scalars().all()
+                except Exception as exc:
+                    for id_ in ids:
+                        self._futures.pop((model, id_)).set_exception(exc)
+                    continue
+                found = {row.id: row for row in rows}
+                for id_ in ids:
+                    self._futures[(model, id_)].set_result(found.get(id_))
+        finally:
+            self._dispatch = None
+
+
+def get_loader(db: AsyncSession = Depends(database.get_db)):
+    return Loader(db)
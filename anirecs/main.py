@@ -1,36 +1,102 @@
-from fastapi import FastAPI
-from .database import engine
-from . import models
-from .config import settings
-from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth, genre, user,anime, favourite, preference, genreAnime
+import importlib
+from contextlib import asynccontextmanager
 
-models.Base.metadata.create_all(bind=engine)
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+from fastapi.middleware.cors import CORSMiddleware
+from . import config
 
-app = FastAPI()
+ROUTERS = ("auth", "user", "genre", "anime", "favourite", "preference", "genreAnime", "recommendation", "metrics", "export")
 
 origins = ["*"]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
- 
- 
-app.include_router(auth.router) 
-app.include_router(user.router) 
-app.include_router(genre.router) 
-app.include_router(anime.router) 
-app.include_router(favourite.router) 
-app.include_router(preference.router) 
-app.include_router(genreAnime.router) 
-
-@app.get("/")
-def root():
-    return {"AniRecs": "Anime Recommendation App"}
+
+def include_routers(app: FastAPI):
+    for name in ROUTERS:
+        app.include_router(importlib.import_module(f"{__package__}.routers.{name}").router)
+
+
+def create_app(settings: config.Settings = None):
+    if settings is not None:
+        config.configure(settings)
+    # Imported here, not at module level: these read settings when they are imported,
+    # so they have to come after configure().
+    from . import catalog, database, materialize, popularity, recommender, revocation, utils
+    from .instrumentation import RequestMetricsMiddleware
+    from .pagination import NEXT_CURSOR_HEADER
+
+    lazy_routers = config.settings.lazy_routers
+    if config.settings.response_fast_json:
+        # Imported now, so a missing orjson stops startup instead of failing every list request.
+        try:
+            from . import responses  # noqa: F401
+        except ImportError as exc:
+            raise RuntimeError("response_fast_json needs orjson; install the fast-json extra") from exc
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if lazy_routers:
+            # Defers importing the routers (and numpy/scipy behind them) until the
+            # server starts, instead of when the app object is built.
+            include_routers(app)
+        materialize.start()
+        catalog.start()
+        popularity.start()
+        await revocation.start()
+        try:
+            yield
+        finally:
+            await materialize.stop()
+            await catalog.stop()
+            await popularity.stop()
+            await revocation.stop()
+            await recommender.stop()
+            utils.password_pool.shutdown()
+            await database.dispose()
+
+    app = FastAPI(lifespan=lifespan)
+
+    if config.settings.rate_limit_enabled:
+        from .ratelimit import RateLimitMiddleware
+
+        # Innermost, so 429s still get CORS headers and show up in the request metrics.
+        app.add_middleware(RateLimitMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, "Server-Timing", "Retry-After"],
+    )
+    app.add_middleware(RequestMetricsMiddleware)
+
+    if not lazy_routers:
+        include_routers(app)
+
+    @app.exception_handler(utils.PasswordPoolSaturated)
+    async def password_pool_saturated(request: Request, exc: utils.PasswordPoolSaturated):
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Too many concurrent login requests, please retry"},
+            headers={"Retry-After": str(config.settings.password_retry_after_seconds)},
+        )
+
+    @app.get("/")
+    def root():
+        return {"AniRecs": "Anime Recommendation App"}
+
+    return app
+
+
+def __getattr__(name: str):
+    # `anirecs.main:app` builds the app from the environment the first time it's asked for.
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # poetry run uvicorn anirecs.main:app --reload
+# poetry run uvicorn --factory anirecs.main:create_app
 # pip freeze --exclude-editable > requirements.txt
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import select, union
+from starlette.concurrency import run_in_threadpool
+
+from . import database, models, recommender
+from .bulk import upsert
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def pack(anime_ids, scores):
+    return np.asarray(anime_ids, dtype=np.int32).tobytes(), np.asarray(scores, dtype=np.float32).tobytes()
+
+
+def unpack(row: models.UserRecommendation, limit: int):
+    anime_ids = np.frombuffer(row.anime_ids, dtype=np.int32)[:limit]
+    scores = np.frombuffer(row.scores, dtype=np.float32)[:limit]
+    return anime_ids.tolist(), scores.tolist()
+
+
+def _row(user_id: int, anime_ids, scores):
+    packed_ids, packed_scores = pack(anime_ids, scores)
+    return {"user_id": int(user_id), "anime_ids": packed_ids, "scores": packed_scores, "updated_at": datetime.now(timezone.utc)}
+
+
+def _upsert(dialect: str, rows):
+    return upsert(dialect, models.UserRecommendation, rows, ["user_id"], ["anime_ids", "scores", "updated_at"])
+
+
+class ChangeQueue:
+    # Write handlers record what changed; the refresher turns that into the set of
+    # users whose materialized list is out of date.
+    def __init__(self):
+        self.users = set()
+        self.genres = set()
+        self.animes = set()
+
+    def mark_user(self, user_id: int):
+        if settings.recommendation_materialized:
+            self.users.add(user_id)
+
+    def mark_users(self, user_ids):
+        if settings.recommendation_materialized:
+            self.users.update(user_ids)
+
+    def mark_link(self, genre_id: int = None, anime_id: int = None):
+        if settings.recommendation_materialized:
+            if genre_id is not None:
+                self.genres.add(genre_id)
+            if anime_id is not None:
+                self.animes.add(anime_id)
+
+    def drain(self):
+        users, genres, animes = self.users, self.genres, self.animes
+        self.users, self.genres, self.animes = set(), set(), set()
+        return users, genres, animes
+
+
+changes = ChangeQueue()
+
+
+async def _affected_users(db, genres, animes):
+    # A genre link change moves scores for everyone who prefers the genre or has
+    # favourited an anime in it, and for everyone who favourited the anime.
+    statements = []
+    if genres:
+        statements.append(select(models.Preference.user_id).where(models.Preference.genre_id.in_(genres)))
+        statements.append(
+            select(models.Favourite.user_id)
+            .join(models.GenreAnime, models.GenreAnime.anime_id == models.Favourite.anime_id)
+            .where(models.GenreAnime.genre_id.in_(genres))
+        )
+    if animes:
+        statements.append(select(models.Favourite.user_id).where(models.Favourite.anime_id.in_(animes)))
+    if not statements:
+        return set()
+    return set((await db.execute(union(*statements))).scalars())
+
+
+async def affected_users(db, genres=(), animes=()):
+    # For deletes, whose cascades remove the rows _affected_users joins through: call it
+    # before the delete, in the same transaction, and mark the result after the commit.
+    if not settings.recommendation_materialized:
+        return set()
+    return await _affected_users(db, set(genres), set(animes))
+
+
+async def refresh(db, users, genres, animes):
+    if genres or animes:
+        # The anime x genre matrix itself changed.
+        recommender.invalidate()
+        users = users | await _affected_users(db, genres, animes)
+    if not users:
+        return 0
+    engine = await recommender.get_recommender(fresh=bool(genres or animes))
+    preferences, favourites = {}, {}
+    for user_id, genre_id in (await db.execute(recommender.PREFERENCES.where(models.Preference.user_id.in_(users)))).all():
+        preferences.setdefault(user_id, []).append(genre_id)
+    for user_id, anime_id in (await db.execute(recommender.FAVOURITES.where(models.Favourite.user_id.in_(users)))).all():
+        favourites.setdefault(user_id, []).append(anime_id)
+
+    def score():
+        size = settings.recommendation_materialized_size
+        return [_row(user_id, *engine.recommend_for(preferences.get(user_id, []), favourites.get(user_id, []), size)) for user_id in users]
+
+    rows = await run_in_threadpool(score)
+    # Users deleted since they were marked would violate the foreign key.
+    existing = set((await db.execute(select(models.User.id).where(models.User.id.in_(users)))).scalars())
+    rows = [row for row in rows if row["user_id"] in existing]
+    if rows:
+        await db.execute(_upsert(db.bind.dialect.name, rows))
+        await db.commit()
+    return len(rows)
+
+
+async def _refresh_loop():
+    while True:
+        await asyncio.sleep(settings.recommendation_materialize_interval_seconds)
+        users, genres, animes = changes.drain()
+        if not (users or genres or animes):
+            continue
+        db = database.open_session()
+        try:
+            await refresh(db, users, genres, animes)
+        except Exception:
+            logger.exception("Refreshing materialized recommendations failed")
+            # Put the work back so the next tick retries it.
+            changes.users |= users
+            changes.genres |= genres
+            changes.animes |= animes
+        finally:
+            await db.close()
+
+
+_task = None
+
+
+def start():
+    global _task
+    if settings.recommendation_materialized and _task is None:
+        _task = asyncio.get_running_loop().create_task(_refresh_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+_worker_engine = None
+
+
+def _init_worker(engine):
+    global _worker_engine
+    _worker_engine = engine
+
+
+def _score_batch(user_ids, size: int):
+    return [_row(user_id, *_worker_engine.recommend(int(user_id), size)) for user_id in user_ids]
+
+
+def rebuild(workers: int, batch_size: int):
+    # Full rebuild: one engine build, scoring fanned out to a process pool, and
+    # upserts committed batch by batch as results come back.
+    db = database.SessionLocal()
+    try:
+        links = db.execute(recommender.LINKS).all()
+        preferences = db.execute(recommender.PREFERENCES).all()
+        favourites = db.execute(recommender.FAVOURITES).all()
+        engine = recommender.GenreAffinityRecommender.from_rows(links, preferences, favourites)
+        batches = [engine.user_ids[start:start + batch_size] for start in range(0, len(engine.user_ids), batch_size)]
+        dialect = db.bind.dialect.name
+        written = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(engine,)) as pool:
+            for rows in pool.map(_score_batch, batches, [settings.recommendation_materialized_size] * len(batches)):
+                if rows:
+                    db.execute(_upsert(dialect, rows))
+                    db.commit()
+                    written += len(rows)
+        return written
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m anirecs.materialize")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subcommands.add_parser("rebuild", help="Recompute every user's materialized recommendations")
+    rebuild_parser.add_argument("--workers", type=int, default=None)
+    rebuild_parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    written = rebuild(args.workers, args.batch_size)
+    print(f"Materialized recommendations for {written} users")
+
+
+if __name__ == "__main__":
+    main()
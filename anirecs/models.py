@@ -1,44 +1,97 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
-from sqlalchemy.sql.expression import text 
+from sqlalchemy import BigInteger, Column, Float, Integer, String, Boolean, ForeignKey, Index, LargeBinary
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 from sqlalchemy.sql.sqltypes import TIMESTAMP 
 
 from .database import Base
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_username_trgm", "username", postgresql_using="gin", postgresql_ops={"username": "gin_trgm_ops"}),
+    )
     id = Column(Integer, primary_key=True, nullable=False)
     username = Column(String, nullable=False, unique=True)
     password = Column(String, nullable=False)
     created_at = Column(TIMESTAMP(timezone=True),
-                        nullable=False, server_default=text('now()'))
+                        nullable=False, server_default=func.now())
 
 class Genre(Base):
     __tablename__ = "genres"
+    __table_args__ = (
+        Index("ix_genres_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+    )
     id = Column(Integer, primary_key=True, nullable=False)
     name = Column(String, nullable=False, unique=True)
     created_at = Column(TIMESTAMP(timezone=True),
-                        nullable=False, server_default=text('now()'))
+                        nullable=False, server_default=func.now())
+    # Read side only: links are written through GenreAnime rows. lazy="raise" because a
+    # lazy load can't run under AsyncSession; callers opt in with selectinload().
+    animes = relationship("Anime", secondary="genreAnimes", back_populates="genres", viewonly=True, lazy="raise")
 
 class Anime(Base):
     __tablename__ = "animes"
+    __table_args__ = (
+        Index("ix_animes_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+    )
     id = Column(Integer, primary_key=True, nullable=False)
     title = Column(String, nullable=False)
     description = Column(String, nullable=False)
     rating = Column(Integer, nullable=False)
     created_at = Column(TIMESTAMP(timezone=True),
-                        nullable=False, server_default=text('now()'))
+                        nullable=False, server_default=func.now())
+    genres = relationship("Genre", secondary="genreAnimes", back_populates="animes", viewonly=True, lazy="raise", order_by="Genre.id")
 
 class Favourite(Base):
     __tablename__ = "favourites"
+    __table_args__ = (
+        # The composite primary key only serves lookups by its leading column.
+        Index("ix_favourites_anime_id", "anime_id"),
+    )
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     anime_id = Column(Integer, ForeignKey("animes.id", ondelete="CASCADE"), primary_key=True)
 
 class Preference(Base):
     __tablename__ = "prefereces"
+    __table_args__ = (
+        Index("ix_prefereces_genre_id", "genre_id"),
+    )
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     genre_id = Column(Integer, ForeignKey("genres.id", ondelete="CASCADE"), primary_key=True)
 
 class GenreAnime(Base):
     __tablename__ = "genreAnimes"
+    __table_args__ = (
+        Index("ix_genreAnimes_anime_id", "anime_id"),
+    )
     genre_id = Column(Integer, ForeignKey("genres.id", ondelete="CASCADE"), primary_key=True)
     anime_id = Column(Integer, ForeignKey("animes.id", ondelete="CASCADE"), primary_key=True)
+
+class UserRecommendation(Base):
+    __tablename__ = "user_recommendations"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    anime_ids = Column(LargeBinary, nullable=False)
+    scores = Column(LargeBinary, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True),
+                        nullable=False, server_default=func.now())
+
+class AnimeStat(Base):
+    __tablename__ = "anime_stats"
+    __table_args__ = (
+        # Backward scans of these serve /animes/popular and /animes/trending top-k reads.
+        Index("ix_anime_stats_favourites", "favourites", "anime_id"),
+        Index("ix_anime_stats_trending", "trending", "anime_id"),
+    )
+    anime_id = Column(Integer, ForeignKey("animes.id", ondelete="CASCADE"), primary_key=True)
+    favourites = Column(Integer, nullable=False, server_default="0")
+    views = Column(BigInteger, nullable=False, server_default="0")
+    # log2 of the decayed trending score plus the time in half-lives since the epoch,
+    # so the order never changes as time passes; NULL once the score has decayed away.
+    trending = Column(Float, nullable=True)
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    jti = Column(String, primary_key=True)
+    # Workers sync by revoked_at; rows are pruned once expires_at has passed.
+    revoked_at = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
@@ -0,0 +1,149 @@
+import argparse
+import os
+import threading
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config import settings
+
+BUILD_BLOCK_SIZE = 2048
+
+
+class NeighborIndex:
+    # Top-K cosine neighbours per anime, stored as fixed-width arrays padded with -1.
+    def __init__(self, anime_ids, neighbors, scores):
+        self.anime_ids = anime_ids
+        self.neighbors = neighbors
+        self.scores = scores
+
+    @classmethod
+    def build(cls, db: Session, top_k: int):
+        # Offline build; runs on a blocking Session outside the event loop.
+        favourites = db.execute(select(models.Favourite.user_id, models.Favourite.anime_id)).all()
+        return cls.from_favourites(favourites, top_k)
+
+    @classmethod
+    def from_favourites(cls, favourites, top_k: int):
+        pairs = np.asarray(favourites, dtype=np.int64).reshape(-1, 2)
+        user_ids, user_idx = np.unique(pairs[:, 0], return_inverse=True)
+        anime_ids, anime_idx = np.unique(pairs[:, 1], return_inverse=True)
+        n_animes = len(anime_ids)
+
+        user_animes = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.float32), (user_idx, anime_idx)),
+            shape=(len(user_ids), n_animes),
+        )
+        anime_users = user_animes.T.tocsr()
+        inverse_norms = 1.0 / np.sqrt(np.maximum(np.diff(anime_users.indptr), 1)).astype(np.float32)
+
+        neighbors = np.full((n_animes, top_k), -1, dtype=np.int32)
+        scores = np.zeros((n_animes, top_k), dtype=np.float32)
+        # Co-occurrence is computed a block of rows at a time so the dense-ish
+        # anime x anime product never has to exist in full.
+        for start in range(0, n_animes, BUILD_BLOCK_SIZE):
+            stop = min(start + BUILD_BLOCK_SIZE, n_animes)
+            block = (anime_users[start:stop] @ user_animes).tocsr()
+            block.setdiag(0, k=start)
+            block.eliminate_zeros()
+            for row in range(stop - start):
+                lo, hi = block.indptr[row], block.indptr[row + 1]
+                if lo == hi:
+                    continue
+                columns = block.indices[lo:hi]
+                similarity = block.data[lo:hi] * inverse_norms[start + row] * inverse_norms[columns]
+                if len(similarity) > top_k:
+                    keep = np.argpartition(-similarity, top_k - 1)[:top_k]
+                    columns, similarity = columns[keep], similarity[keep]
+                order = np.argsort(-similarity, kind="stable")
+                neighbors[start + row, :len(order)] = anime_ids[columns[order]]
+                scores[start + row, :len(order)] = similarity[order]
+        return cls(anime_ids.astype(np.int32), neighbors, scores)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(data["anime_ids"], data["neighbors"], data["scores"])
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, anime_ids=self.anime_ids, neighbors=self.neighbors, scores=self.scores)
+        os.replace(tmp_path, path)
+
+    def recommend(self, favourite_ids, limit: int):
+        favourite_ids = np.asarray(favourite_ids, dtype=np.int32)
+        if not len(self.anime_ids) or not len(favourite_ids):
+            return [], []
+        positions = np.minimum(np.searchsorted(self.anime_ids, favourite_ids), len(self.anime_ids) - 1)
+        positions = positions[self.anime_ids[positions] == favourite_ids]
+        if not len(positions):
+            return [], []
+
+        candidates = self.neighbors[positions].ravel()
+        weights = self.scores[positions].ravel()
+        valid = (candidates >= 0) & ~np.isin(candidates, favourite_ids)
+        if not valid.any():
+            return [], []
+        candidate_ids, inverse = np.unique(candidates[valid], return_inverse=True)
+        totals = np.bincount(inverse, weights=weights[valid])
+
+        limit = min(limit, len(totals))
+        top = np.argpartition(-totals, limit - 1)[:limit]
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return candidate_ids[top].tolist(), totals[top].tolist()
+
+
+_index = None
+_index_mtime = None
+_lock = threading.Lock()
+
+
+async def get_index():
+    path = settings.neighbor_index_path
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+    if _index is not None and _index_mtime == mtime:
+        return _index
+    # Reading the arrays blocks, so it runs in a worker thread rather than on the event loop.
+    return await run_in_threadpool(_load, path, mtime)
+
+
+def _load(path: str, mtime: float):
+    global _index, _index_mtime
+    with _lock:
+        if _index is None or _index_mtime != mtime:
+            _index = NeighborIndex.load(path)
+            _index_mtime = mtime
+        return _index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m anirecs.neighbors")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="Build the item-item neighbour index from the favourites table")
+    build.add_argument("--top-k", type=int, default=settings.neighbor_top_k)
+    build.add_argument("--output", default=settings.neighbor_index_path)
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        index = NeighborIndex.build(db, args.top_k)
+    finally:
+        db.close()
+    index.save(args.output)
+    print(f"Wrote neighbours for {len(index.anime_ids)} animes to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
+import uuid
 from jose import JWTError, jwt
 from . import schemas, database, models
+from .revocation import revoked
 from datetime import datetime, timedelta, timezone
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
@@ -12,20 +14,35 @@ SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 REFRESH_TOKEN_EXPIRE_DAYS = settings.refresh_token_expire_days
+# Only tokens with this "type" claim are accepted by /refresh, and they aren't accepted anywhere else.
+REFRESH_TOKEN_TYPE = "refresh"
 
 
-def create_access_token(data: dict):
+def user_claims(user: models.User):
+    # Enough to rebuild a schemas.UserOut without a database lookup.
+    return {"user_id": user.id, "username": user.username, "created_at": user.created_at.isoformat()}
+
+
+def new_token_id():
+    return uuid.uuid4().hex
+
+
+def create_access_token(data: dict, session_id: str = None):
+    # session_id is the jti of the refresh token it was issued under; revoking that
+    # ends every access token of the session.
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": new_token_id()})
+    if session_id is not None:
+        to_encode["sid"] = session_id
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def create_refresh_token(data: dict):
+def create_refresh_token(data: dict, token_id: str = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": token_id or new_token_id(), "type": REFRESH_TOKEN_TYPE})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -39,14 +56,7 @@ def verify_token(token: str, credentials_exception):
         token_data = payload
     except JWTError:
         raise credentials_exception
+    # In memory, no database: the token's own id, and the session it belongs to.
+    if settings.token_revocation and revoked.is_revoked(payload.get("jti"), payload.get("sid")):
+        raise credentials_exception
     return token_data
-
-
-
-
-
-
-
-
-
-
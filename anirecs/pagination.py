@@ -0,0 +1,141 @@
+import base64
+import binascii
+import json
+from typing import Optional
+
+from fastapi import HTTPException, Query, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import Integer, any_, literal, select, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    def __init__(
+        self,
+        limit: int = Query(settings.page_size_default, ge=1, le=settings.page_size_max),
+        after: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+        fields: Optional[str] = Query(None, description="Comma separated list of fields to return"),
+    ):
+        self.limit = limit
+        self.after = after
+        self.fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+
+def parse_ids(ids: str):
+    # "3,1,3" -> [3, 1, 3]: order and repeats are kept so the response lines up with the request.
+    try:
+        values = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids must be a comma separated list of integers")
+    return check_ids(values)
+
+
+def check_ids(ids):
+    if len(ids) > settings.batch_get_max_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {settings.batch_get_max_ids} ids per request")
+    return ids
+
+
+def id_in(db: AsyncSession, column, ids):
+    # PostgreSQL gets a single array parameter, `id = ANY(:ids)`, so the statement text (and
+    # the prepared statement cached for it) is the same however many ids are asked for.
+    if db.bind.dialect.name == "postgresql":
+        return column == any_(literal(list(ids), ARRAY(Integer)))
+    return column.in_(ids)
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        values = None
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(value, int) for value in values):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def schema_fields(schema):
+    fields = getattr(schema, "model_fields", None)
+    if fields is None:
+        fields = schema.__fields__
+    return list(fields)
+
+
+def _projection(model, page: PageParams, schema):
+    available = [name for name in schema_fields(schema) if hasattr(model, name)]
+    if page.fields is None:
+        return available
+    unknown = [name for name in page.fields if name not in available]
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown fields: {', '.join(unknown)}")
+    return [name for name in available if name in page.fields]
+
+
+def _render(items, page: PageParams, response: Response, next_cursor=None):
+    if settings.response_fast_json:
+        from .responses import ORJSONResponse
+
+        # Rows come straight from our own columns, so the response_model pass adds nothing.
+        return ORJSONResponse(items, headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None)
+    if page.fields is not None:
+        # Projected rows don't satisfy the endpoint's response_model, so they bypass it.
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        return JSONResponse(jsonable_encoder(items), headers=headers)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return items
+
+
+async def paginate(db: AsyncSession, model, page: PageParams, response: Response, schema, keys=None, where=(), joins=(), expand=None):
+    keys = list(keys) if keys is not None else [model.id]
+    returned = _projection(model, page, schema)
+    key_names = [key.key for key in keys]
+    selected = returned + [name for name in key_names if name not in returned]
+
+    statement = select(*[getattr(model, name) for name in selected])
+    for target in joins:
+        statement = statement.join(target)
+    statement = statement.where(*where)
+    if page.after is not None:
+        values = decode_cursor(page.after, len(keys))
+        statement = statement.where(keys[0] > values[0] if len(keys) == 1 else tuple_(*keys) > tuple_(*values))
+    statement = statement.order_by(*keys).limit(page.limit + 1)
+
+    rows = (await db.execute(statement)).all()
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(last[name] for name in key_names)
+    # selected starts with the returned columns, so each row zips straight into a dict.
+    items = [dict(zip(returned, row)) for row in rows]
+    if expand is not None:
+        await expand(db, items)
+    return _render(items, page, response, next_cursor)
+
+
+async def fetch_by_ids(db: AsyncSession, model, ids, page: PageParams, response: Response, schema, expand=None):
+    # Rows for ids that were already ranked elsewhere (e.g. search, batch gets), in the given order.
+    returned = _projection(model, page, schema)
+    if not ids:
+        return _render([], page, response)
+    selected = returned + (["id"] if "id" not in returned else [])
+    id_position = selected.index("id")
+    unique_ids = list(dict.fromkeys(ids))
+    rows = (await db.execute(select(*[getattr(model, name) for name in selected]).where(id_in(db, model.id, unique_ids)))).all()
+    by_id = {row[id_position]: dict(zip(returned, row)) for row in rows}
+    items = [by_id[id_] for id_ in ids if id_ in by_id]
+    if expand is not None:
+        await expand(db, items)
+    return _render(items, page, response)
@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import logging
+import math
+import time
+from collections import Counter as Tally
+
+from sqlalchemy import bindparam, func, select, update
+
+from . import database, models
+from .bulk import insert_ignore, upsert
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Decayed scores below this drop out of the trending ranking.
+TRENDING_FLOOR = 1e-3
+ANIME_COLUMNS = [models.Anime.id, models.Anime.title, models.Anime.description, models.Anime.rating, models.Anime.created_at]
+
+
+def _now():
+    # Time in trending half-lives since the epoch.
+    return time.time() / (settings.trending_half_life_hours * 3600)
+
+
+def decayed(key, now: float):
+    return 0.0 if key is None else 2.0 ** (key - now)
+
+
+def trending_key(score: float, now: float):
+    # Forward decay in log space: ranking by the key ranks by the decayed score at any
+    # later time, and the value stays small however long the service runs.
+    return math.log2(score) + now if score > TRENDING_FLOOR else None
+
+
+class Counters:
+    # Handlers count into memory; the flusher turns that into one batched write per
+    # interval, instead of a write (or a COUNT over favourites) per request.
+    def __init__(self):
+        self.favourites = Tally()
+        self.views = Tally()
+        self.trending = Tally()
+
+    def favourited(self, anime_id: int, delta: int = 1):
+        if settings.popularity_enabled:
+            self.favourites[anime_id] += delta
+            self.trending[anime_id] += delta * settings.trending_favourite_weight
+
+    def viewed(self, anime_id: int):
+        if settings.popularity_enabled:
+            self.views[anime_id] += 1
+            self.trending[anime_id] += settings.trending_view_weight
+
+    def drain(self):
+        drained = self.favourites, self.views, self.trending
+        self.favourites, self.views, self.trending = Tally(), Tally(), Tally()
+        return drained
+
+    def restore(self, favourites, views, trending):
+        self.favourites.update(favourites)
+        self.views.update(views)
+        self.trending.update(trending)
+
+
+counters = Counters()
+
+_update = (
+    update(models.AnimeStat.__table__)
+    .where(models.AnimeStat.anime_id == bindparam("b_anime_id"))
+    .values(favourites=bindparam("b_favourites"), views=bindparam("b_views"), trending=bindparam("b_trending"))
+)
+
+
+async def flush(db, favourites, views, trending):
+    anime_ids = sorted(set(favourites) | set(views) | set(trending))
+    if not anime_ids:
+        return 0
+    # Rows for animes deleted since they were counted are skipped by the join.
+    await db.execute(insert_ignore(db, models.AnimeStat).from_select(["anime_id"], select(models.Anime.id).where(models.Anime.id.in_(anime_ids))))
+    # Row locks, taken in id order, make flushes from other workers queue up instead of
+    # overwriting each other's increments.
+    statement = select(models.AnimeStat.anime_id, models.AnimeStat.favourites, models.AnimeStat.views, models.AnimeStat.trending).where(models.AnimeStat.anime_id.in_(anime_ids)).order_by(models.AnimeStat.anime_id).with_for_update()
+    now = _now()
+    params = [
+        {
+            "b_anime_id": anime_id,
+            "b_favourites": max(0, count + favourites[anime_id]),
+            "b_views": seen + views[anime_id],
+            "b_trending": trending_key(decayed(key, now) + trending[anime_id], now),
+        }
+        for anime_id, count, seen, key in (await db.execute(statement)).all()
+    ]
+    if params:
+        await db.execute(_update, params)
+    await db.commit()
+    return len(params)
+
+
+class Leaderboard:
+    # The top popularity_top_size animes by favourites and by trending key, re-read
+    # after every flush. Requests slice the cached lists: O(k), no query.
+    def __init__(self):
+        self.popular = None
+        self.trending = None
+
+    async def refresh(self, db):
+        size = settings.popularity_top_size
+        popular = select(*ANIME_COLUMNS, models.AnimeStat.favourites, models.AnimeStat.views).join(models.AnimeStat, models.AnimeStat.anime_id == models.Anime.id).where(models.AnimeStat.favourites > 0).order_by(models.AnimeStat.favourites.desc(), models.AnimeStat.anime_id.desc()).limit(size)
+        trending = select(*ANIME_COLUMNS, models.AnimeStat.trending).join(models.AnimeStat, models.AnimeStat.anime_id == models.Anime.id).where(models.AnimeStat.trending.isnot(None)).order_by(models.AnimeStat.trending.desc(), models.AnimeStat.anime_id.desc()).limit(size)
+        self.popular = [dict(row._mapping) for row in (await db.execute(popular)).all()]
+        self.trending = [dict(row._mapping) for row in (await db.execute(trending)).all()]
+
+    def top_popular(self, limit: int):
+        return self.popular[:limit]
+
+    def top_trending(self, limit: int):
+        now = _now()
+        return [{**item, "score": decayed(item["trending"], now)} for item in self.trending[:limit]]
+
+
+leaderboard = Leaderboard()
+
+
+async def _flush_and_refresh():
+    drained = counters.drain()
+    db = database.open_session()
+    try:
+        if any(drained):
+            try:
+                await flush(db, *drained)
+            except Exception:
+                # Put the counts back so the next tick retries them.
+                counters.restore(*drained)
+                raise
+        await leaderboard.refresh(db)
+    finally:
+        await db.close()
+
+
+async def _flush_loop():
+    while True:
+        try:
+            await _flush_and_refresh()
+        except Exception:
+            logger.exception("Flushing popularity counters failed")
+        await asyncio.sleep(settings.popularity_flush_seconds)
+
+
+_task = None
+
+
+def start():
+    global _task
+    if settings.popularity_enabled and _task is None:
+        _task = asyncio.get_running_loop().create_task(_flush_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+        # Don't lose the last interval's counts on shutdown.
+        try:
+            await _flush_and_refresh()
+        except Exception:
+            logger.exception("Flushing popularity counters on shutdown failed")
+
+
+def reconcile(db):
+    # Favourite counts drift when favourites go away without passing through the
+    # handlers, e.g. cascading from a deleted user; this recounts them.
+    counts = db.execute(select(models.Favourite.anime_id, func.count()).group_by(models.Favourite.anime_id)).all()
+    db.execute(update(models.AnimeStat).values(favourites=0))
+    rows = [{"anime_id": anime_id, "favourites": count} for anime_id, count in counts]
+    for start_ in range(0, len(rows), settings.bulk_max_items):
+        db.execute(upsert(db.bind.dialect.name, models.AnimeStat, rows[start_:start_ + settings.bulk_max_items], ["anime_id"], ["favourites"]))
+    db.commit()
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m anirecs.popularity")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("reconcile", help="Recount favourites per anime from the favourites table")
+    parser.parse_args(argv)
+
+    db = database.SessionLocal()
+    try:
+        animes = reconcile(db)
+    finally:
+        db.close()
+    print(f"Recounted favourites for {animes} animes")
+
+
+if __name__ == "__main__":
+    main()
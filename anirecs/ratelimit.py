@@ -0,0 +1,185 @@
+import logging
+import math
+import re
+import time
+
+from jose import JWTError
+from starlette.routing import compile_path
+
+from . import metrics, oauth2
+from .cache import TTLCache
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+rate_limited = metrics.Counter("anirecs_rate_limited_total", "Requests rejected by the rate limiter", ["rule"])
+rate_limit_errors = metrics.Counter("anirecs_rate_limit_backend_errors_total", "Rate limit checks that failed open because the backend errored")
+
+UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+UNLIMITED = "unlimited"
+DEFAULT_RULE = "*"
+REJECTED_BODY = b'{"detail":"Too many requests, please retry later"}'
+_LIMIT = re.compile(r"^\s*(\d+)\s*/\s*(second|minute|hour|day)\s*$")
+
+
+class Limit:
+    # `count` requests per `period`, in bursts of up to `count`: a token bucket,
+    # tracked GCRA style as the time the bucket will next be full.
+    def __init__(self, count: int, period: float):
+        self.count = count
+        self.interval = period / count
+        self.tolerance = self.interval * count
+
+    @classmethod
+    def parse(cls, text: str):
+        match = _LIMIT.match(text)
+        if not match or not int(match.group(1)):
+            raise ValueError(f"Invalid rate limit {text!r}; expected e.g. '10/minute' or '{UNLIMITED}'")
+        return cls(int(match.group(1)), UNITS[match.group(2)])
+
+
+class MemoryLimiter:
+    # Per-process state: N workers allow up to N times the configured rate.
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._tat = {}
+
+    async def hit(self, key: str, limit: Limit):
+        now = time.monotonic()
+        tat = max(self._tat.get(key, now), now)
+        allow_at = tat + limit.interval - limit.tolerance
+        if now < allow_at:
+            return False, allow_at - now
+        if len(self._tat) >= self.max_keys and key not in self._tat:
+            self._evict(now)
+        self._tat[key] = tat + limit.interval
+        return True, 0.0
+
+    def _evict(self, now: float):
+        # A bucket whose TAT has passed is full again, the same as no entry at all.
+        self._tat = {key: tat for key, tat in self._tat.items() if tat > now}
+        if len(self._tat) >= self.max_keys:
+            # Still full of live buckets: forget the oldest half rather than grow.
+            keys = list(self._tat)
+            self._tat = {key: self._tat[key] for key in keys[len(keys) // 2:]}
+
+
+# KEYS[1]: bucket; ARGV: interval and tolerance in ms. Uses the server clock so
+# workers with skewed clocks still agree. Returns {allowed, retry_after_ms}.
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local allow_at = tat + interval - tolerance
+if now < allow_at then return {0, allow_at - now} end
+redis.call('SET', KEYS[1], tat + interval, 'PX', math.ceil(tat + interval - now))
+return {1, 0}
+"""
+
+
+class RedisLimiter:
+    # Shared across workers and hosts; one round trip per request.
+    def __init__(self, client, prefix: str = "anirecs:ratelimit:"):
+        self.prefix = prefix
+        self._script = client.register_script(GCRA_SCRIPT)
+
+    async def hit(self, key: str, limit: Limit):
+        allowed, retry_after_ms = await self._script(keys=[self.prefix + key], args=[limit.interval * 1000, limit.tolerance * 1000])
+        return bool(allowed), int(retry_after_ms) / 1000
+
+
+def create_limiter(kind: str, redis_url: str, max_keys: int):
+    if kind == "redis":
+        from redis import asyncio as redis_asyncio
+
+        return RedisLimiter(redis_asyncio.from_url(redis_url))
+    return MemoryLimiter(max_keys)
+
+
+def compile_rules(rules: dict):
+    # "METHOD /path/{param}" -> (method, path regex, name, Limit or None for unlimited).
+    compiled = []
+    for name, text in rules.items():
+        if name == DEFAULT_RULE:
+            continue
+        method, path = name.split(" ", 1)
+        limit = None if text == UNLIMITED else Limit.parse(text)
+        compiled.append((method.upper(), compile_path(path.strip())[0], name, limit))
+    return compiled
+
+
+IDENTITY_CACHE_SIZE = 10000
+IDENTITY_CACHE_SECONDS = 60
+
+_identities = TTLCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_SECONDS)
+
+
+def identity(scope):
+    # The JWT's user_id when the bearer token verifies, otherwise the client address.
+    # Verified tokens are remembered, so a caller's token is decoded about once a minute.
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                user_id = _identities.get(token)
+                if user_id is None:
+                    try:
+                        user_id = oauth2.verify_token(token, JWTError()).get("user_id")
+                    except JWTError:
+                        user_id = None
+                    if user_id is None:
+                        break
+                    _identities.set(token, user_id)
+                return f"user:{user_id}"
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limiter=None, rules: dict = None, default: str = None):
+        self.app = app
+        self.limiter = limiter or create_limiter(settings.rate_limit_backend, settings.cache_redis_url, settings.rate_limit_max_keys)
+        rules = settings.rate_limit_rules if rules is None else rules
+        self.rules = compile_rules(rules)
+        default = rules.get(DEFAULT_RULE, settings.rate_limit_default) if default is None else default
+        self.default = None if default == UNLIMITED else Limit.parse(default)
+
+    def _rule(self, method: str, path: str):
+        for rule_method, regex, name, limit in self.rules:
+            if rule_method == method and regex.match(path):
+                return name, limit
+        return DEFAULT_RULE, self.default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name, limit = self._rule(scope["method"], scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            allowed, retry_after = await self.limiter.hit(f"{name}:{identity(scope)}", limit)
+        except Exception:
+            # A broken shared store shouldn't take the API down with it.
+            rate_limit_errors.inc()
+            logger.exception("Rate limit check failed; allowing the request")
+            allowed = True
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+        rate_limited.inc(rule=name)
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(REJECTED_BODY)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": REJECTED_BODY})
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from . import database, models
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+PREFERENCE_WEIGHT = 1.0
+FAVOURITE_WEIGHT = 0.5
+
+LINKS = select(models.GenreAnime.anime_id, models.GenreAnime.genre_id)
+PREFERENCES = select(models.Preference.user_id, models.Preference.genre_id)
+FAVOURITES = select(models.Favourite.user_id, models.Favourite.anime_id)
+
+
+def _index(ids):
+    # Sorted unique ids plus the dense position of every input id.
+    return np.unique(np.asarray(ids, dtype=np.int64), return_inverse=True)
+
+
+def _positions(sorted_ids, values):
+    # Dense positions of values in sorted_ids and a mask of the ones that are present.
+    positions = np.searchsorted(sorted_ids, values)
+    clipped = np.minimum(positions, max(len(sorted_ids) - 1, 0))
+    found = (positions < len(sorted_ids)) & (sorted_ids[clipped] == values) if len(sorted_ids) else np.zeros(len(values), dtype=bool)
+    return clipped, found
+
+
+def _l2_normalize_rows(matrix: sparse.csr_matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+
+class GenreAffinityRecommender:
+    def __init__(self, anime_ids, genre_ids, user_ids, anime_genres, user_genres, user_favourites):
+        self.anime_ids = anime_ids
+        self.genre_ids = genre_ids
+        self.user_ids = user_ids
+        self.anime_genres = _l2_normalize_rows(anime_genres).tocsr().astype(np.float32)
+        self.user_genres = user_genres.tocsr().astype(np.float32)
+        self.user_favourites = user_favourites.tocsr()
+        self.built_at = time.monotonic()
+
+    @classmethod
+    async def build(cls, db: AsyncSession):
+        links = (await db.execute(LINKS)).all()
+        preferences = (await db.execute(PREFERENCES)).all()
+        favourites = (await db.execute(FAVOURITES)).all()
+        return await run_in_threadpool(cls.from_rows, links, preferences, favourites)
+
+    @classmethod
+    def from_rows(cls, links, preferences, favourites):
+        link_animes, link_genres = _columns(links)
+        pref_users, pref_genres = _columns(preferences)
+        fav_users, fav_animes = _columns(favourites)
+
+        anime_ids, link_anime_idx = _index(link_animes)
+        genre_ids, genre_idx = _index(np.concatenate([link_genres, pref_genres]))
+        user_ids, user_idx = _index(np.concatenate([pref_users, fav_users]))
+
+        n_animes, n_genres, n_users = len(anime_ids), len(genre_ids), len(user_ids)
+        anime_genres = sparse.csr_matrix(
+            (np.ones(len(link_animes), dtype=np.float32), (link_anime_idx, genre_idx[:len(link_genres)])),
+            shape=(n_animes, n_genres),
+        )
+        preference_matrix = sparse.csr_matrix(
+            (np.ones(len(pref_users), dtype=np.float32), (user_idx[:len(pref_users)], genre_idx[len(link_genres):])),
+            shape=(n_users, n_genres),
+        )
+
+        # Favourites on animes that have no genre links can't contribute to a genre profile.
+        fav_anime_idx, known = _positions(anime_ids, fav_animes)
+        user_favourites = sparse.csr_matrix(
+            (np.ones(int(known.sum()), dtype=np.float32), (user_idx[len(pref_users):][known], fav_anime_idx[known])),
+            shape=(n_users, n_animes),
+        )
+
+        user_genres = PREFERENCE_WEIGHT * preference_matrix + FAVOURITE_WEIGHT * (user_favourites @ anime_genres)
+        user_genres = _l2_normalize_rows(user_genres.tocsr())
+        return cls(anime_ids, genre_ids, user_ids, anime_genres, user_genres, user_favourites)
+
+    def is_stale(self):
+        return time.monotonic() - self.built_at > settings.recommendation_refresh_seconds
+
+    def recommend(self, user_id: int, limit: int):
+        positions, found = _positions(self.user_ids, np.array([user_id], dtype=np.int64))
+        if not found[0] or not len(self.anime_ids):
+            return [], []
+        position = positions[0]
+        profile = self.user_genres.getrow(position)
+        if not profile.nnz:
+            return [], []
+
+        favourites = self.user_favourites.indices[self.user_favourites.indptr[position]:self.user_favourites.indptr[position + 1]]
+        return self._top(self.anime_genres @ profile.toarray().ravel(), favourites, limit)
+
+    def recommend_for(self, genre_ids, favourite_ids, limit: int):
+        # Scores a profile built from fresh preference/favourite rows instead of the
+        # user x genre matrix captured at build time.
+        profile = np.zeros(len(self.genre_ids), dtype=np.float32)
+        genre_positions, genre_found = _positions(self.genre_ids, np.asarray(genre_ids, dtype=np.int64))
+        profile[genre_positions[genre_found]] += PREFERENCE_WEIGHT
+        anime_positions, anime_found = _positions(self.anime_ids, np.asarray(favourite_ids, dtype=np.int64))
+        favourites = anime_positions[anime_found]
+        if len(favourites):
+            profile += FAVOURITE_WEIGHT * np.asarray((self.anime_genres[favourites] > 0).sum(axis=0), dtype=np.float32).ravel()
+        norm = np.linalg.norm(profile)
+        if not norm or not len(self.anime_ids):
+            return [], []
+        return self._top(self.anime_genres @ (profile / norm), favourites, limit)
+
+    def _top(self, scores, favourites, limit: int):
+        scores[favourites] = 0.0
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = top[scores[top] > 0]
+        return self.anime_ids[top].tolist(), scores[top].tolist()
+
+
+def _columns(rows):
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    array = np.asarray(rows, dtype=np.int64)
+    return array[:, 0], array[:, 1]
+
+
+_recommender = None
+# Bumped by invalidate(); an engine built before the last bump is out of date.
+_generation = 0
+_built_generation = -1
+_task = None
+_task_generation = None
+
+
+async def _rebuild(generation: int):
+    global _recommender, _built_generation
+    db = database.open_session()
+    try:
+        engine = await GenreAffinityRecommender.build(db)
+    finally:
+        await db.close()
+    # A build that started before a later one finished mustn't replace it.
+    if generation >= _built_generation:
+        _recommender, _built_generation = engine, generation
+
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Rebuilding the recommender failed", exc_info=task.exception())
+
+
+def _start_rebuild():
+    # At most one build per generation runs at a time; callers share it.
+    global _task, _task_generation
+    if _task is None or _task.done() or _task_generation != _generation:
+        _task_generation = _generation
+        _task = asyncio.get_running_loop().create_task(_rebuild(_generation))
+        _task.add_done_callback(_log_failure)
+    return _task
+
+
+async def get_recommender(fresh: bool = False):
+    # Serves the engine it has while a background task rebuilds a stale one. Waits only
+    # when there is none yet, or when fresh asks for one built since the last invalidate().
+    while _recommender is None or (fresh and _built_generation != _generation):
+        await asyncio.shield(_start_rebuild())
+    if _built_generation != _generation or _recommender.is_stale():
+        _start_rebuild()
+    return _recommender
+
+
+def invalidate():
+    global _generation
+    _generation += 1
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _task = None
@@ -0,0 +1,67 @@
+import hashlib
+import json
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+
+from .cache import create_backend
+from .config import settings
+from .pagination import NEXT_CURSOR_HEADER, schema_fields
+
+CACHED_HEADERS = (NEXT_CURSOR_HEADER.lower(),)
+
+
+def as_dict(obj, schema):
+    return {name: getattr(obj, name) for name in schema_fields(schema)}
+
+
+def _etag(body: bytes):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _encode(result, response: Response):
+    if isinstance(result, Response):
+        body, headers = result.body, result.headers
+    else:
+        body, headers = json.dumps(jsonable_encoder(result), separators=(",", ":")).encode(), response.headers
+    kept = {name: value for name, value in headers.items() if name.lower() in CACHED_HEADERS}
+    return json.dumps(kept).encode() + b"\n" + body
+
+
+class ResponseCache:
+    # Cached JSON bodies live under "<namespace>:<version>:<suffix>"; invalidating a
+    # namespace bumps its version so every entry under it is orphaned at once.
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+    async def _key(self, namespace: str, suffix: str):
+        version = await self.backend.get_counter(f"version:{namespace}")
+        return f"{namespace}:{version}:{suffix}"
+
+    async def respond(self, request: Request, namespace: str, suffix: str, load):
+        # load(response) returns the endpoint's normal result; HTTP errors it raises aren't cached.
+        key = await self._key(namespace, suffix)
+        entry = await self.backend.get(key)
+        if entry is None:
+            response = Response()
+            entry = _encode(await load(response), response)
+            await self.backend.set(key, entry, self.ttl)
+        raw_headers, body = entry.split(b"\n", 1)
+        headers = json.loads(raw_headers)
+        headers["ETag"] = _etag(body)
+        headers["Cache-Control"] = "private, no-cache"
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
+
+    async def invalidate(self, *namespaces: str):
+        for namespace in namespaces:
+            await self.backend.incr(f"version:{namespace}")
+
+
+response_cache = ResponseCache(
+    create_backend(settings.cache_backend, settings.cache_redis_url, settings.cache_max_entries, settings.cache_ttl_seconds),
+    settings.cache_ttl_seconds,
+)
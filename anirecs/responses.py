@@ -0,0 +1,11 @@
+import orjson
+from fastapi.responses import JSONResponse
+
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONResponse(JSONResponse):
+    # Encodes plain dicts/lists of column values as-is: no jsonable_encoder walk and no
+    # pydantic validation. UTC datetimes get a trailing Z, like pydantic's own output.
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=OPTIONS)
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+
+from . import database, models
+from .bulk import insert_ignore
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rows are re-read for this long after they were written, so a revocation committed
+# late, or stamped by a worker whose clock runs behind, is still picked up.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    # Fixed-size bitmap: "no" is certain, "maybe" is wrong about error_rate of the time.
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(-(-self.size // 8))
+
+    @staticmethod
+    def _hashes(key: str):
+        # Double hashing over Python's own string hash, which the string caches. It is
+        # randomised per process, which is fine for a filter that never leaves one.
+        value = hash(key) & 0xFFFFFFFFFFFFFFFF
+        return value & 0xFFFFFFFF, (value >> 32) | 1
+
+    def add(self, key: str):
+        first, second = self._hashes(key)
+        for i in range(self.hashes):
+            position = (first + i * second) % self.size
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str):
+        # Absent keys usually fail on the first bit or two, so stop at the first miss.
+        first, second = self._hashes(key)
+        bits, size = self.bits, self.size
+        for i in range(self.hashes):
+            position = (first + i * second) % size
+            if not bits[position >> 3] >> (position & 7) & 1:
+                return False
+        return True
+
+
+class RevocationList:
+    # Every unexpired revoked id, per worker. The Bloom filter answers the usual "not
+    # revoked" from a fixed-size bitmap; the exact map settles its maybes, so a false
+    # positive never rejects a good token. Neither needs the database.
+    def __init__(self):
+        self.expires = {}
+        self.bloom = self._bloom(0)
+
+    def _bloom(self, size: int):
+        return BloomFilter(max(settings.token_revocation_bloom_capacity, 2 * size), settings.token_revocation_bloom_error_rate)
+
+    def add(self, jti: str, expires_at: float):
+        if jti in self.expires:
+            return
+        self.expires[jti] = expires_at
+        self.bloom.add(jti)
+        if len(self.expires) > self.bloom.capacity:
+            # Past capacity the false positive rate climbs; start over at twice the size.
+            self._rebuild()
+
+    def is_revoked(self, jti: str, session_id: str = None):
+        for key in (jti, session_id):
+            if key is not None and key in self.bloom and key in self.expires:
+                return True
+        return False
+
+    def prune(self, now: float):
+        live = {jti: expires_at for jti, expires_at in self.expires.items() if expires_at > now}
+        if len(live) < len(self.expires):
+            self.expires = live
+            # Bloom filters can't forget, so expired ids go by rebuilding it.
+            self._rebuild()
+
+    def _rebuild(self):
+        bloom = self._bloom(len(self.expires))
+        for jti in self.expires:
+            bloom.add(jti)
+        self.bloom = bloom
+
+
+revoked = RevocationList()
+
+
+def _timestamp(value: datetime):
+    # SQLite hands back naive datetimes; everything here is written in UTC.
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+
+
+async def revoke(db, jti: str, expires_at: datetime):
+    # Takes effect in this worker at once, and in the others at their next sync.
+    revoked.add(jti, expires_at.timestamp())
+    values = {"jti": jti, "revoked_at": datetime.now(timezone.utc), "expires_at": expires_at}
+    await db.execute(insert_ignore(db, models.RevokedToken).values(values))
+    await db.commit()
+
+
+async def revoke_session(db, payload: dict):
+    # Ends the session a token belongs to: its refresh token and every access token
+    # issued under it. Tokens from before sessions existed can only revoke themselves.
+    if payload.get("sid"):
+        await revoke(db, payload["sid"], datetime.now(timezone.utc) + timedelta(days=settings.refresh_token_expire_days))
+    elif payload.get("jti"):
+        await revoke(db, payload["jti"], datetime.fromtimestamp(payload["exp"], timezone.utc))
+
+
+_synced_at = None
+
+
+async def sync(db):
+    global _synced_at
+    started = datetime.now(timezone.utc)
+    statement = select(models.RevokedToken.jti, models.RevokedToken.expires_at).where(models.RevokedToken.expires_at > started)
+    if _synced_at is not None:
+        statement = statement.where(models.RevokedToken.revoked_at > _synced_at - SYNC_OVERLAP)
+    for jti, expires_at in (await db.execute(statement)).all():
+        revoked.add(jti, _timestamp(expires_at))
+    _synced_at = started
+
+
+async def prune(db):
+    revoked.prune(time.time())
+    # Every worker runs this; the later ones just find nothing to delete.
+    await db.execute(delete(models.RevokedToken).where(models.RevokedToken.expires_at <= datetime.now(timezone.utc)))
+    await db.commit()
+
+
+async def _run(step):
+    db = database.open_session()
+    try:
+        await step(db)
+    finally:
+        await db.close()
+
+
+async def _sync_loop():
+    pruned_at = time.monotonic()
+    while True:
+        await asyncio.sleep(settings.token_revocation_sync_seconds)
+        try:
+            await _run(sync)
+            if time.monotonic() - pruned_at >= settings.token_revocation_prune_seconds:
+                await _run(prune)
+                pruned_at = time.monotonic()
+        except Exception:
+            logger.exception("Syncing revoked tokens failed")
+
+
+_task = None
+
+
+async def start():
+    global _task
+    if settings.token_revocation and _task is None:
+        # Load what's already revoked before serving, so a restart doesn't reopen old sessions.
+        try:
+            await _run(sync)
+        except Exception:
+            logger.exception("Loading revoked tokens failed; retrying in the background")
+        _task = asyncio.get_running_loop().create_task(_sync_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -1,50 +1,172 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from .. import schemas, database, models
+from ..pagination import PageParams, check_ids, fetch_by_ids, paginate, parse_ids
+from ..search import index_row, remove_row, search_page
+from ..response_cache import as_dict, response_cache
+from ..materialize import affected_users, changes
+from ..catalog import stale
+from ..config import settings
+from ..popularity import counters, leaderboard
+from ..bulk import DELETED, NOT_FOUND, check_size, existing_ids, supports_returning
+from typing import List, Optional
 from .user import current_user
 
 router = APIRouter(tags=['animes'])
 
+INCLUDES = {"genres"}
+
+
+def _includes(include: Optional[str]):
+    names = {name.strip() for name in include.split(",") if name.strip()} if include else set()
+    unknown = names - INCLUDES
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown include: {', '.join(sorted(unknown))}")
+    return names
+
+
+async def _attach_genres(db: AsyncSession, items):
+    # One query for the whole page, the same IN (...) load selectinload(models.Anime.genres) runs.
+    if items and "id" not in items[0]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="include=genres needs the id field")
+    genres = {item["id"]: [] for item in items}
+    if genres:
+        statement = select(models.Anime.id, models.Genre.id, models.Genre.name, models.Genre.created_at).join(models.Anime.genres).where(models.Anime.id.in_(list(genres))).order_by(models.Genre.id)
+        for anime_id, genre_id, name, created_at in (await db.execute(statement)).all():
+            genres[anime_id].append({"name": name, "id": genre_id, "created_at": created_at})
+    for item in items:
+        item["genres"] = genres[item["id"]]
+
 @router.post("/animes", status_code=status.HTTP_201_CREATED, response_model=schemas.Anime)
-async def create_anime(anime: schemas.AnimeCreate, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
+async def create_anime(anime: schemas.AnimeCreate, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
     db_anime = models.Anime(title=anime.title, description=anime.description, rating=anime.rating)
     db.add(db_anime)
-    db.commit()
-    db.refresh(db_anime)
+    await db.commit()
+    await db.refresh(db_anime)
+    index_row(models.Anime, db_anime)
+    stale.mark()
     return db_anime
 
-@router.get("/animes", response_model=list[schemas.Anime])
-async def get_all_animes(search: str = None, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    if search:
-        animes = db.query(models.Anime).filter(models.Anime.title.ilike(f"%{search}%")).all()
+@router.post("/animes/bulk", status_code=status.HTTP_201_CREATED, response_model=List[schemas.Anime])
+async def create_animes(animes: List[schemas.AnimeCreate], current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    check_size(animes)
+    if not animes:
+        return []
+    values = [{"title": anime.title, "description": anime.description, "rating": anime.rating} for anime in animes]
+    if supports_returning(db):
+        created = (await db.execute(insert(models.Anime).values(values).returning(*models.Anime.__table__.c))).all()
+        await db.commit()
     else:
-        animes = db.query(models.Anime).all()
-    return animes
+        created = [models.Anime(**value) for value in values]
+        db.add_all(created)
+        await db.commit()
+        for db_anime in created:
+            await db.refresh(db_anime)
+    for db_anime in created:
+        index_row(models.Anime, db_anime)
+    stale.mark()
+    return created
 
-@router.get("/animes/{anime_id}", response_model=schemas.Anime)
-async def get_anime(anime_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_anime = db.query(models.Anime).filter(models.Anime.id == anime_id).first()
-    if not db_anime:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Anime not found")
-    return db_anime
+@router.post("/animes/bulk-delete", response_model=List[schemas.AnimeDeleteResult])
+async def delete_animes(anime_ids: List[int], current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    check_size(anime_ids)
+    users = await affected_users(db, animes=anime_ids)
+    statement = delete(models.Anime).where(models.Anime.id.in_(set(anime_ids))).execution_options(synchronize_session=False)
+    if supports_returning(db):
+        deleted = set((await db.execute(statement.returning(models.Anime.id))).scalars())
+    else:
+        deleted = await existing_ids(db, models.Anime, anime_ids)
+        await db.execute(statement)
+    await db.commit()
+    for anime_id in deleted:
+        remove_row(models.Anime, anime_id)
+        changes.mark_link(anime_id=anime_id)
+    changes.mark_users(users)
+    await response_cache.invalidate("genre-anime", *(f"anime:{anime_id}" for anime_id in deleted))
+    stale.mark()
+    return [{"id": anime_id, "status": DELETED if anime_id in deleted else NOT_FOUND} for anime_id in anime_ids]
+
+@router.get("/animes", response_model=list[schemas.AnimeWithGenres], response_model_exclude_unset=True)
+async def get_all_animes(response: Response, search: str = None, ids: Optional[str] = Query(None, description="Comma separated anime ids, returned in that order"), include: Optional[str] = Query(None, description="Comma separated related data to embed: genres"), page: PageParams = Depends(), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    expand = _attach_genres if "genres" in _includes(include) else None
+    if ids is not None:
+        return await fetch_by_ids(db, models.Anime, parse_ids(ids), page, response, schemas.Anime, expand=expand)
+    if search:
+        ids = await search_page(db, models.Anime, search, page)
+        return await fetch_by_ids(db, models.Anime, ids, page, response, schemas.Anime, expand=expand)
+    return await paginate(db, models.Anime, page, response, schemas.Anime, expand=expand)
+
+@router.post("/animes:batchGet", response_model=list[schemas.AnimeWithGenres], response_model_exclude_unset=True)
+async def batch_get_animes(batch: schemas.BatchGet, response: Response, include: Optional[str] = Query(None, description="Comma separated related data to embed: genres"), page: PageParams = Depends(), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    expand = _attach_genres if "genres" in _includes(include) else None
+    return await fetch_by_ids(db, models.Anime, check_ids(batch.ids), page, response, schemas.Anime, expand=expand)
+
+def _check_popularity():
+    if not settings.popularity_enabled:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Popularity counters are disabled")
+
+# Declared before /animes/{anime_id}, which would otherwise claim these paths.
+@router.get("/animes/popular", response_model=List[schemas.PopularAnime])
+async def get_popular_animes(limit: int = Query(20, ge=1, le=settings.popularity_top_size), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    _check_popularity()
+    if leaderboard.popular is None:
+        await leaderboard.refresh(db)
+    return leaderboard.top_popular(limit)
+
+@router.get("/animes/trending", response_model=List[schemas.TrendingAnime])
+async def get_trending_animes(limit: int = Query(20, ge=1, le=settings.popularity_top_size), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    _check_popularity()
+    if leaderboard.trending is None:
+        await leaderboard.refresh(db)
+    return leaderboard.top_trending(limit)
+
+@router.get("/animes/{anime_id}", response_model=schemas.AnimeWithGenres, response_model_exclude_unset=True)
+async def get_anime(anime_id: int, request: Request, include: Optional[str] = Query(None, description="Comma separated related data to embed: genres"), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    if "genres" in _includes(include):
+        # Not response-cached: link changes don't bump the anime's cache namespace.
+        db_anime = await db.get(models.Anime, anime_id, options=[selectinload(models.Anime.genres)])
+        if not db_anime:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Anime not found")
+        counters.viewed(anime_id)
+        return {**as_dict(db_anime, schemas.Anime), "genres": [as_dict(db_genre, schemas.Genre) for db_genre in db_anime.genres]}
+
+    async def load(response: Response):
+        db_anime = await db.get(models.Anime, anime_id)
+        if not db_anime:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Anime not found")
+        return as_dict(db_anime, schemas.Anime)
+    detail = await response_cache.respond(request, f"anime:{anime_id}", "detail", load)
+    counters.viewed(anime_id)
+    return detail
 
 @router.put("/animes/{anime_id}", response_model=schemas.Anime)
-async def update_anime(anime_id: int, anime: schemas.AnimeCreate, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_anime = db.query(models.Anime).filter(models.Anime.id == anime_id).first()
+async def update_anime(anime_id: int, anime: schemas.AnimeCreate, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    db_anime = await db.get(models.Anime, anime_id)
     if not db_anime:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Anime not found")
     db_anime.title = anime.title
     db_anime.description = anime.description
     db_anime.rating = anime.rating
-    db.commit()
-    db.refresh(db_anime)
+    await db.commit()
+    await db.refresh(db_anime)
+    index_row(models.Anime, db_anime)
+    await response_cache.invalidate(f"anime:{anime_id}")
+    stale.mark()
     return db_anime
 
 @router.delete("/animes/{anime_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_anime(anime_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_anime = db.query(models.Anime).filter(models.Anime.id == anime_id).first()
+async def delete_anime(anime_id: int, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    db_anime = await db.get(models.Anime, anime_id)
     if not db_anime:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Anime not found")
-    db.delete(db_anime)
-    db.commit()
+    users = await affected_users(db, animes=[anime_id])
+    await db.delete(db_anime)
+    await db.commit()
+    remove_row(models.Anime, anime_id)
+    await response_cache.invalidate(f"anime:{anime_id}", "genre-anime")
+    stale.mark()
+    changes.mark_link(anime_id=anime_id)
+    changes.mark_users(users)
     return None
@@ -1,9 +1,13 @@
 from typing import Optional
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import HTTPBearer
-from ..database import get_db, SessionLocal
+from ..database import get_db
 from .. import models, schemas, utils, oauth2, database
+from ..config import settings
+from ..revocation import revoke_session
+from ..search import index_row
 from fastapi import Response, status, HTTPException, Depends, APIRouter
 
 router = APIRouter(
@@ -13,52 +17,61 @@ router = APIRouter(
 oauth2_scheme = HTTPBearer()
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-async def register(user: schemas.UserLogin, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(models.User.username == user.username).first()
+async def register(user: schemas.UserLogin, db: AsyncSession = Depends(get_db)):
+    existing_user = await db.scalar(select(models.User).filter(models.User.username == user.username))
     if existing_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists")
-    hashed_password = utils.hash(user.password)
+    hashed_password = await utils.hash_async(user.password)
     new_user = models.User(username=user.username, password=hashed_password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    index_row(models.User, new_user)
     return {"message": "User registered successfully"}
 
 
 @router.post('/login')
-async def login(user_credentials: schemas.UserLogin = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(
-        models.User.username == user_credentials.username).first()
-    if not user or not utils.verify(user_credentials.password, user.password):
+async def login(user_credentials: schemas.UserLogin = Depends(), db: AsyncSession = Depends(database.get_db)):
+    user = await db.scalar(select(models.User).filter(
+        models.User.username == user_credentials.username))
+    if not user or not await utils.verify_async(user_credentials.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
-    access_token = oauth2.create_access_token(data={"user_id": user.id})
-    refresh_token = oauth2.create_refresh_token(data={"user_id": user.id})
+    session_id = oauth2.new_token_id()
+    access_token = oauth2.create_access_token(data=oauth2.user_claims(user), session_id=session_id)
+    # The refresh token carries the user claims too, so /refresh needn't look the user up
+    # while revocation is on: deleting or renaming a user revokes the session instead.
+    refresh_token = oauth2.create_refresh_token(data=oauth2.user_claims(user), token_id=session_id)
     return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
 
 
 @router.post("/refresh")
-async def refresh_token(refresh_token: str, db: Session = Depends(database.get_db)):
+async def refresh_token(refresh_token: str, db: AsyncSession = Depends(database.get_db)):
     try:
         payload = oauth2.verify_token(refresh_token, credentials_exception=HTTPException(status_code=401, detail="Invalid token or expired token"))
-        user_id = payload.get("user_id")
-        user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        new_access_token = oauth2.create_access_token(data={"user_id": user_id})
+        # An access token would otherwise mint new access tokens, outliving its own expiry.
+        if payload.get("type") != oauth2.REFRESH_TOKEN_TYPE:
+            raise HTTPException(status_code=401, detail="Invalid token or expired token")
+        if settings.token_revocation:
+            claims = {"user_id": payload["user_id"], "username": payload["username"], "created_at": payload["created_at"]}
+        else:
+            # Nothing else would stop the session of a deleted user, or refresh a renamed one's claims.
+            user = await db.get(models.User, payload["user_id"])
+            if not user:
+                raise HTTPException(status_code=404, detail="User not found")
+            claims = oauth2.user_claims(user)
+        # A refresh token's jti is its session id.
+        new_access_token = oauth2.create_access_token(data=claims, session_id=payload["jti"])
         return {"access_token": new_access_token, "token_type": "bearer"}
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token or expired token")
 
 
 @router.post("/logout")
-async def logout(token: str = Depends(oauth2_scheme)):
-    try:
-        check = oauth2.verify_token(token.credentials, credentials_exception=HTTPException(status_code=401, detail="Invalid token or expired token"))
-        print(f"Checks:{check}")
-    except Exception as e:
-        print(e)
-        raise HTTPException(status_code=401, detail="Invalid token")
+async def logout(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
+    payload = oauth2.verify_token(token.credentials, credentials_exception=HTTPException(status_code=401, detail="Invalid token"))
+    if settings.token_revocation:
+        await revoke_session(db, payload)
     return {"message": "Successfully logged out"}
 
 
@@ -0,0 +1,66 @@
+import json
+import zlib
+from datetime import datetime
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from .. import schemas, database, models
+from ..config import settings
+from .user import current_user
+
+router = APIRouter(
+    tags=['export']
+)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def _ndjson_rows(statement):
+    # The session is opened here rather than injected: the request's own
+    # dependencies are closed before the response body starts streaming.
+    db = database.open_session()
+    try:
+        result = await db.stream(statement.execution_options(yield_per=settings.export_batch_size))
+        try:
+            async for rows in result.partitions(settings.export_batch_size):
+                yield "".join(json.dumps(dict(row._mapping), default=_default) + "\n" for row in rows).encode()
+        finally:
+            await result.close()
+    finally:
+        await db.close()
+
+
+async def _gzipped(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _export_response(statement, filename: str, gzip: bool):
+    body = _ndjson_rows(statement)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.ndjson"'}
+    if gzip:
+        body = _gzipped(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+
+@router.get("/export/animes")
+async def export_animes(gzip: bool = False, current_user: schemas.UserOut = Depends(current_user)):
+    statement = select(models.Anime.id, models.Anime.title, models.Anime.description, models.Anime.rating, models.Anime.created_at).order_by(models.Anime.id)
+    return _export_response(statement, "animes", gzip)
+
+
+@router.get("/export/genre-anime")
+async def export_genre_anime(gzip: bool = False, current_user: schemas.UserOut = Depends(current_user)):
+    statement = select(models.GenreAnime.genre_id, models.GenreAnime.anime_id).order_by(models.GenreAnime.genre_id, models.GenreAnime.anime_id)
+    return _export_response(statement, "genre-anime", gzip)
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.exc import IntegrityError
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from .. import database, models, schemas
-from sqlalchemy.orm import Session
+from ..pagination import PageParams, paginate
+from .. import bulk
+from ..materialize import changes
+from ..popularity import counters
+from sqlalchemy.ext.asyncio import AsyncSession
 from .user import current_user
 from typing import List
  
@@ -11,44 +14,61 @@ router = APIRouter(
 )
 
 @router.post("/user/addfavourites", response_model=schemas.Favourite)
-async def favourite_anime(favourite: schemas.FavouriteCreate, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    try:
-        db_user = db.query(models.User).filter(models.User.id == favourite.user_id).first()
-        db_anime = db.query(models.Anime).filter(models.Anime.id == favourite.anime_id).first()
-        if not db_user:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        if not db_anime:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Anime not found")
-        db_favourite = models.Favourite(user_id=favourite.user_id, anime_id=favourite.anime_id)
-        db.add(db_favourite)
-        db.commit()
-        db.refresh(db_favourite)
-        return db_favourite
-    except IntegrityError as e:
-        if "duplicate key value violates unique constraint" in str(e):
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User id and anime id already exists")
-        else:
-            raise
+async def favourite_anime(favourite: schemas.FavouriteCreate, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    values = {"user_id": favourite.user_id, "anime_id": favourite.anime_id}
+    created = await bulk.create_link(db, models.Favourite, values, {"user_id": (models.User, "User not found"), "anime_id": (models.Anime, "Anime not found")})
+    if not created:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User id and anime id already exists")
+    changes.mark_user(favourite.user_id)
+    counters.favourited(favourite.anime_id)
+    return values
+
+
+@router.post("/user/addfavourites/bulk", response_model=List[schemas.FavouriteResult])
+async def favourite_animes(favourites: List[schemas.FavouriteCreate], current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    bulk.check_size(favourites)
+    items = [{"user_id": favourite.user_id, "anime_id": favourite.anime_id} for favourite in favourites]
+    statuses = await bulk.create_links(db, models.Favourite, items, {"user_id": (models.User, "user_not_found"), "anime_id": (models.Anime, "anime_not_found")})
+    for item, state in zip(items, statuses):
+        if state == bulk.CREATED:
+            changes.mark_user(item["user_id"])
+            counters.favourited(item["anime_id"])
+    return [{**item, "status": state} for item, state in zip(items, statuses)]
+
+
+@router.post("/user/removefavourites/bulk", response_model=List[schemas.FavouriteResult])
+async def unfavourite_animes(favourites: List[schemas.FavouriteCreate], current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    bulk.check_size(favourites)
+    items = [{"user_id": favourite.user_id, "anime_id": favourite.anime_id} for favourite in favourites]
+    allowed = [item for item in items if item["user_id"] == current_user.id]
+    statuses = await bulk.delete_links(db, models.Favourite, allowed)
+    changes.mark_user(current_user.id)
+    # A pair listed twice is reported deleted twice but only counted once.
+    for anime_id in {item["anime_id"] for item, state in zip(allowed, statuses) if state == bulk.DELETED}:
+        counters.favourited(anime_id, -1)
+    deleted = iter(statuses)
+    return [{**item, "status": next(deleted) if item["user_id"] == current_user.id else bulk.FORBIDDEN} for item in items]
 
 
 @router.delete("/user/removefavourites/{user_id}/{anime_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def unfavourite_anime(user_id: int, anime_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
+async def unfavourite_anime(user_id: int, anime_id: int, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
     if user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have permission to perform this action")
-    db_favourite = db.query(models.Favourite).filter(models.Favourite.user_id == user_id, models.Favourite.anime_id == anime_id).first()
+    db_favourite = await db.get(models.Favourite, (user_id, anime_id))
     if not db_favourite:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Favourite not found")
     
-    db.delete(db_favourite)
-    db.commit()
+    await db.delete(db_favourite)
+    await db.commit()
+    changes.mark_user(user_id)
+    counters.favourited(anime_id, -1)
     return None
 
 
 @router.get("/user/favourites/{user_id}")
-async def get_user_favourited_anime(user_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_favourited_anime(user_id: int, response: Response, page: PageParams = Depends(), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    favourites = db.query(models.Anime).join(models.Favourite).filter(models.Favourite.user_id == user_id).all()
-    return favourites
+    return await paginate(db, models.Anime, page, response, schemas.Anime, joins=[models.Favourite], where=[models.Favourite.user_id == user_id])
 
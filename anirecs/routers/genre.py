@@ -1,55 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.exc import IntegrityError
 from .. import schemas, database, models
-from sqlalchemy.orm import Session
+from ..pagination import PageParams, check_ids, fetch_by_ids, paginate, parse_ids
+from ..search import index_row, remove_row, search_page
+from ..response_cache import as_dict, response_cache
+from ..materialize import affected_users, changes
+from ..catalog import stale
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .user import current_user
 from fastapi import Query
+from typing import Optional
 
 router = APIRouter(
     tags=['genres']
 )
 
 @router.post("/genres", status_code=status.HTTP_201_CREATED, response_model=schemas.Genre)
-async def create_genre(genre: schemas.GenreCreate, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    existing_genre = db.query(models.Genre).filter(models.Genre.name == genre.name).first()
+async def create_genre(genre: schemas.GenreCreate, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    existing_genre = await db.scalar(select(models.Genre).filter(models.Genre.name == genre.name))
     if existing_genre:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Genre name already exists")
     db_genre = models.Genre(name=genre.name)
     db.add(db_genre)
-    db.commit()
-    db.refresh(db_genre)
+    await db.commit()
+    await db.refresh(db_genre)
+    index_row(models.Genre, db_genre)
+    await response_cache.invalidate("genres")
+    stale.mark()
     return db_genre
 
 @router.get("/genres", response_model=list[schemas.Genre])
-async def get_all_genres(search: str = None, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
+async def get_all_genres(request: Request, response: Response, search: str = None, ids: Optional[str] = Query(None, description="Comma separated genre ids, returned in that order"), page: PageParams = Depends(), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    if ids is not None:
+        return await fetch_by_ids(db, models.Genre, parse_ids(ids), page, response, schemas.Genre)
     if search:
-        genres = db.query(models.Genre).filter(models.Genre.name.ilike(f"%{search}%")).all()
-    else:
-        genres = db.query(models.Genre).all()
-    return genres
+        ids = await search_page(db, models.Genre, search, page)
+        return await fetch_by_ids(db, models.Genre, ids, page, response, schemas.Genre)
+    return await response_cache.respond(request, "genres", f"list:{request.query_params}", lambda response: paginate(db, models.Genre, page, response, schemas.Genre))
+
+@router.post("/genres:batchGet", response_model=list[schemas.Genre])
+async def batch_get_genres(batch: schemas.BatchGet, response: Response, page: PageParams = Depends(), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    return await fetch_by_ids(db, models.Genre, check_ids(batch.ids), page, response, schemas.Genre)
 
 @router.get("/genres/{genre_id}", response_model=schemas.Genre)
-async def get_genre(genre_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_genre = db.query(models.Genre).filter(models.Genre.id == genre_id).first()
-    if not db_genre:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre not found")
-    return db_genre
+async def get_genre(genre_id: int, request: Request, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    async def load(response: Response):
+        db_genre = await db.get(models.Genre, genre_id)
+        if not db_genre:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre not found")
+        return as_dict(db_genre, schemas.Genre)
+    return await response_cache.respond(request, "genres", f"id:{genre_id}", load)
 
 @router.put("/genres/{genre_id}", response_model=schemas.Genre)
-async def update_genre(genre_id: int, genre: schemas.GenreCreate, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_genre = db.query(models.Genre).filter(models.Genre.id == genre_id).first()
+async def update_genre(genre_id: int, genre: schemas.GenreCreate, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    db_genre = await db.get(models.Genre, genre_id)
     if not db_genre:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre not found")
     db_genre.name = genre.name
-    db.commit()
-    db.refresh(db_genre)
+    await db.commit()
+    await db.refresh(db_genre)
+    index_row(models.Genre, db_genre)
+    await response_cache.invalidate("genres", "genre-anime")
+    stale.mark()
     return db_genre
 
 @router.delete("/genres/{genre_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_genre(genre_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_genre = db.query(models.Genre).filter(models.Genre.id == genre_id).first()
+async def delete_genre(genre_id: int, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    db_genre = await db.get(models.Genre, genre_id)
     if not db_genre:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre not found")
-    db.delete(db_genre)
-    db.commit()
+    users = await affected_users(db, genres=[genre_id])
+    await db.delete(db_genre)
+    await db.commit()
+    remove_row(models.Genre, genre_id)
+    await response_cache.invalidate("genres", "genre-anime")
+    stale.mark()
+    changes.mark_link(genre_id=genre_id)
+    changes.mark_users(users)
     return None
@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.exc import IntegrityError
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from .. import schemas, database, models
-from sqlalchemy.orm import Session
+from ..pagination import PageParams, paginate
+from .. import bulk
+from ..materialize import affected_users, changes
+from ..catalog import get_snapshot, stale
+from ..response_cache import as_dict, response_cache
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .user import current_user
 from typing import List
 
@@ -10,71 +15,105 @@ router = APIRouter(
 )
 
 @router.post("/genre-anime", status_code=status.HTTP_201_CREATED, response_model=schemas.GenreAnime)
-async def create_genre_anime(genre_anime: schemas.GenreAnimeCreate, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    try:
-        db_genre = db.query(models.Genre).filter(models.Genre.id == genre_anime.genre_id).first()
-        db_anime = db.query(models.Anime).filter(models.Anime.id == genre_anime.anime_id).first()
-        if not db_genre:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre not found")
-        if not db_anime:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Anime not found")
-        db_genre_anime = models.GenreAnime(genre_id=genre_anime.genre_id, anime_id=genre_anime.anime_id)
-        db.add(db_genre_anime)
-        db.commit()
-        db.refresh(db_genre_anime)
-        return db_genre_anime
-    except IntegrityError as e:
-        if "duplicate key value violates unique constraint" in str(e):
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Entry with the same anime id and genre id already exists")
-        else:
-            raise
+async def create_genre_anime(genre_anime: schemas.GenreAnimeCreate, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    values = {"genre_id": genre_anime.genre_id, "anime_id": genre_anime.anime_id}
+    created = await bulk.create_link(db, models.GenreAnime, values, {"genre_id": (models.Genre, "Genre not found"), "anime_id": (models.Anime, "Anime not found")})
+    if not created:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Entry with the same anime id and genre id already exists")
+    await response_cache.invalidate("genre-anime")
+    stale.mark()
+    changes.mark_link(genre_anime.genre_id, genre_anime.anime_id)
+    return values
+
+@router.post("/genre-anime/bulk", response_model=List[schemas.GenreAnimeResult])
+async def create_genre_animes(genre_animes: List[schemas.GenreAnimeCreate], current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    bulk.check_size(genre_animes)
+    items = [{"genre_id": link.genre_id, "anime_id": link.anime_id} for link in genre_animes]
+    statuses = await bulk.create_links(db, models.GenreAnime, items, {"genre_id": (models.Genre, "genre_not_found"), "anime_id": (models.Anime, "anime_not_found")})
+    await response_cache.invalidate("genre-anime")
+    stale.mark()
+    for item, state in zip(items, statuses):
+        if state == bulk.CREATED:
+            changes.mark_link(item["genre_id"], item["anime_id"])
+    return [{**item, "status": state} for item, state in zip(items, statuses)]
+
+@router.post("/genre-anime/bulk-delete", response_model=List[schemas.GenreAnimeResult])
+async def delete_genre_animes(genre_animes: List[schemas.GenreAnimeCreate], current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    bulk.check_size(genre_animes)
+    items = [{"genre_id": link.genre_id, "anime_id": link.anime_id} for link in genre_animes]
+    statuses = await bulk.delete_links(db, models.GenreAnime, items)
+    await response_cache.invalidate("genre-anime")
+    stale.mark()
+    for item, state in zip(items, statuses):
+        if state == bulk.DELETED:
+            changes.mark_link(item["genre_id"], item["anime_id"])
+    return [{**item, "status": state} for item, state in zip(items, statuses)]
 
 @router.get("/genre-anime", response_model=List[schemas.GenreAnime])
-async def get_all_genre_anime(current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    genre_anime = db.query(models.GenreAnime).all()
-    return genre_anime
+async def get_all_genre_anime(response: Response, page: PageParams = Depends(), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    keys = [models.GenreAnime.genre_id, models.GenreAnime.anime_id]
+    return await paginate(db, models.GenreAnime, page, response, schemas.GenreAnime, keys=keys)
 
 @router.get("/genre-anime/genre/{genre_id}")
-async def get_genre_anime_from_genre_id(genre_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_genre_animes = db.query(models.Anime).join(models.GenreAnime).filter(models.GenreAnime.genre_id == genre_id).all()
+async def get_genre_anime_from_genre_id(genre_id: int, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        db_genre_animes = snapshot.animes_in_genre(genre_id)
+    else:
+        db_genre_animes = (await db.execute(select(models.Anime).join(models.GenreAnime).filter(models.GenreAnime.genre_id == genre_id))).scalars().all()
     if not db_genre_animes:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre-anime associations not found for the given genre ID")
     return db_genre_animes
 
 @router.get("/genre-anime/anime/{anime_id}")
-async def get_genre_anime_from_anime_id(anime_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_genre_animes = db.query(models.Genre).join(models.GenreAnime).filter(models.GenreAnime.anime_id == anime_id).all()
-    if not db_genre_animes:
+async def get_genre_anime_from_anime_id(anime_id: int, request: Request, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    async def load(response: Response):
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            db_genre_animes = snapshot.genres_of_anime(anime_id)
+        else:
+            db_genre_animes = [as_dict(db_genre, schemas.Genre) for db_genre in (await db.execute(select(models.Genre).join(models.GenreAnime).filter(models.GenreAnime.anime_id == anime_id))).scalars()]
+        if not db_genre_animes:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre-anime associations not found for the given anime ID")
+        return db_genre_animes
+    return await response_cache.respond(request, "genre-anime", f"anime:{anime_id}", load)
+
+@router.delete("/genre-anime/anime/{anime_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_genre_anime_by_anime_id(anime_id: int, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    users = await affected_users(db, animes=[anime_id])
+    result = await db.execute(delete(models.GenreAnime).where(models.GenreAnime.anime_id == anime_id).execution_options(synchronize_session=False))
+    if not result.rowcount:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre-anime associations not found for the given anime ID")
-    return db_genre_animes
+    await db.commit()
+    await response_cache.invalidate("genre-anime")
+    stale.mark()
+    changes.mark_link(anime_id=anime_id)
+    changes.mark_users(users)
+    return None
 
 @router.delete("/genre-anime/{genre_id}/{anime_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_genre_anime(genre_id: int, anime_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_genre_anime = db.query(models.GenreAnime).filter(models.GenreAnime.genre_id == genre_id, models.GenreAnime.anime_id == anime_id).first()
+async def delete_genre_anime(genre_id: int, anime_id: int, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    db_genre_anime = await db.get(models.GenreAnime, (genre_id, anime_id))
     if not db_genre_anime:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre-anime association not found")
-    db.delete(db_genre_anime)
-    db.commit()
+    await db.delete(db_genre_anime)
+    await db.commit()
+    await response_cache.invalidate("genre-anime")
+    stale.mark()
+    changes.mark_link(genre_id, anime_id)
     return None
 
 @router.delete("/genre-anime/{genre_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_genre_anime_by_genre_id(genre_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_genre_animes = db.query(models.GenreAnime).filter(models.GenreAnime.genre_id == genre_id).all()
-    if not db_genre_animes:
+async def delete_genre_anime_by_genre_id(genre_id: int, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    users = await affected_users(db, genres=[genre_id])
+    result = await db.execute(delete(models.GenreAnime).where(models.GenreAnime.genre_id == genre_id).execution_options(synchronize_session=False))
+    if not result.rowcount:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre-anime associations not found for the given genre ID")
-    for db_genre_anime in db_genre_animes:
-        db.delete(db_genre_anime)
-    db.commit()
-    return None
-
-@router.delete("/genre-anime/{anime_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_genre_anime_by_anime_id(anime_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_genre_animes = db.query(models.GenreAnime).filter(models.GenreAnime.anime_id == anime_id).all()
-    if not db_genre_animes:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre-anime associations not found for the given anime ID")
-    for db_genre_anime in db_genre_animes:
-        db.delete(db_genre_anime)
-    db.commit()
+    await db.commit()
+    await response_cache.invalidate("genre-anime")
+    stale.mark()
+    changes.mark_link(genre_id=genre_id)
+    changes.mark_users(users)
     return None
 
 
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import schemas, models, database
 from .user import current_user
+from .. import bulk
+from ..materialize import changes
 from typing import List
 
 router = APIRouter(
@@ -10,44 +12,53 @@ router = APIRouter(
 )
 
 @router.post("/user/addpreferences", response_model=schemas.Preference)
-async def add_preference(preference: schemas.PreferenceCreate, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    try:
-        db_user = db.query(models.User).filter(models.User.id == preference.user_id).first()
-        db_genre = db.query(models.Genre).filter(models.Genre.id == preference.genre_id).first()
-        if not db_user:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        if not db_genre:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Genre not found")
-        db_preference = models.Preference(user_id=preference.user_id, genre_id=preference.genre_id)
-        db.add(db_preference)
-        db.commit()
-        db.refresh(db_preference)
-        return db_preference
-    except IntegrityError as e:
-        if "duplicate key value violates unique constraint" in str(e):
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Entry with the same user id and genre id already exists")
-        else:
-            raise
+async def add_preference(preference: schemas.PreferenceCreate, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    values = {"user_id": preference.user_id, "genre_id": preference.genre_id}
+    created = await bulk.create_link(db, models.Preference, values, {"user_id": (models.User, "User not found"), "genre_id": (models.Genre, "Genre not found")})
+    if not created:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Entry with the same user id and genre id already exists")
+    changes.mark_user(preference.user_id)
+    return values
+
+@router.post("/user/addpreferences/bulk", response_model=List[schemas.PreferenceResult])
+async def add_preferences(preferences: List[schemas.PreferenceCreate], current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    bulk.check_size(preferences)
+    items = [{"user_id": preference.user_id, "genre_id": preference.genre_id} for preference in preferences]
+    statuses = await bulk.create_links(db, models.Preference, items, {"user_id": (models.User, "user_not_found"), "genre_id": (models.Genre, "genre_not_found")})
+    for item, state in zip(items, statuses):
+        if state == bulk.CREATED:
+            changes.mark_user(item["user_id"])
+    return [{**item, "status": state} for item, state in zip(items, statuses)]
+
+@router.post("/user/removepreferences/bulk", response_model=List[schemas.PreferenceResult])
+async def remove_preferences(preferences: List[schemas.PreferenceCreate], current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    bulk.check_size(preferences)
+    items = [{"user_id": preference.user_id, "genre_id": preference.genre_id} for preference in preferences]
+    allowed = [item for item in items if item["user_id"] == current_user.id]
+    deleted = iter(await bulk.delete_links(db, models.Preference, allowed))
+    changes.mark_user(current_user.id)
+    return [{**item, "status": next(deleted) if item["user_id"] == current_user.id else bulk.FORBIDDEN} for item in items]
 
 @router.delete("/user/removepreferences/{user_id}/{genre_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def remove_preference(user_id: int, genre_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
+async def remove_preference(user_id: int, genre_id: int, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
     if user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You do not have permission to perform this action")
 
-    db_preference = db.query(models.Preference).filter(models.Preference.user_id == user_id, models.Preference.genre_id == genre_id).first()
+    db_preference = await db.get(models.Preference, (user_id, genre_id))
     if not db_preference:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Preference not found")
     
-    db.delete(db_preference)
-    db.commit()
+    await db.delete(db_preference)
+    await db.commit()
+    changes.mark_user(user_id)
     return None
 
 @router.get("/preferences/{user_id}", response_model=List[schemas.Genre])
-async def get_user_preferences(user_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_preferences(user_id: int, current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    preferences = db.query(models.Genre).join(models.Preference).filter(models.Preference.user_id == user_id).all()
+    preferences = (await db.execute(select(models.Genre).join(models.Preference).filter(models.Preference.user_id == user_id))).scalars().all()
     return preferences
 
 
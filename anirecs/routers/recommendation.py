@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import schemas, database, models, recommender, neighbors, materialize, embeddings
+from ..config import settings
+from ..loader import Loader, get_loader
+from .user import current_user
+from typing import List
+
+router = APIRouter(
+    tags=['recommendations']
+)
+
+async def _load_recommended(loader: Loader, anime_ids, scores):
+    animes = await loader.load_many(models.Anime, anime_ids)
+    return [
+        schemas.RecommendedAnime(id=anime.id, title=anime.title, description=anime.description, rating=anime.rating, created_at=anime.created_at, score=score)
+        for anime, score in zip(animes, scores)
+        if anime is not None
+    ]
+
+@router.get("/recommendations/{user_id}", response_model=List[schemas.RecommendedAnime])
+async def get_recommendations(user_id: int, limit: int = Query(50, ge=1, le=settings.recommendation_limit_max), current_user: schemas.UserOut = Depends(current_user), loader: Loader = Depends(get_loader), db: AsyncSession = Depends(database.get_db)):
+    db_user = await loader.load(models.User, user_id)
+    if not db_user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    if settings.recommendation_materialized and limit <= settings.recommendation_materialized_size:
+        materialized = await db.get(models.UserRecommendation, user_id)
+        if materialized is not None:
+            return await _load_recommended(loader, *materialize.unpack(materialized, limit))
+    anime_ids, scores = (await recommender.get_recommender()).recommend(user_id, limit)
+    return await _load_recommended(loader, anime_ids, scores)
+
+@router.get("/recommendations/{user_id}/also-favourited", response_model=List[schemas.RecommendedAnime])
+async def get_also_favourited(user_id: int, limit: int = Query(50, ge=1, le=settings.recommendation_limit_max), current_user: schemas.UserOut = Depends(current_user), loader: Loader = Depends(get_loader), db: AsyncSession = Depends(database.get_db)):
+    index = await neighbors.get_index()
+    if index is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Neighbour index has not been built")
+    db_user = await loader.load(models.User, user_id)
+    if not db_user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    favourite_ids = (await db.execute(select(models.Favourite.anime_id).filter(models.Favourite.user_id == user_id))).scalars().all()
+    anime_ids, scores = index.recommend(favourite_ids, limit)
+    return await _load_recommended(loader, anime_ids, scores)
+
+@router.get("/animes/{anime_id}/similar", response_model=List[schemas.RecommendedAnime])
+async def get_similar_animes(anime_id: int, limit: int = Query(20, ge=1, le=settings.recommendation_limit_max), current_user: schemas.UserOut = Depends(current_user), loader: Loader = Depends(get_loader), db: AsyncSession = Depends(database.get_db)):
+    index = await embeddings.get_index()
+    if index is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Content index has not been built")
+    db_anime = await loader.load(models.Anime, anime_id)
+    if not db_anime:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Anime not found")
+    anime_ids, scores = await run_in_threadpool(index.similar, anime_id, db_anime.title, db_anime.description, limit)
+    return await _load_recommended(loader, anime_ids, scores)
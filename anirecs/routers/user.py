@@ -1,23 +1,65 @@
 from typing import Optional
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import HTTPBearer
-from ..database import get_db, SessionLocal
+from ..database import get_db
 from .. import models, schemas, utils, oauth2, database
-from fastapi import Response, status, HTTPException, Depends, APIRouter
+from ..cache import TTLCache
+from ..config import settings
+from ..loader import Loader, get_loader
+from ..pagination import PageParams, check_ids, fetch_by_ids, paginate, parse_ids
+from ..revocation import revoke_session
+from ..search import index_row, remove_row, search_page
+from fastapi import Response, status, HTTPException, Depends, APIRouter, Query
 
 router = APIRouter(
     tags=['users']
 )
 oauth2_scheme = HTTPBearer()
 
+# Per worker; other workers see an update or delete once their entry expires.
+user_cache = TTLCache(settings.auth_user_cache_size, settings.auth_user_cache_ttl_seconds)
+
+
+def _user_out(user: models.User):
+    return schemas.UserOut(id=user.id, username=user.username, created_at=user.created_at)
+
+
+def _user_from_claims(payload: dict):
+    if "username" not in payload or "created_at" not in payload:
+        return None
+    return schemas.UserOut(id=payload["user_id"], username=payload["username"], created_at=payload["created_at"])
+
+
+async def load_user(user_id: int, loader: Loader):
+    if settings.auth_user_mode == "cache":
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+    db_user = await loader.load(models.User, user_id)
+    if not db_user:
+        return None
+    user = _user_out(db_user)
+    if settings.auth_user_mode == "cache":
+        user_cache.set(user_id, user)
+    return user
+
+
+def _payload(token):
+    return oauth2.verify_token(token.credentials, credentials_exception=HTTPException(status_code=401, detail="Invalid token or expired token"))
+
+
 @router.get("/users/me", tags=["users"], response_model=schemas.UserOut)
-async def current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+async def current_user(token: str = Depends(oauth2_scheme), loader: Loader = Depends(get_loader)):
     token = token.credentials
     try:
         payload = oauth2.verify_token(token, credentials_exception=HTTPException(status_code=401, detail="Invalid token or expired token"))
+        if payload.get("type") == oauth2.REFRESH_TOKEN_TYPE:
+            raise HTTPException(status_code=401, detail="Invalid token or expired token")
         userId = payload.get("user_id")
-        user = db.query(models.User).filter(models.User.id == userId).first()
+        user = _user_from_claims(payload) if settings.auth_user_mode == "claims" else None
+        if user is None:
+            user = await load_user(userId, loader)
        
         if not user:
                 raise HTTPException(status_code=404, detail="User not found")
@@ -27,37 +69,52 @@ async def current_user(token: str = Depends(oauth2_scheme), db: Session = Depend
 
 
 @router.get("/users", response_model=list[schemas.UserOut])
-async def get_users(username: str = None, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
+async def get_users(response: Response, username: str = None, ids: Optional[str] = Query(None, description="Comma separated user ids, returned in that order"), page: PageParams = Depends(), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    if ids is not None:
+        return await fetch_by_ids(db, models.User, parse_ids(ids), page, response, schemas.UserOut)
     if username:
-        users = db.query(models.User).filter(models.User.username.ilike(f"%{username}%")).all()
-    else:
-        users = db.query(models.User).all()
-    return users
+        ids = await search_page(db, models.User, username, page)
+        return await fetch_by_ids(db, models.User, ids, page, response, schemas.UserOut)
+    return await paginate(db, models.User, page, response, schemas.UserOut)
+
+@router.post("/users:batchGet", response_model=list[schemas.UserOut])
+async def batch_get_users(batch: schemas.BatchGet, response: Response, page: PageParams = Depends(), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    return await fetch_by_ids(db, models.User, check_ids(batch.ids), page, response, schemas.UserOut)
 
 @router.get("/users/{user_id}", response_model=schemas.UserOut)
-async def get_user_by_id(user_id: int, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_by_id(user_id: int, current_user: schemas.UserOut = Depends(current_user), loader: Loader = Depends(get_loader)):
+    user = await loader.load(models.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @router.put("/users/{user_id}", response_model=schemas.UserOut)
-async def update_user(user_id: int, user: schemas.UserUpdate, current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
+async def update_user(user_id: int, user: schemas.UserUpdate, token: str = Depends(oauth2_scheme), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
     if user_id != current_user.id:
         raise HTTPException(status_code=403, detail="You do not have permission to update this user")
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     db_user.username = user.username 
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    user_cache.delete(user_id)
+    index_row(models.User, db_user)
+    if settings.auth_user_mode == "claims" and settings.token_revocation:
+        # The session's tokens, refresh token included, still carry the old username.
+        await revoke_session(db, _payload(token))
     return db_user
 
 @router.delete("/users/me", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user(current_user: schemas.UserOut = Depends(current_user), db: Session = Depends(database.get_db)):
-    db_user = db.query(models.User).filter(models.User.id == current_user.id).first()
+async def delete_user(token: str = Depends(oauth2_scheme), current_user: schemas.UserOut = Depends(current_user), db: AsyncSession = Depends(database.get_db)):
+    db_user = await db.get(models.User, current_user.id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
-    db.delete(db_user)
-    db.commit()
+    await db.delete(db_user)
+    await db.commit()
+    user_cache.delete(current_user.id)
+    remove_row(models.User, current_user.id)
+    if settings.token_revocation:
+        # /refresh trusts the claims in the refresh token, so the session has to end here.
+        await revoke_session(db, _payload(token))
     return {"message": "User deleted successfully"}
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
     
 class UserLogin(BaseModel):
     username: str
@@ -50,6 +50,24 @@ class Anime(AnimeBase):
 
     class Config:
         orm_mode = True
+
+class AnimeWithGenres(Anime):
+    # Only filled in for ?include=genres; routes using it set response_model_exclude_unset.
+    genres: Optional[List[Genre]] = None
+
+class RecommendedAnime(Anime):
+    score: float
+
+class PopularAnime(Anime):
+    favourites: int
+    views: int
+
+class TrendingAnime(Anime):
+    score: float
+
+class AnimeDeleteResult(BaseModel):
+    id: int
+    status: str
  
 class FavouriteBase(BaseModel):
     user_id: int
@@ -61,6 +79,9 @@ class FavouriteCreate(FavouriteBase):
 class Favourite(FavouriteBase):
     class Config:
         orm_mode = True
+
+class FavouriteResult(FavouriteBase):
+    status: str
  
 class PreferenceCreate(BaseModel):
     user_id: int
@@ -70,6 +91,9 @@ class Preference(BaseModel):
     user_id: int
     genre_id: int
 
+class PreferenceResult(Preference):
+    status: str
+
 class GenreAnimeCreate(BaseModel):
     genre_id: int
     anime_id: int
@@ -77,3 +101,9 @@ class GenreAnimeCreate(BaseModel):
 class GenreAnime(BaseModel):
     genre_id: int
     anime_id: int
+
+class GenreAnimeResult(GenreAnime):
+    status: str
+
+class BatchGet(BaseModel):
+    ids: List[int]
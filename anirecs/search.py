@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+
+from fastapi import HTTPException, status
+from sqlalchemy import DDL, event, func, literal, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import database, models
+from .config import settings
+from .pagination import PageParams
+
+logger = logging.getLogger(__name__)
+
+ANIME_DOCUMENT = "to_tsvector('english', title || ' ' || description)"
+
+# Field weights per searchable model; the first field is the one typos are matched against.
+SEARCH_FIELDS = {
+    models.Anime: {"title": 1.0, "description": 0.5},
+    models.Genre: {"name": 1.0},
+    models.User: {"username": 1.0},
+}
+
+event.listen(models.Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+event.listen(
+    models.Anime.__table__,
+    "after_create",
+    DDL(f"CREATE INDEX IF NOT EXISTS ix_animes_document ON animes USING gin (({ANIME_DOCUMENT}))").execute_if(dialect="postgresql"),
+)
+
+_WORD = re.compile(r"\w+")
+
+
+def trigrams(value: str):
+    # Same shape as pg_trgm: each word padded with two leading spaces and one trailing.
+    grams = set()
+    for word in _WORD.findall(value.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NGramIndex:
+    # In-process trigram index used when Postgres isn't available (or is disabled).
+    def __init__(self, weights: dict):
+        self.weights = weights
+        self.postings = {field: defaultdict(set) for field in weights}
+        self.documents = {}
+        self._lock = threading.Lock()
+
+    def add(self, id_: int, values: dict):
+        with self._lock:
+            self._remove(id_)
+            grams = {field: trigrams(values.get(field) or "") for field in self.weights}
+            for field, field_grams in grams.items():
+                postings = self.postings[field]
+                for gram in field_grams:
+                    postings[gram].add(id_)
+            self.documents[id_] = grams
+
+    def remove(self, id_: int):
+        with self._lock:
+            self._remove(id_)
+
+    def _remove(self, id_: int):
+        grams = self.documents.pop(id_, None)
+        if grams is None:
+            return
+        for field, field_grams in grams.items():
+            postings = self.postings[field]
+            for gram in field_grams:
+                ids = postings.get(gram)
+                if ids is not None:
+                    ids.discard(id_)
+                    if not ids:
+                        del postings[gram]
+
+    def search(self, term: str, limit: int, threshold: float):
+        query = trigrams(term)
+        if not query:
+            return []
+        scores = defaultdict(float)
+        with self._lock:
+            for field, weight in self.weights.items():
+                hits = defaultdict(int)
+                postings = self.postings[field]
+                for gram in query:
+                    for id_ in postings.get(gram, ()):
+                        hits[id_] += 1
+                for id_, shared in hits.items():
+                    # Fraction of the query's trigrams found in the field, like word_similarity().
+                    score = weight * shared / len(query)
+                    if score > scores[id_]:
+                        scores[id_] = score
+        ranked = sorted((item for item in scores.items() if item[1] >= threshold), key=lambda item: (-item[1], item[0]))
+        return [id_ for id_, _ in ranked[:limit]]
+
+
+_indexes = {}
+_built_at = {}
+_rebuilds = {}
+# Writes to a model's index made while it is being rebuilt, replayed onto the new one.
+_pending = {}
+_lock = None
+
+
+async def _build_index(db: AsyncSession, model):
+    weights = SEARCH_FIELDS[model]
+    index = NGramIndex(weights)
+    columns = [getattr(model, field) for field in weights]
+    for row in (await db.execute(select(model.id, *columns))).all():
+        index.add(row.id, row._mapping)
+    return index
+
+
+async def _build_and_swap(db: AsyncSession, model):
+    _pending[model] = []
+    try:
+        index = await _build_index(db, model)
+        # The rows may have been read before a write this worker made during the build.
+        for write in _pending[model]:
+            write(index)
+    finally:
+        del _pending[model]
+    _indexes[model], _built_at[model] = index, time.monotonic()
+    return index
+
+
+async def _rebuild(model):
+    db = database.open_session()
+    try:
+        await _build_and_swap(db, model)
+    except Exception:
+        # Keep the old index for another interval rather than retrying on every search.
+        _built_at[model] = time.monotonic()
+        raise
+    finally:
+        await db.close()
+
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Rebuilding the search index failed", exc_info=task.exception())
+
+
+async def _memory_index(db: AsyncSession, model):
+    # index_row/remove_row keep the index current for writes made in this worker; writes
+    # from other workers show up when it is rebuilt, every search_memory_refresh_seconds.
+    # The stale index keeps serving while one background task rebuilds it.
+    global _lock
+    index = _indexes.get(model)
+    if index is not None:
+        if time.monotonic() - _built_at[model] > settings.search_memory_refresh_seconds:
+            task = _rebuilds.get(model)
+            if task is None or task.done():
+                _rebuilds[model] = task = asyncio.get_running_loop().create_task(_rebuild(model))
+                task.add_done_callback(_log_failure)
+        return index
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        if model not in _indexes:
+            await _build_and_swap(db, model)
+        return _indexes[model]
+
+
+def _uses_postgres(db: AsyncSession):
+    return settings.search_backend == "postgres" and db.bind.dialect.name == "postgresql"
+
+
+async def _postgres_search(db: AsyncSession, model, term: str, limit: int):
+    fields = list(SEARCH_FIELDS[model])
+    primary = getattr(model, fields[0])
+    matches = [primary.ilike(f"%{term}%"), literal(term).op("<%")(primary)]
+    rank = func.word_similarity(term, primary)
+    if model is models.Anime:
+        query = func.plainto_tsquery(literal_column("'english'"), term)
+        document = literal_column(ANIME_DOCUMENT)
+        matches.append(document.op("@@")(query))
+        rank = func.greatest(rank, func.ts_rank(document, query))
+    statement = select(model.id).where(or_(*matches)).order_by(rank.desc(), model.id).limit(limit)
+    return (await db.execute(statement)).scalars().all()
+
+
+async def search_ids(db: AsyncSession, model, term: str, limit: int):
+    if _uses_postgres(db):
+        return await _postgres_search(db, model, term, limit)
+    index = await _memory_index(db, model)
+    return index.search(term, limit, settings.search_similarity_threshold)
+
+
+async def search_page(db: AsyncSession, model, term: str, page: PageParams):
+    # Hits are ordered by relevance, not by id, so an id cursor can't continue them.
+    if page.after is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="after can't be used with search: results come as one page ranked by relevance")
+    return await search_ids(db, model, term, page.limit)
+
+
+def _write(model, write):
+    index = _indexes.get(model)
+    if index is not None:
+        write(index)
+    pending = _pending.get(model)
+    if pending is not None:
+        pending.append(write)
+
+
+def index_row(model, row):
+    id_, values = row.id, {field: getattr(row, field) for field in SEARCH_FIELDS[model]}
+    _write(model, lambda index: index.add(id_, values))
+
+
+def remove_row(model, id_: int):
+    _write(model, lambda index: index.remove(id_))
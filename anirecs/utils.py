@@ -1,6 +1,17 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 from passlib.context import CryptContext
+from . import metrics
+from .config import settings
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+password_queue_depth = metrics.Gauge("anirecs_password_queue_depth", "Password hash/verify calls queued or running in the worker pool")
+password_hash_seconds = metrics.Histogram("anirecs_password_hash_seconds", "Time spent hashing or verifying a password in the worker pool", ["operation"])
+password_rejected = metrics.Counter("anirecs_password_rejected_total", "Password hash/verify calls rejected because the pool was saturated", ["operation"])
+
 
 def hash(password: str):
     return pwd_context.hash(password)
@@ -8,3 +19,62 @@ def hash(password: str):
 
 def verify(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordPoolSaturated(Exception):
+    pass
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class PasswordPool:
+    # bcrypt is CPU bound; running it on the event loop stalls every other request.
+    def __init__(self, executor: str, workers: int, queue_size: int):
+        self.executor_kind = executor
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.pending = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        return self._executor
+
+    async def run(self, operation: str, fn, *args):
+        if self.pending >= self.capacity:
+            password_rejected.inc(operation=operation)
+            raise PasswordPoolSaturated(operation)
+        self.pending += 1
+        password_queue_depth.set(self.pending)
+        try:
+            loop = asyncio.get_running_loop()
+            result, elapsed = await loop.run_in_executor(self._get_executor(), _timed, fn, *args)
+        finally:
+            self.pending -= 1
+            password_queue_depth.set(self.pending)
+        password_hash_seconds.observe(elapsed, operation=operation)
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_pool = PasswordPool(settings.password_hash_executor, settings.password_hash_workers, settings.password_hash_queue_size)
+
+
+async def hash_async(password: str):
+    return await password_pool.run("hash", hash, password)
+
+
+async def verify_async(plain_password, hashed_password):
+    return await password_pool.run("verify", verify, plain_password, hashed_password)
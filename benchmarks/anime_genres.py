@@ -0,0 +1,86 @@
+# Anime list pages with their genres: one request per card versus ?include=genres.
+#
+#   poetry run python -m benchmarks.load seed --database sqlite:///var/bench.sqlite --scale 0.1
+#   poetry run python -m benchmarks.anime_genres --database sqlite:///var/bench.sqlite --pages 50
+#
+# Both modes walk the same fresh pages in-process. "per-anime" is what a client
+# does today: GET /animes, then GET /genre-anime/anime/{id} for every card, all
+# in flight together. "include" is GET /animes?include=genres. SQL statement
+# counts come from the Server-Timing header, summed over a page's requests.
+import argparse
+import asyncio
+import re
+import statistics
+import time
+
+from benchmarks.load import Client, _configure
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def _queries(response):
+    match = _QUERIES.search(response.headers.get("server-timing", ""))
+    return int(match.group(1)) if match else 0
+
+
+async def per_anime(http, limit: int, after):
+    params = {"limit": limit, **({"after": after} if after else {})}
+    page = await http.get("/animes", params=params)
+    page.raise_for_status()
+    cards = await asyncio.gather(*(http.get(f"/genre-anime/anime/{anime['id']}") for anime in page.json()))
+    return page.headers.get("x-next-cursor"), 1 + len(cards), _queries(page) + sum(_queries(card) for card in cards)
+
+
+async def include(http, limit: int, after):
+    params = {"limit": limit, "include": "genres", **({"after": after} if after else {})}
+    page = await http.get("/animes", params=params)
+    page.raise_for_status()
+    return page.headers.get("x-next-cursor"), 1, _queries(page)
+
+
+async def walk(app, mode, pages: int, limit: int):
+    import httpx
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as http:
+        await Client(1).login(http)
+        latencies, requests, queries, after = [], 0, 0, None
+        for _ in range(pages):
+            started = time.perf_counter()
+            after, page_requests, page_queries = await mode(http, limit, after)
+            latencies.append(time.perf_counter() - started)
+            requests += page_requests
+            queries += page_queries
+            if after is None:
+                break
+        return latencies, requests, queries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.anime_genres")
+    parser.add_argument("--database", help="SQLAlchemy URL (default: settings)")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    _configure(args.database)
+    from anirecs.config import settings
+    from anirecs.main import app
+
+    settings.server_timing = True
+    results = {}
+
+    async def run_all():
+        async with app.router.lifespan_context(app):
+            for name, mode in (("per-anime", per_anime), ("include", include)):
+                results[name] = await walk(app, mode, args.pages, args.limit)
+
+    asyncio.run(run_all())
+    print(f"{args.pages} pages of {args.limit} animes")
+    print(f"{'mode':<10} {'req/page':>9} {'sql/page':>9} {'p50 ms':>9} {'mean ms':>9} {'pages/s':>9}")
+    for name, (latencies, requests, queries) in results.items():
+        pages = len(latencies)
+        print(f"{name:<10} {requests / pages:>9.1f} {queries / pages:>9.1f} {statistics.median(latencies) * 1000:>9.1f} {statistics.mean(latencies) * 1000:>9.1f} {pages / sum(latencies):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Mixed slow/fast load against the blocking and the async database paths.
+#
+#   poetry run python -m benchmarks.async_db --clients 50 --requests 400
+#
+# Every request to /slow runs `SELECT pg_sleep(...)`, every request to /fast
+# runs `SELECT 1`. With the blocking Session the fast requests queue up behind
+# the slow ones on the event loop; with AsyncSession they don't.
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from anirecs import database
+from anirecs.config import settings
+
+
+def build_app(mode: str, slow_seconds: float):
+    app = FastAPI()
+    slow = text("SELECT pg_sleep(:seconds)").bindparams(seconds=slow_seconds)
+    fast = text("SELECT 1")
+
+    if mode == "blocking":
+        # The pre-async handlers: `async def` calling a blocking Session.
+        @app.get("/slow")
+        async def blocking_slow(db: Session = Depends(database.get_sync_db)):
+            db.execute(slow)
+
+        @app.get("/fast")
+        async def blocking_fast(db: Session = Depends(database.get_sync_db)):
+            db.execute(fast)
+    else:
+        @app.get("/slow")
+        async def async_slow(db: AsyncSession = Depends(database.get_db)):
+            await db.execute(slow)
+
+        @app.get("/fast")
+        async def async_fast(db: AsyncSession = Depends(database.get_db)):
+            await db.execute(fast)
+
+    return app
+
+
+async def run(app, clients: int, total: int, slow_ratio: float):
+    latencies = {"/slow": [], "/fast": []}
+    paths = ["/slow" if random.random() < slow_ratio else "/fast" for _ in range(total)]
+    queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                path = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies[path].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.async_db")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--slow-ratio", type=float, default=0.1)
+    parser.add_argument("--slow-seconds", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    # Both paths are compared whatever DATABASE_ASYNC says; engines are created on first use.
+    settings.database_async = True
+
+    random.seed(0)
+    print(f"{'mode':<10} {'path':<6} {'count':>6} {'p50 ms':>9} {'p99 ms':>9}")
+    for mode in ("blocking", "async"):
+        latencies, elapsed = asyncio.run(run(build_app(mode, args.slow_seconds), args.clients, args.requests, args.slow_ratio))
+        for path, values in latencies.items():
+            print(f"{mode:<10} {path:<6} {len(values):>6} {percentile(values, 50) * 1000:>9.1f} {percentile(values, 99) * 1000:>9.1f}")
+        print(f"{mode:<10} total  {args.requests:>6} {args.requests / elapsed:>9.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
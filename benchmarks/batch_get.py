@@ -0,0 +1,96 @@
+# Resolving a list of ids: one GET per id versus one batch get.
+#
+#   poetry run python -m benchmarks.load seed --database sqlite:///var/bench.sqlite --scale 0.1
+#   poetry run python -m benchmarks.batch_get --database sqlite:///var/bench.sqlite --rounds 50 --ids 50
+#
+# Each round draws --ids random anime ids, in-process. "per-id" is what a client
+# holding favourites or recommendation results does today: GET /animes/{id} for
+# each, all in flight together. "ids" is GET /animes?ids=..., "batchGet" is
+# POST /animes:batchGet. SQL statement counts come from the Server-Timing header.
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from benchmarks.anime_genres import _queries
+from benchmarks.load import Client, _configure
+
+
+async def per_id(http, ids):
+    responses = await asyncio.gather(*(http.get(f"/animes/{anime_id}") for anime_id in ids))
+    return len(responses), sum(_queries(response) for response in responses)
+
+
+async def query_ids(http, ids):
+    response = await http.get("/animes", params={"ids": ",".join(map(str, ids))})
+    response.raise_for_status()
+    return 1, _queries(response)
+
+
+async def batch_get(http, ids):
+    response = await http.post("/animes:batchGet", json={"ids": ids})
+    response.raise_for_status()
+    return 1, _queries(response)
+
+
+MODES = (("per-id", per_id), ("ids", query_ids), ("batchGet", batch_get))
+
+
+async def run(app, rounds: int, size: int, seed: int):
+    import httpx
+
+    from anirecs import database, models
+    from sqlalchemy import func, select
+
+    db = database.open_session()
+    try:
+        max_id = await db.scalar(select(func.max(models.Anime.id)))
+    finally:
+        await db.close()
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as http:
+        await Client(1).login(http)
+        for name, mode in MODES:
+            # Same draws for every mode. per-id runs first, so the detail cache is cold for it.
+            draws = random.Random(seed)
+            latencies, requests, queries = [], 0, 0
+            for _ in range(rounds):
+                ids = [draws.randint(1, max_id) for _ in range(size)]
+                started = time.perf_counter()
+                round_requests, round_queries = await mode(http, ids)
+                latencies.append(time.perf_counter() - started)
+                requests += round_requests
+                queries += round_queries
+            results[name] = latencies, requests, queries
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.batch_get")
+    parser.add_argument("--database", help="SQLAlchemy URL (default: settings)")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--ids", type=int, default=50, help="Ids per round")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    _configure(args.database)
+    from anirecs.config import settings
+    from anirecs.main import app
+
+    settings.server_timing = True
+
+    async def run_all():
+        async with app.router.lifespan_context(app):
+            return await run(app, args.rounds, args.ids, args.seed)
+
+    results = asyncio.run(run_all())
+    print(f"{args.rounds} rounds of {args.ids} ids")
+    print(f"{'mode':<10} {'req/round':>9} {'sql/round':>9} {'p50 ms':>9} {'mean ms':>9}")
+    for name, (latencies, requests, queries) in results.items():
+        rounds = len(latencies)
+        print(f"{name:<10} {requests / rounds:>9.1f} {queries / rounds:>9.1f} {statistics.median(latencies) * 1000:>9.1f} {statistics.mean(latencies) * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Checks that the reverse lookups on the association tables are served by an index.
+#
+#   alembic upgrade head
+#   poetry run python -m benchmarks.explain_indexes
+#
+# Runs EXPLAIN (FORMAT JSON) for the same statements the routers issue and exits
+# non-zero if a plan doesn't touch the expected index. Sequential scans are
+# disabled for the check, because on a small table the planner rightly prefers
+# them; what's asserted is that a usable index exists and matches the query.
+import argparse
+import json
+import sys
+
+from sqlalchemy import delete, select, text
+
+from anirecs import database, models
+
+HOT_QUERIES = [
+    (
+        "genres of an anime",
+        select(models.Genre).join(models.GenreAnime).filter(models.GenreAnime.anime_id == 1),
+        "ix_genreAnimes_anime_id",
+    ),
+    (
+        "delete links by anime",
+        delete(models.GenreAnime).where(models.GenreAnime.anime_id == 1),
+        "ix_genreAnimes_anime_id",
+    ),
+    (
+        "users who favourited an anime",
+        select(models.Favourite.user_id).where(models.Favourite.anime_id == 1),
+        "ix_favourites_anime_id",
+    ),
+    (
+        "users who prefer a genre",
+        select(models.Preference.user_id).where(models.Preference.genre_id == 1),
+        "ix_prefereces_genre_id",
+    ),
+]
+
+INDEX_NODES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+def index_scans(plan):
+    if plan.get("Node Type") in INDEX_NODES:
+        yield plan.get("Index Name")
+    for child in plan.get("Plans", ()):
+        yield from index_scans(child)
+
+
+def explain(connection, statement):
+    sql = statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    rows = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    return (json.loads(rows) if isinstance(rows, str) else rows)[0]["Plan"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.explain_indexes")
+    parser.add_argument("--verbose", action="store_true", help="Print every plan")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    with database.engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            connection.execute(text("SET LOCAL enable_seqscan = off"))
+            for name, statement, expected in HOT_QUERIES:
+                plan = explain(connection, statement)
+                used = list(index_scans(plan))
+                ok = expected in used
+                failures += not ok
+                print(f"{'ok' if ok else 'FAIL':<5} {name:<32} {', '.join(filter(None, used)) or plan['Node Type']}")
+                if args.verbose:
+                    print(json.dumps(plan, indent=2))
+        finally:
+            # EXPLAIN on the DELETE doesn't execute it, but never commit anything here.
+            transaction.rollback()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Import-time budget for the app module and for building the app.
+#
+#   poetry run python -m benchmarks.import_time
+#   poetry run python -m benchmarks.import_time --target create_app --budget-ms 2500 --top 20
+#
+# Each run is a fresh interpreter under `python -X importtime`, and the best of
+# --runs is compared with the budget, since a cold page cache or a busy machine
+# only ever makes a run slower. Exits non-zero when the budget is exceeded, or
+# when `import anirecs.main` pulls in a module from FORBIDDEN -- those belong
+# behind create_app() or first use, and are the usual way the budget regresses.
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+TARGETS = {
+    "import": "import anirecs.main",
+    "create_app": "from anirecs.main import create_app; create_app()",
+}
+# Nothing here needs a database, numpy or the routers just to import the module.
+FORBIDDEN = ("numpy", "scipy", "sqlalchemy", "anirecs.database", "anirecs.routers")
+DEFAULT_BUDGET_MS = {"import": 1000.0, "create_app": 3000.0}
+
+
+def measure(code: str, env):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode:
+        sys.exit(f"`{code}` failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules[name] = (int(self_us), int(cumulative_us))
+    return elapsed, modules
+
+
+def target_env(target: str):
+    env = dict(os.environ)
+    # Importing must work with no database settings at all.
+    if target == "import":
+        env = {key: value for key, value in env.items() if not key.startswith("DATABASE_")}
+    return env
+
+
+def best_run(runs):
+    return min(runs, key=lambda run: import_ms(run[1]))
+
+
+def import_ms(modules):
+    return sum(self_us for self_us, _ in modules.values()) / 1000
+
+
+def forbidden_imports(modules):
+    return sorted(name for name in modules if any(name == prefix or name.startswith(f"{prefix}.") for prefix in FORBIDDEN))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.import_time")
+    parser.add_argument("--target", choices=TARGETS, default="import")
+    parser.add_argument("--budget-ms", type=float, help="Fail if the best run's total import time exceeds this")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules (self time) to list")
+    args = parser.parse_args(argv)
+    budget_ms = args.budget_ms or DEFAULT_BUDGET_MS[args.target]
+
+    env = target_env(args.target)
+    wall, modules = best_run([measure(TARGETS[args.target], env) for _ in range(args.runs)])
+    total_ms = import_ms(modules)
+
+    print(f"{TARGETS[args.target]}")
+    print(f"  imports {total_ms:.0f} ms across {len(modules)} modules, interpreter wall {wall * 1000:.0f} ms (best of {args.runs})")
+    for name, (self_us, cumulative_us) in sorted(modules.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:>8.1f} ms self {cumulative_us / 1000:>8.1f} ms cumulative  {name}")
+
+    failures = []
+    if total_ms > budget_ms:
+        failures.append(f"import time {total_ms:.0f} ms is over the {budget_ms:.0f} ms budget")
+    if args.target == "import":
+        leaked = forbidden_imports(modules)
+        if leaked:
+            failures.append(f"`import anirecs.main` imported {', '.join(leaked[:10])}{' ...' if len(leaked) > 10 else ''}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+# Seeds a synthetic catalog and load-tests every router against it.
+#
+#   poetry run python -m benchmarks.load seed --database sqlite:///var/bench.sqlite
+#   poetry run python -m benchmarks.load run --database sqlite:///var/bench.sqlite --clients 32 --duration 30 --output var/bench/base.json
+#   poetry run python -m benchmarks.load run --target uvicorn --workers 4 --database postgresql://... --compare var/bench/base.json
+#   poetry run python -m benchmarks.load compare var/bench/base.json var/bench/new.json
+#
+# The default sizes are 100k animes, 1M genre links and 100k users with favourites
+# and preferences. --scale shrinks all of them for a quick local run. The remaining
+# settings (secret key etc.) come from .env as usual; --database overrides the URL.
+#
+# "inprocess" drives the ASGI app through httpx.ASGITransport, so only the app is
+# measured. "uvicorn" starts real server processes (or uses --url) and adds the
+# HTTP stack. Results are per endpoint: throughput and p50/p95/p99 latency. They
+# are written as JSON so that `compare` can flag regressions against a baseline.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+PASSWORD = "benchmark"
+SEED = 1234
+WORDS = (
+    "sword magic school robot space ninja pirate demon hero love detective music sports horror idol dragon "
+    "mecha samurai vampire ghost island city winter summer festival train star ocean forest kingdom war peace "
+    "friend rival teacher student family secret dream memory future past time world"
+).split()
+
+
+def _configure(database):
+    # Settings are read when anirecs is first imported, so this has to run before that.
+    if database:
+        os.environ["DATABASE_URL"] = database
+
+
+def _batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def seed(args):
+    from sqlalchemy import delete, func, insert, select
+
+    from anirecs import database, models, utils
+
+    rng = np.random.default_rng(SEED)
+    animes = int(args.animes * args.scale)
+    users = int(args.users * args.scale)
+    links_per_anime = max(1, min(args.genres, round(args.links * args.scale / max(animes, 1))))
+    started = time.perf_counter()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.engine.begin() as connection:
+        if connection.execute(select(func.count()).select_from(models.Anime)).scalar() and not args.force:
+            sys.exit("Database already has animes; pass --force to wipe and reseed")
+        for model in (models.UserRecommendation, models.Favourite, models.Preference, models.GenreAnime, models.Anime, models.Genre, models.User):
+            connection.execute(delete(model))
+
+        connection.execute(insert(models.Genre), [{"id": i, "name": f"genre {i}"} for i in range(1, args.genres + 1)])
+
+        for batch in _batches(np.arange(1, animes + 1), args.batch_size):
+            words = rng.integers(0, len(WORDS), size=(len(batch), 24))
+            ratings = rng.integers(1, 11, size=len(batch))
+            connection.execute(insert(models.Anime), [
+                {"id": int(anime_id), "title": f"{WORDS[row[0]]} {WORDS[row[1]]} {anime_id}", "description": " ".join(WORDS[w] for w in row[2:]), "rating": int(rating)}
+                for anime_id, row, rating in zip(batch, words, ratings)
+            ])
+
+        # Each anime gets links_per_anime distinct genres: the first k columns of a random permutation per row.
+        for batch in _batches(np.arange(1, animes + 1), args.batch_size):
+            genres = np.argsort(rng.random((len(batch), args.genres)), axis=1)[:, :links_per_anime] + 1
+            connection.execute(insert(models.GenreAnime), [
+                {"genre_id": int(genre_id), "anime_id": int(anime_id)} for anime_id, row in zip(batch, genres) for genre_id in row
+            ])
+
+        # One bcrypt hash shared by every user; hashing 100k passwords would dominate the seed.
+        password = utils.hash(PASSWORD)
+        for batch in _batches(np.arange(1, users + 1), args.batch_size):
+            connection.execute(insert(models.User), [{"id": int(user_id), "username": f"bench{user_id}", "password": password} for user_id in batch])
+            preferences = np.argsort(rng.random((len(batch), args.genres)), axis=1)[:, :args.preferences_per_user] + 1
+            connection.execute(insert(models.Preference), [
+                {"user_id": int(user_id), "genre_id": int(genre_id)} for user_id, row in zip(batch, preferences) for genre_id in row
+            ])
+            favourites = rng.integers(1, animes + 1, size=(len(batch), args.favourites_per_user))
+            connection.execute(insert(models.Favourite), [
+                {"user_id": int(user_id), "anime_id": int(anime_id)} for user_id, row in zip(batch, favourites) for anime_id in np.unique(row)
+            ])
+
+        if connection.dialect.name == "postgresql":
+            # Explicit ids leave the sequences behind; the API's own inserts would collide.
+            for table in ("users", "genres", "animes"):
+                connection.exec_driver_sql(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))")
+    print(f"Seeded {animes} animes, {animes * links_per_anime} genre links, {users} users in {time.perf_counter() - started:.1f}s")
+
+
+def _uniform(limit):
+    return lambda rng: rng.randint(1, limit)
+
+
+def endpoints(sizes):
+    # name -> (weight, method, path(rng, client), request kwargs(rng, client))
+    anime, genre, user = _uniform(sizes["animes"]), _uniform(sizes["genres"]), _uniform(sizes["users"])
+    return {
+        "auth.login": (0.5, "POST", lambda r, c: "/login", lambda r, c: {"params": {"username": c.username, "password": PASSWORD}}),
+        "auth.refresh": (1, "POST", lambda r, c: "/refresh", lambda r, c: {"params": {"refresh_token": c.refresh_token}}),
+        "users.me": (5, "GET", lambda r, c: "/users/me", None),
+        "users.get": (3, "GET", lambda r, c: f"/users/{user(r)}", None),
+        "users.list": (2, "GET", lambda r, c: "/users?limit=50", None),
+        "genres.list": (4, "GET", lambda r, c: "/genres", None),
+        "genres.get": (4, "GET", lambda r, c: f"/genres/{genre(r)}", None),
+        "animes.list": (6, "GET", lambda r, c: "/animes?limit=50", None),
+        "animes.get": (15, "GET", lambda r, c: f"/animes/{anime(r)}", None),
+        "animes.search": (3, "GET", lambda r, c: f"/animes?search={r.choice(WORDS)}&limit=20", None),
+        "genre_anime.list": (2, "GET", lambda r, c: "/genre-anime?limit=100", None),
+        "genre_anime.by_anime": (8, "GET", lambda r, c: f"/genre-anime/anime/{anime(r)}", None),
+        "genre_anime.by_genre": (0.5, "GET", lambda r, c: f"/genre-anime/genre/{genre(r)}", None),
+        "favourites.list": (8, "GET", lambda r, c: f"/user/favourites/{user(r)}?limit=50", None),
+        "favourites.add": (4, "POST", lambda r, c: "/user/addfavourites", lambda r, c: {"json": {"user_id": c.user_id, "anime_id": anime(r)}}),
+        "favourites.remove": (2, "DELETE", lambda r, c: f"/user/removefavourites/{c.user_id}/{anime(r)}", None),
+        "preferences.list": (6, "GET", lambda r, c: f"/preferences/{user(r)}", None),
+        "preferences.add": (2, "POST", lambda r, c: "/user/addpreferences", lambda r, c: {"json": {"user_id": c.user_id, "genre_id": genre(r)}}),
+        "recommendations.get": (6, "GET", lambda r, c: f"/recommendations/{user(r)}?limit=20", None),
+        "export.animes": (0.05, "GET", lambda r, c: "/export/animes", None),
+        "metrics": (0.5, "GET", lambda r, c: "/metrics", None),
+    }
+
+
+def parse_mix(text, available):
+    mix = {name: spec[0] for name, spec in available.items()}
+    for item in filter(None, (text or "").split(",")):
+        name, _, weight = item.partition("=")
+        if name not in available:
+            sys.exit(f"Unknown endpoint {name!r}; choose from {', '.join(available)}")
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+class Client:
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.username = f"bench{user_id}"
+        self.refresh_token = None
+
+    async def login(self, http):
+        response = await http.post("/login", params={"username": self.username, "password": PASSWORD})
+        response.raise_for_status()
+        tokens = response.json()
+        self.refresh_token = tokens["refresh_token"]
+        http.headers["Authorization"] = f"Bearer {tokens['access_token']}"
+
+
+async def drive(http_factory, sizes, mix, clients: int, duration: float, requests: int, warmup: int):
+    available = endpoints(sizes)
+    names, weights = list(mix), list(mix.values())
+    latencies = {name: [] for name in names}
+    statuses = {name: {} for name in names}
+    errors = {name: 0 for name in names}
+    remaining = [requests]
+    warmed = [0]
+    ready = asyncio.Event()
+    deadline = [float("inf")]
+
+    async def run_client(index):
+        rng = random.Random(SEED + index)
+        client = Client(1 + index % sizes["users"])
+        async with http_factory() as http:
+            await client.login(http)
+            for _ in range(warmup):
+                await _request(http, available[rng.choices(names, weights)[0]], rng, client)
+            warmed[0] += 1
+            await ready.wait()
+            while time.perf_counter() < deadline[0] and (requests is None or remaining[0] > 0):
+                if requests is not None:
+                    remaining[0] -= 1
+                name = rng.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    status_code = await _request(http, available[name], rng, client)
+                except Exception:
+                    errors[name] += 1
+                    continue
+                latencies[name].append(time.perf_counter() - started)
+                statuses[name][status_code] = statuses[name].get(status_code, 0) + 1
+                if status_code >= 500:
+                    errors[name] += 1
+
+    tasks = [asyncio.create_task(run_client(index)) for index in range(clients)]
+    # Every client logs in and warms up before the clock starts.
+    while warmed[0] < clients and not any(task.done() for task in tasks):
+        await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    if duration:
+        deadline[0] = started + duration
+    ready.set()
+    await asyncio.gather(*tasks)
+    return latencies, statuses, errors, time.perf_counter() - started
+
+
+async def _request(http, spec, rng, client):
+    _, method, path, kwargs = spec
+    response = await http.request(method, path(rng, client), **(kwargs(rng, client) if kwargs else {}))
+    await response.aread()
+    return response.status_code
+
+
+def summarize(latencies, statuses, errors, elapsed):
+    results = {}
+    for name, values in latencies.items():
+        values = np.asarray(values) * 1000
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (float("nan"),) * 3
+        results[name] = {
+            "count": int(len(values)),
+            "errors": errors[name],
+            "throughput": len(values) / elapsed if elapsed else 0.0,
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "statuses": {str(code): count for code, count in sorted(statuses[name].items())},
+        }
+    every = np.concatenate([np.asarray(values) for values in latencies.values()]) * 1000 if latencies else np.empty(0)
+    total_p50, total_p95, total_p99 = np.percentile(every, [50, 95, 99]) if len(every) else (float("nan"),) * 3
+    total = {
+        "count": int(len(every)),
+        "errors": sum(errors.values()),
+        "throughput": len(every) / elapsed if elapsed else 0.0,
+        "p50_ms": float(total_p50),
+        "p95_ms": float(total_p95),
+        "p99_ms": float(total_p99),
+        "elapsed_s": elapsed,
+    }
+    return results, total
+
+
+def print_table(results, total):
+    print(f"{'endpoint':<24} {'count':>7} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in sorted(results.items()):
+        print(f"{name:<24} {row['count']:>7} {row['errors']:>5} {row['throughput']:>9.1f} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+    print(f"{'total':<24} {total['count']:>7} {total['errors']:>5} {total['throughput']:>9.1f} {total['p50_ms']:>9.2f} {total['p95_ms']:>9.2f} {total['p99_ms']:>9.2f}")
+
+
+def dataset_sizes():
+    from sqlalchemy import func, select
+
+    from anirecs import database, models
+
+    with database.engine.connect() as connection:
+        sizes = {
+            "animes": connection.execute(select(func.max(models.Anime.id))).scalar() or 0,
+            "genres": connection.execute(select(func.max(models.Genre.id))).scalar() or 0,
+            "users": connection.execute(select(func.max(models.User.id))).scalar() or 0,
+            "genre_links": connection.execute(select(func.count()).select_from(models.GenreAnime)).scalar(),
+        }
+    if not all(sizes[key] for key in ("animes", "genres", "users")):
+        sys.exit("Database is empty; run `python -m benchmarks.load seed` first")
+    return sizes
+
+
+async def _inprocess(sizes, mix, args):
+    import httpx
+
+    from anirecs.main import app
+
+    def http_factory():
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+
+    # ASGITransport doesn't send lifespan events, so run startup/shutdown here. Shutdown
+    # also closes the pooled async connections on this loop, before it goes away.
+    async with app.router.lifespan_context(app):
+        return await drive(http_factory, sizes, mix, args.clients, args.duration, args.requests, args.warmup)
+
+
+async def _http(url, sizes, mix, args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+
+    def http_factory():
+        return httpx.AsyncClient(base_url=url, timeout=None, limits=limits)
+
+    return await drive(http_factory, sizes, mix, args.clients, args.duration, args.requests, args.warmup)
+
+
+def _wait_until_up(url, server, timeout: float = 30.0):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"uvicorn exited with status {server.returncode}")
+        try:
+            if httpx.get(f"{url}/").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    sys.exit("uvicorn did not come up in time")
+
+
+def run(args):
+    sizes = dataset_sizes()
+    from anirecs.config import settings
+
+    available = endpoints(sizes)
+    mix = parse_mix(args.mix, available)
+    random.seed(SEED)
+
+    server = None
+    if args.target == "inprocess":
+        latencies, statuses, errors, elapsed = asyncio.run(_inprocess(sizes, mix, args))
+    else:
+        url = args.url
+        if url is None:
+            url = f"http://127.0.0.1:{args.port}"
+            command = [sys.executable, "-m", "uvicorn", "anirecs.main:app", "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"]
+            server = subprocess.Popen(command, env=os.environ.copy())
+            _wait_until_up(url, server)
+        try:
+            latencies, statuses, errors, elapsed = asyncio.run(_http(url, sizes, mix, args))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    results, total = summarize(latencies, statuses, errors, elapsed)
+    print_table(results, total)
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "target": args.target,
+            "workers": args.workers if args.target == "uvicorn" and args.url is None else None,
+            "clients": args.clients,
+            "duration": args.duration,
+            "requests": args.requests,
+            "mix": mix,
+            "dataset": sizes,
+            "dialect": settings.database_url.split(":", 1)[0] if settings.database_url else "postgresql",
+            "database_async": settings.database_async,
+            "python": platform.python_version(),
+            "commit": _git_commit(),
+        },
+        "endpoints": results,
+        "total": total,
+    }
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+        print(f"Wrote {args.output}")
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        sys.exit(compare_reports(baseline, report, args.tolerance))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_reports(baseline, current, tolerance: float):
+    # Exit status 1 when any endpoint's p95 got slower, or its throughput lower,
+    # by more than the tolerance (a fraction: 0.1 == 10%).
+    regressions = 0
+    print(f"{'endpoint':<24} {'p50 ms':>17} {'p95 ms':>17} {'p99 ms':>17} {'req/s':>17}")
+    rows = list(current["endpoints"].items()) + [("total", current["total"])]
+    for name, row in rows:
+        before = baseline["total"] if name == "total" else baseline["endpoints"].get(name)
+        if before is None or not before["count"] or not row["count"]:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput"):
+            change = (row[key] - before[key]) / before[key] if before[key] else 0.0
+            cells.append(f"{row[key]:>8.2f} ({change:+6.1%})")
+        slower = before["p95_ms"] and (row["p95_ms"] - before["p95_ms"]) / before["p95_ms"] > tolerance
+        fewer = before["throughput"] and (before["throughput"] - row["throughput"]) / before["throughput"] > tolerance
+        flag = "  REGRESSION" if slower or fewer else ""
+        regressions += bool(flag)
+        print(f"{name:<24} {' '.join(cells)}{flag}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subcommands.add_parser("seed", help="Fill the database with a synthetic catalog")
+    seed_parser.add_argument("--database", help="SQLAlchemy URL, e.g. sqlite:///var/bench.sqlite (default: settings)")
+    seed_parser.add_argument("--animes", type=int, default=100_000)
+    seed_parser.add_argument("--genres", type=int, default=40)
+    seed_parser.add_argument("--links", type=int, default=1_000_000)
+    seed_parser.add_argument("--users", type=int, default=100_000)
+    seed_parser.add_argument("--favourites-per-user", type=int, default=20)
+    seed_parser.add_argument("--preferences-per-user", type=int, default=3)
+    seed_parser.add_argument("--scale", type=float, default=1.0, help="Multiply anime, link and user counts")
+    seed_parser.add_argument("--batch-size", type=int, default=10_000)
+    seed_parser.add_argument("--force", action="store_true", help="Wipe existing rows first")
+
+    run_parser = subcommands.add_parser("run", help="Load-test the API against a seeded database")
+    run_parser.add_argument("--database", help="SQLAlchemy URL (default: settings)")
+    run_parser.add_argument("--target", choices=("inprocess", "uvicorn"), default="inprocess")
+    run_parser.add_argument("--url", help="Existing server to hit instead of starting uvicorn")
+    run_parser.add_argument("--port", type=int, default=8765)
+    run_parser.add_argument("--workers", type=int, default=1)
+    run_parser.add_argument("--clients", type=int, default=32)
+    run_parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run for (0: until --requests are done)")
+    run_parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests in total")
+    run_parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per client before measuring")
+    run_parser.add_argument("--mix", help="Override endpoint weights, e.g. animes.get=30,export.animes=0")
+    run_parser.add_argument("--output", help="Write the results to this JSON file")
+    run_parser.add_argument("--compare", help="Baseline JSON to compare against; exits 1 on regression")
+    run_parser.add_argument("--tolerance", type=float, default=0.1)
+
+    compare_parser = subcommands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+        sys.exit(compare_reports(baseline, current, args.tolerance))
+
+    _configure(args.database)
+    if args.command == "seed":
+        seed(args)
+    else:
+        if not args.duration and args.requests is None:
+            parser.error("pass --duration or --requests")
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Most-favourited animes: COUNT(*) GROUP BY over favourites per request versus
+# the flushed counters behind GET /animes/popular.
+#
+#   poetry run python -m benchmarks.load seed --database sqlite:///var/bench.sqlite --scale 0.1
+#   poetry run python -m benchmarks.popularity --database sqlite:///var/bench.sqlite --requests 200
+#
+# Needs the anime_stats table (alembic upgrade 0003). "group-by" runs the query a
+# popularity endpoint would need without counters; "counters" is GET /animes/popular,
+# which slices the leaderboard refreshed after each flush. Both return the top --limit.
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.load import Client, _configure
+
+
+def _report(name, latencies):
+    print(f"{name:<10} {statistics.median(latencies) * 1000:>9.2f} {statistics.mean(latencies) * 1000:>9.2f} {len(latencies) / sum(latencies):>9.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.popularity")
+    parser.add_argument("--database", help="SQLAlchemy URL (default: settings)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    _configure(args.database)
+    from anirecs.config import settings
+
+    settings.popularity_enabled = True
+    from sqlalchemy import func, select
+
+    from anirecs import database, models
+    from anirecs.main import app
+
+    group_by = (
+        select(models.Anime.id, models.Anime.title, func.count().label("favourites"))
+        .join(models.Favourite, models.Favourite.anime_id == models.Anime.id)
+        .group_by(models.Anime.id, models.Anime.title)
+        .order_by(func.count().desc(), models.Anime.id.desc())
+        .limit(args.limit)
+    )
+
+    async def run_all():
+        import httpx
+
+        results = {}
+        async with app.router.lifespan_context(app):
+            db = database.open_session()
+            try:
+                latencies = []
+                for _ in range(args.requests):
+                    started = time.perf_counter()
+                    (await db.execute(group_by)).all()
+                    latencies.append(time.perf_counter() - started)
+                results["group-by"] = latencies
+            finally:
+                await db.close()
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as http:
+                await Client(1).login(http)
+                (await http.get("/animes/popular", params={"limit": args.limit})).raise_for_status()
+                latencies = []
+                for _ in range(args.requests):
+                    started = time.perf_counter()
+                    (await http.get("/animes/popular", params={"limit": args.limit})).raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+                results["counters"] = latencies
+        return results
+
+    results = asyncio.run(run_all())
+    print(f"top {args.limit}, {args.requests} requests; group-by is the query alone, counters the whole request")
+    print(f"{'mode':<10} {'p50 ms':>9} {'mean ms':>9} {'per s':>9}")
+    for name, latencies in results.items():
+        _report(name, latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Throughput of a large list page with and without the orjson fast path.
+#
+#   poetry run python -m benchmarks.load seed --database sqlite:///var/bench.sqlite --scale 0.1
+#   poetry run python -m benchmarks.serialization --database sqlite:///var/bench.sqlite --limit 10000
+#
+# Both modes run in-process against the same app and page. Only
+# settings.response_fast_json is flipped between them, so the difference is the
+# response_model validation plus jsonable_encoder versus handing rows to orjson.
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks.load import Client, _configure
+
+
+async def measure(app, path: str, seconds: float, clients: int):
+    import httpx
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as http:
+        await Client(1).login(http)
+        body = (await http.get(path)).content
+        done = 0
+        deadline = time.perf_counter() + seconds
+
+        async def worker():
+            nonlocal done
+            while time.perf_counter() < deadline:
+                response = await http.get(path)
+                response.raise_for_status()
+                done += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        return done / (time.perf_counter() - started), body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialization")
+    parser.add_argument("--database", help="SQLAlchemy URL (default: settings)")
+    parser.add_argument("--limit", type=int, default=10_000)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    _configure(args.database)
+    os.environ["PAGE_SIZE_MAX"] = str(max(args.limit, 1000))
+    from anirecs import database
+    from anirecs.config import settings
+    from anirecs.main import app
+
+    path = f"/animes?limit={args.limit}"
+    results = {}
+
+    async def run_all():
+        try:
+            for fast in (False, True):
+                settings.response_fast_json = fast
+                results[fast] = await measure(app, path, args.seconds, args.clients)
+        finally:
+            await database.dispose()
+
+    asyncio.run(run_all())
+    (slow_rate, slow_body), (fast_rate, fast_body) = results[False], results[True]
+    # The fast path is only a win if clients can't tell the difference.
+    if slow_body != fast_body:
+        sys.exit("response_fast_json changed the response body")
+    print(f"GET {path}: {len(slow_body) / 1024:.0f} KiB per response")
+    print(f"{'pydantic':<10} {slow_rate:>8.1f} req/s")
+    print(f"{'orjson':<10} {fast_rate:>8.1f} req/s  ({fast_rate / slow_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import asyncio
+import os
+
+import pytest
+
+# Settings has required fields without defaults. The tests don't connect with these;
+# anything already in the environment (or .env) takes precedence.
+for name, value in {
+    "DATABASE_HOSTNAME": "localhost",
+    "DATABASE_PORT": "5432",
+    "DATABASE_PASSWORD": "postgres",
+    "DATABASE_NAME": "anirecs",
+    "DATABASE_USERNAME": "postgres",
+    "SECRET_KEY": "test-secret-key",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "REFRESH_TOKEN_EXPIRE_DAYS": "7",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    # The app, with its lifespan running, on a fresh SQLite database. Per-worker caches
+    # are swapped for empty ones so nothing leaks in from another test.
+    pytest.importorskip("aiosqlite")
+    from fastapi.testclient import TestClient
+
+    from anirecs import cache, database, models, recommender, search
+    from anirecs.config import settings
+    from anirecs.main import create_app
+    from anirecs.response_cache import response_cache
+
+    asyncio.run(database.dispose())
+    monkeypatch.setattr(settings, "database_url", f"sqlite:///{tmp_path / 'anirecs.sqlite'}")
+    monkeypatch.setattr(response_cache, "backend", cache.MemoryBackend(settings.cache_max_entries, settings.cache_ttl_seconds))
+    monkeypatch.setattr(search, "_indexes", {})
+    monkeypatch.setattr(search, "_built_at", {})
+    monkeypatch.setattr(search, "_rebuilds", {})
+    monkeypatch.setattr(search, "_lock", None)
+    monkeypatch.setattr(recommender, "_recommender", None)
+    models.Base.metadata.create_all(database.engine)
+    with TestClient(create_app()) as client:
+        yield client
+
+
+@pytest.fixture
+def auth_headers(client):
+    client.post("/register", json={"username": "tester", "password": "secret"})
+    token = client.post("/login", params={"username": "tester", "password": "secret"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,78 @@
+import pytest
+
+from anirecs.config import settings
+
+
+@pytest.fixture
+def catalog(client, auth_headers):
+    # Genres 1-2 and animes 1-3.
+    for name in ("Action", "Drama"):
+        client.post("/genres", json={"name": name}, headers=auth_headers)
+    animes = [{"title": f"Anime {i}", "description": "words", "rating": 5} for i in range(3)]
+    assert [anime["id"] for anime in client.post("/animes/bulk", json=animes, headers=auth_headers).json()] == [1, 2, 3]
+
+
+def test_bulk_create_links_reports_a_status_per_item(client, auth_headers, catalog):
+    client.post("/genre-anime", json={"genre_id": 1, "anime_id": 1}, headers=auth_headers)
+    items = [
+        {"genre_id": 1, "anime_id": 2},
+        {"genre_id": 1, "anime_id": 2},
+        {"genre_id": 1, "anime_id": 1},
+        {"genre_id": 9, "anime_id": 1},
+        {"genre_id": 2, "anime_id": 9},
+        {"genre_id": 2, "anime_id": 3},
+    ]
+    response = client.post("/genre-anime/bulk", json=items, headers=auth_headers)
+    assert [item["status"] for item in response.json()] == ["created", "duplicate", "conflict", "genre_not_found", "anime_not_found", "created"]
+    links = client.get("/genre-anime", headers=auth_headers).json()
+    assert {(link["genre_id"], link["anime_id"]) for link in links} == {(1, 1), (1, 2), (2, 3)}
+
+
+def test_bulk_delete_links_reports_a_status_per_item(client, auth_headers, catalog):
+    client.post("/genre-anime/bulk", json=[{"genre_id": 1, "anime_id": 1}, {"genre_id": 2, "anime_id": 2}], headers=auth_headers)
+    items = [{"genre_id": 1, "anime_id": 1}, {"genre_id": 1, "anime_id": 2}]
+    response = client.post("/genre-anime/bulk-delete", json=items, headers=auth_headers)
+    assert [item["status"] for item in response.json()] == ["deleted", "not_found"]
+    assert client.get("/genre-anime", headers=auth_headers).json() == [{"genre_id": 2, "anime_id": 2}]
+
+
+def test_bulk_delete_animes(client, auth_headers, catalog):
+    response = client.post("/animes/bulk-delete", json=[3, 9, 1], headers=auth_headers)
+    assert response.json() == [{"id": 3, "status": "deleted"}, {"id": 9, "status": "not_found"}, {"id": 1, "status": "deleted"}]
+    assert [anime["id"] for anime in client.get("/animes", headers=auth_headers).json()] == [2]
+
+
+def test_bulk_unfavourite_only_touches_the_callers_favourites(client, auth_headers, catalog):
+    items = [{"user_id": 1, "anime_id": 1}, {"user_id": 1, "anime_id": 2}]
+    assert [item["status"] for item in client.post("/user/addfavourites/bulk", json=items + [{"user_id": 1, "anime_id": 9}], headers=auth_headers).json()] == ["created", "created", "anime_not_found"]
+    items = [{"user_id": 1, "anime_id": 1}, {"user_id": 2, "anime_id": 2}, {"user_id": 1, "anime_id": 3}]
+    response = client.post("/user/removefavourites/bulk", json=items, headers=auth_headers)
+    assert [item["status"] for item in response.json()] == ["deleted", "forbidden", "not_found"]
+
+
+def test_bulk_rejects_too_many_items(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_max_items", 1)
+    items = [{"genre_id": 1, "anime_id": 1}, {"genre_id": 1, "anime_id": 2}]
+    assert client.post("/genre-anime/bulk", json=items, headers=auth_headers).status_code == 400
+
+
+@pytest.mark.parametrize("path, values, detail", [
+    ("/genre-anime", {"genre_id": 9, "anime_id": 1}, "Genre not found"),
+    ("/genre-anime", {"genre_id": 1, "anime_id": 9}, "Anime not found"),
+    ("/user/addfavourites", {"user_id": 9, "anime_id": 1}, "User not found"),
+    ("/user/addfavourites", {"user_id": 1, "anime_id": 9}, "Anime not found"),
+    ("/user/addpreferences", {"user_id": 1, "genre_id": 9}, "Genre not found"),
+])
+def test_create_link_reports_the_missing_parent(client, auth_headers, catalog, path, values, detail):
+    response = client.post(path, json=values, headers=auth_headers)
+    assert (response.status_code, response.json()["detail"]) == (404, detail)
+
+
+@pytest.mark.parametrize("path, values", [
+    ("/genre-anime", {"genre_id": 1, "anime_id": 1}),
+    ("/user/addfavourites", {"user_id": 1, "anime_id": 1}),
+    ("/user/addpreferences", {"user_id": 1, "genre_id": 1}),
+])
+def test_create_link_conflicts_on_an_existing_link(client, auth_headers, catalog, path, values):
+    assert client.post(path, json=values, headers=auth_headers).status_code in (200, 201)
+    assert client.post(path, json=values, headers=auth_headers).status_code == 409
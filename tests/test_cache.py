@@ -0,0 +1,70 @@
+import asyncio
+
+from anirecs.cache import RedisBackend, TTLCache
+
+
+class FakeRedis:
+    # The subset of redis.asyncio.Redis that RedisBackend uses; values come back as bytes.
+    def __init__(self):
+        self.values = {}
+        self.expiry = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value if isinstance(value, bytes) else str(value).encode()
+        self.expiry[key] = ex
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+    async def incr(self, key):
+        value = int(self.values.get(key, b"0")) + 1
+        self.values[key] = str(value).encode()
+        return value
+
+
+def test_redis_backend_prefixes_keys_and_rounds_ttl():
+    client = FakeRedis()
+    backend = RedisBackend(client, prefix="test:")
+
+    async def run():
+        await backend.set("a", b"1", 0.2)
+        await backend.set("b", b"2", 30.9)
+        return await backend.get("a"), await backend.get("missing")
+
+    assert asyncio.run(run()) == (b"1", None)
+    assert client.expiry == {"test:a": 1, "test:b": 30}
+
+
+def test_redis_backend_delete_and_counters():
+    client = FakeRedis()
+    backend = RedisBackend(client, prefix="test:")
+
+    async def run():
+        await backend.set("a", b"1", 10)
+        await backend.delete("a")
+        assert await backend.get_counter("hits") == 0
+        await backend.incr("hits")
+        await backend.incr("hits")
+        return await backend.get("a"), await backend.get_counter("hits")
+
+    assert asyncio.run(run()) == (None, 2)
+    assert client.values["test:hits"] == b"2"
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1, ttl=0)
+    assert cache.get("a", "missing") == "missing"
+    assert len(cache) == 0
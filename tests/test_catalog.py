@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from anirecs import catalog, models
+from anirecs.catalog import CatalogSnapshot
+from anirecs.config import settings
+
+
+def test_adjacency_groups_columns_by_row():
+    indptr, columns = catalog._adjacency(np.array([2, 0, 2, 1]), np.array([5, 3, 1, 4]), 4)
+    assert indptr.tolist() == [0, 1, 2, 4, 4]
+    assert columns.tolist() == [3, 4, 1, 5]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    created_at = datetime(2024, 6, 1, 12, 30, 15, 123456)
+    with Session(engine) as db:
+        db.add_all([
+            models.Anime(id=3, title="Kōkaku Kidōtai", description="", rating=9, created_at=created_at),
+            models.Anime(id=7, title="Mushishi", description="Ginko travels", rating=8, created_at=created_at),
+            models.Anime(id=9, title="Unlinked", description="No genres", rating=1, created_at=created_at),
+        ])
+        db.add_all([models.Genre(id=1, name="Sci-Fi", created_at=created_at), models.Genre(id=2, name="Mystery", created_at=created_at), models.Genre(id=5, name="Empty", created_at=created_at)])
+        db.flush()
+        db.add_all([models.GenreAnime(genre_id=2, anime_id=7), models.GenreAnime(genre_id=1, anime_id=3), models.GenreAnime(genre_id=2, anime_id=3)])
+        db.commit()
+        yield db
+    engine.dispose()
+
+
+def test_snapshot_round_trip(db, tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    assert catalog.build(db, path) == (3, 3, 3)
+    snapshot = CatalogSnapshot.load(path)
+
+    assert snapshot.animes_in_genre(2) == [
+        {"id": 3, "title": "Kōkaku Kidōtai", "description": "", "rating": 9, "created_at": datetime(2024, 6, 1, 12, 30, 15, 123456)},
+        {"id": 7, "title": "Mushishi", "description": "Ginko travels", "rating": 8, "created_at": datetime(2024, 6, 1, 12, 30, 15, 123456)},
+    ]
+    assert [genre["name"] for genre in snapshot.genres_of_anime(3)] == ["Sci-Fi", "Mystery"]
+    assert snapshot.genres_of_anime(9) == [] and snapshot.animes_in_genre(5) == []
+    assert snapshot.animes_in_genre(4) == [] and snapshot.genres_of_anime(8) == []
+    assert snapshot.built_at.tzinfo is timezone.utc
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "catalog.snapshot"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        CatalogSnapshot.load(str(path))
+
+
+def test_genre_endpoint_reads_the_same_from_the_snapshot(client, auth_headers, monkeypatch, tmp_path):
+    for name in ("Action", "Drama"):
+        client.post("/genres", json={"name": name}, headers=auth_headers)
+    client.post("/animes/bulk", json=[{"title": f"Anime {i}", "description": "words", "rating": i} for i in range(3)], headers=auth_headers)
+    client.post("/genre-anime/bulk", json=[{"genre_id": 1, "anime_id": 3}, {"genre_id": 1, "anime_id": 1}, {"genre_id": 2, "anime_id": 2}], headers=auth_headers)
+    from_db = client.get("/genre-anime/genre/1", headers=auth_headers).json()
+
+    monkeypatch.setattr(settings, "catalog_snapshot", True)
+    monkeypatch.setattr(settings, "catalog_snapshot_path", str(tmp_path / "catalog.snapshot"))
+    monkeypatch.setattr(catalog, "_snapshot", None)
+    catalog._rebuild()
+    assert catalog.get_snapshot() is not None
+    from_snapshot = client.get("/genre-anime/genre/1", headers=auth_headers).json()
+    assert from_snapshot == sorted(from_db, key=lambda anime: anime["id"])
+    assert client.get("/genre-anime/genre/9", headers=auth_headers).status_code == 404
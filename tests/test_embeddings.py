@@ -0,0 +1,99 @@
+import asyncio
+import glob
+import os
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from anirecs import database, embeddings, models
+from anirecs.config import settings
+from anirecs.embeddings import ContentIndex
+
+ANIMES = [
+    (1, "Space Pirates", "A pirate crew sails a ship through outer space"),
+    (2, "Space Pirates Return", "The pirate crew sails their ship through space again"),
+    (3, "Cooking Club", "High school students cook dinner in the club room"),
+    (4, "Baking Club", "High school students bake bread in the club room"),
+]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add_all([models.Anime(id=anime_id, title=title, description=description, rating=5) for anime_id, title, description in ANIMES])
+        db.commit()
+        yield db
+    engine.dispose()
+
+
+def build(db, path):
+    return embeddings.build(db, str(path), dim=64, n_features=4096, tables=4, bits=4)
+
+
+def test_similar_ranks_the_closest_content_first(db, tmp_path):
+    path = tmp_path / "index.npz"
+    assert build(db, path) == 4
+    index = ContentIndex.load(str(path))
+    assert index.anime_ids.tolist() == [1, 2, 3, 4]
+    assert np.allclose(np.linalg.norm(index.vectors, axis=1), 1.0)
+
+    # With 4 animes every candidate set is re-ranked exactly, whatever the random planes.
+    assert index.similar(1, "", "", 3)[0][0] == 2
+    assert index.similar(4, "", "", 3)[0][0] == 3
+    animes, scores = index.similar(3, "", "", 10)
+    assert sorted(animes) == [1, 2, 4] and animes[0] == 4
+    assert scores == sorted(scores, reverse=True)
+    # Animes added after the build are embedded from their text.
+    assert index.similar(99, "Pirates in Space", "A crew of space pirates", 3)[0][0] in (1, 2)
+
+
+def test_candidates_include_the_vectors_own_bucket(db, tmp_path):
+    path = tmp_path / "index.npz"
+    build(db, path)
+    index = ContentIndex.load(str(path))
+    for position in range(len(index.anime_ids)):
+        assert position in index.candidates(np.asarray(index.vectors[position]))
+
+
+def test_build_keeps_the_previous_vectors_file(db, tmp_path):
+    path = tmp_path / "index.npz"
+    generations = []
+    for _ in range(3):
+        build(db, path)
+        generations.append(embeddings._vectors_file(str(path)))
+    on_disk = sorted(os.path.basename(name) for name in glob.glob(str(tmp_path / "index.*.npy")))
+    assert on_disk == sorted(generations[1:])
+
+
+def test_get_index_reloads_when_the_file_changes(monkeypatch, db, tmp_path):
+    path = tmp_path / "index.npz"
+    monkeypatch.setattr(settings, "embedding_index_path", str(path))
+    monkeypatch.setattr(embeddings, "_index", None)
+    monkeypatch.setattr(embeddings, "_index_mtime", None)
+
+    assert asyncio.run(embeddings.get_index()) is None
+    build(db, path)
+    first = asyncio.run(embeddings.get_index())
+    assert asyncio.run(embeddings.get_index()) is first
+    mtime = os.stat(path).st_mtime + 10
+    os.utime(path, (mtime, mtime))
+    second = asyncio.run(embeddings.get_index())
+    assert second is not first
+    assert second.anime_ids.tolist() == [1, 2, 3, 4]
+
+
+def test_similar_endpoint(client, auth_headers, monkeypatch, tmp_path):
+    path = tmp_path / "index.npz"
+    monkeypatch.setattr(settings, "embedding_index_path", str(path))
+    monkeypatch.setattr(embeddings, "_index", None)
+    assert client.get("/animes/1/similar", headers=auth_headers).status_code == 503
+    client.post("/animes/bulk", json=[{"title": title, "description": description, "rating": 5} for _, title, description in ANIMES], headers=auth_headers)
+    with database.SessionLocal() as db:
+        build(db, path)
+    response = client.get("/animes/1/similar", params={"limit": 3}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()[0]["id"] == 2
@@ -0,0 +1,35 @@
+# The hot reverse lookups from benchmarks/explain_indexes.py, as a test. Needs a
+# PostgreSQL database with the migrations applied:
+#
+#   alembic upgrade head
+#   DATABASE_URL=postgresql://... python -m pytest tests/test_explain_indexes.py
+import os
+
+import pytest
+from sqlalchemy import text
+
+from benchmarks.explain_indexes import HOT_QUERIES, explain, index_scans
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("DATABASE_URL", "").startswith("postgresql"),
+    reason="DATABASE_URL does not point at PostgreSQL",
+)
+
+
+@pytest.fixture(scope="module")
+def connection():
+    from anirecs import database
+
+    with database.engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            # As in the script: small tables would rightly get sequential scans.
+            connection.execute(text("SET LOCAL enable_seqscan = off"))
+            yield connection
+        finally:
+            transaction.rollback()
+
+
+@pytest.mark.parametrize("statement, expected", [query[1:] for query in HOT_QUERIES], ids=[query[0] for query in HOT_QUERIES])
+def test_hot_query_uses_index(connection, statement, expected):
+    assert expected in list(index_scans(explain(connection, statement)))
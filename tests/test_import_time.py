@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from benchmarks.import_time import DEFAULT_BUDGET_MS, TARGETS, best_run, forbidden_imports, import_ms, measure, target_env
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def test_import_main_stays_light(monkeypatch):
+    # measure() runs `python -c`, which imports anirecs from the working directory.
+    monkeypatch.chdir(REPO)
+    _, modules = best_run([measure(TARGETS["import"], target_env("import")) for _ in range(3)])
+    assert forbidden_imports(modules) == []
+    assert import_ms(modules) <= DEFAULT_BUDGET_MS["import"]
+
+
+def test_forbidden_imports_matches_packages_not_prefixes():
+    modules = {"numpy": (1, 1), "numpy.linalg": (1, 1), "numpydoc": (1, 1), "anirecs.database": (1, 1), "anirecs.databases": (1, 1)}
+    assert forbidden_imports(modules) == ["anirecs.database", "numpy", "numpy.linalg"]
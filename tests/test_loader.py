@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from anirecs import models
+from anirecs.loader import Loader
+
+pytest.importorskip("aiosqlite")
+
+
+def test_loader_batches_and_keeps_order():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        statements = []
+        event.listen(engine.sync_engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+        try:
+            async with engine.begin() as connection:
+                await connection.run_sync(models.Base.metadata.create_all)
+            async with AsyncSession(engine) as db:
+                db.add_all([models.Anime(id=anime_id, title=f"anime{anime_id}", description="", rating=5) for anime_id in (1, 2, 3)])
+                db.add(models.Genre(id=1, name="Action"))
+                await db.commit()
+                db.expunge_all()
+                statements.clear()
+
+                loader = Loader(db)
+                animes, genre = await asyncio.gather(loader.load_many(models.Anime, [3, 1, 3, 99]), loader.load(models.Genre, 1))
+                batched = len(statements)
+                again = await loader.load_many(models.Anime, [1, 99])
+                return animes, genre, again, batched, len(statements)
+        finally:
+            await engine.dispose()
+
+    animes, genre, again, batched, total = asyncio.run(run())
+    assert [anime and anime.id for anime in animes] == [3, 1, 3, None]
+    assert animes[0] is animes[2]
+    assert genre.name == "Action"
+    # One query per model, and nothing more for ids (or misses) already looked up.
+    assert batched == 2
+    assert [anime and anime.id for anime in again] == [1, None]
+    assert total == batched
+
+
+@pytest.fixture
+def catalog(client, auth_headers):
+    for name in ("Action", "Drama"):
+        client.post("/genres", json={"name": name}, headers=auth_headers)
+    client.post("/animes/bulk", json=[{"title": f"Anime {i}", "description": "words", "rating": i} for i in range(3)], headers=auth_headers)
+    client.post("/genre-anime/bulk", json=[{"genre_id": 2, "anime_id": 1}, {"genre_id": 1, "anime_id": 1}, {"genre_id": 1, "anime_id": 3}], headers=auth_headers)
+
+
+def test_ids_keep_the_requested_order_with_genres(client, auth_headers, catalog):
+    response = client.get("/animes", params={"ids": "3,1,3,99", "include": "genres"}, headers=auth_headers)
+    animes = response.json()
+    assert [anime["id"] for anime in animes] == [3, 1, 3]
+    assert [[genre["id"] for genre in anime["genres"]] for anime in animes] == [[1], [1, 2], [1]]
+    batch = client.post("/animes:batchGet", params={"include": "genres"}, json={"ids": [3, 1, 3, 99]}, headers=auth_headers)
+    assert batch.json() == animes
+
+
+def test_ids_with_fields_and_include(client, auth_headers, catalog):
+    response = client.get("/animes", params={"ids": "2,1", "fields": "id,title", "include": "genres"}, headers=auth_headers)
+    animes = response.json()
+    assert [{key: anime[key] for key in ("id", "title")} for anime in animes] == [{"id": 2, "title": "Anime 1"}, {"id": 1, "title": "Anime 0"}]
+    assert set(animes[0]) == {"id", "title", "genres"}
+    assert animes[0]["genres"] == [] and [genre["name"] for genre in animes[1]["genres"]] == ["Action", "Drama"]
+    assert client.get("/animes", params={"ids": "1", "fields": "title", "include": "genres"}, headers=auth_headers).status_code == 400
+    assert client.get("/animes", params={"ids": "1", "include": "studios"}, headers=auth_headers).status_code == 400
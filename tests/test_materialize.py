@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from anirecs import materialize, models, recommender
+from anirecs.config import settings
+
+pytest.importorskip("aiosqlite")
+
+
+@pytest.fixture
+def materialized(monkeypatch):
+    monkeypatch.setattr(settings, "recommendation_materialized", True)
+    for name, value in {"_recommender": None, "_generation": 0, "_built_generation": -1, "_task": None, "_task_generation": None}.items():
+        monkeypatch.setattr(recommender, name, value)
+    materialize.changes.drain()
+    yield
+    materialize.changes.drain()
+
+
+def test_refresh_rewrites_only_the_affected_users(monkeypatch, materialized):
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        monkeypatch.setattr(recommender.database, "open_session", lambda: AsyncSession(engine))
+        try:
+            async with engine.begin() as connection:
+                await connection.run_sync(models.Base.metadata.create_all)
+            async with AsyncSession(engine) as db:
+                db.add_all([models.User(id=user_id, username=f"user{user_id}", password="x") for user_id in (1, 2)])
+                db.add_all([models.Genre(id=genre_id, name=f"genre{genre_id}") for genre_id in (1, 2)])
+                db.add_all([models.Anime(id=anime_id, title=f"anime{anime_id}", description="", rating=5) for anime_id in (1, 2, 3)])
+                await db.flush()
+                db.add_all([models.GenreAnime(genre_id=1, anime_id=1), models.GenreAnime(genre_id=1, anime_id=2), models.GenreAnime(genre_id=2, anime_id=3)])
+                db.add_all([models.Preference(user_id=1, genre_id=1), models.Preference(user_id=2, genre_id=2)])
+                await db.commit()
+
+                assert await materialize.refresh(db, {1, 2}, set(), set()) == 2
+                before = {row.user_id: materialize.unpack(row, 10)[0] for row in (await db.execute(models.UserRecommendation.__table__.select())).all()}
+
+                # Linking anime 3 to genre 1 only moves the scores of users who care about genre 1.
+                db.add(models.GenreAnime(genre_id=1, anime_id=3))
+                await db.commit()
+                written = await materialize.refresh(db, set(), {1}, {3})
+                after = {row.user_id: materialize.unpack(row, 10)[0] for row in (await db.execute(models.UserRecommendation.__table__.select())).all()}
+                return before, written, after
+        finally:
+            await recommender.stop()
+            await engine.dispose()
+
+    before, written, after = asyncio.run(run())
+    assert sorted(before[1]) == [1, 2] and before[2] == [3]
+    assert written == 1
+    assert sorted(after[1]) == [1, 2, 3]
+    assert after[2] == [3]
+
+
+def test_unlinking_an_anime_marks_its_favouriters(client, auth_headers, materialized):
+    client.post("/genres", json={"name": "Action"}, headers=auth_headers)
+    client.post("/animes", json={"title": "Anime", "description": "words", "rating": 5}, headers=auth_headers)
+    client.post("/genre-anime", json={"genre_id": 1, "anime_id": 1}, headers=auth_headers)
+    client.post("/user/addfavourites", json={"user_id": 1, "anime_id": 1}, headers=auth_headers)
+    materialize.changes.drain()
+
+    assert client.delete("/genre-anime/anime/1", headers=auth_headers).status_code == 204
+    users, genres, animes = materialize.changes.drain()
+    assert (users, genres, animes) == ({1}, set(), {1})
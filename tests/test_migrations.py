@@ -0,0 +1,50 @@
+import os
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect
+
+from anirecs import models
+
+BASELINE_TABLES = {"users", "genres", "animes", "favourites", "prefereces", "genreAnimes"}
+
+
+@pytest.fixture
+def migrate(tmp_path):
+    url = f"sqlite:///{tmp_path / 'anirecs.sqlite'}"
+    # No ini file, so alembic leaves the test run's logging configuration alone.
+    config = Config()
+    config.set_main_option("script_location", os.path.join(os.path.dirname(os.path.dirname(__file__)), "alembic"))
+    config.set_main_option("sqlalchemy.url", url)
+    engine = create_engine(url)
+
+    def migrate(action, revision):
+        getattr(command, action)(config, revision)
+        inspector = inspect(engine)
+        tables = set(inspector.get_table_names()) - {"alembic_version"}
+        return tables, {index["name"] for table in tables for index in inspector.get_indexes(table)}
+
+    yield migrate
+    engine.dispose()
+
+
+def model_indexes():
+    return {index.name for table in models.Base.metadata.tables.values() for index in table.indexes}
+
+
+def test_upgrade_head_builds_the_models_schema(migrate):
+    tables, indexes = migrate("upgrade", "head")
+    assert tables == set(models.Base.metadata.tables)
+    assert indexes >= model_indexes()
+    assert migrate("downgrade", "base") == (set(), set())
+
+
+def test_baseline_database_gets_the_later_tables_and_indexes(migrate):
+    # What `alembic stamp 0001` is for: a database the old create_all built.
+    tables, indexes = migrate("upgrade", "0001")
+    assert tables == BASELINE_TABLES
+    assert not indexes & model_indexes()
+    tables, indexes = migrate("upgrade", "head")
+    assert {"user_recommendations", "anime_stats", "revoked_tokens"} <= tables
+    assert indexes >= model_indexes()
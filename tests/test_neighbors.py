@@ -0,0 +1,52 @@
+import asyncio
+import os
+
+import pytest
+
+from anirecs import neighbors
+from anirecs.config import settings
+from anirecs.neighbors import NeighborIndex
+
+# user 1: animes 1, 2; user 2: 1, 2, 3; user 3: 3, 4
+FAVOURITES = [(1, 1), (1, 2), (2, 1), (2, 2), (2, 3), (3, 3), (3, 4)]
+
+
+@pytest.fixture
+def index():
+    return NeighborIndex.from_favourites(FAVOURITES, top_k=2)
+
+
+def test_from_favourites_keeps_top_k_cosine_neighbours(index):
+    assert index.anime_ids.tolist() == [1, 2, 3, 4]
+    assert index.neighbors[0].tolist() == [2, 3]
+    assert index.scores[0].tolist() == pytest.approx([1.0, 0.5])
+    # Anime 4 only co-occurs with 3; the rest of its row is padding.
+    assert index.neighbors[3].tolist() == [3, -1]
+    assert index.scores[3].tolist() == pytest.approx([2 ** -0.5, 0.0])
+
+
+def test_recommend_sums_neighbour_scores_and_skips_favourites(index):
+    assert index.recommend([1], 10) == ([2, 3], pytest.approx([1.0, 0.5]))
+    assert index.recommend([1, 2], 10) == ([3], pytest.approx([1.0]))
+    assert index.recommend([99], 10) == ([], [])
+    assert index.recommend([], 10) == ([], [])
+
+
+def test_get_index_reloads_when_the_file_changes(monkeypatch, tmp_path, index):
+    path = str(tmp_path / "neighbors.npz")
+    monkeypatch.setattr(settings, "neighbor_index_path", path)
+    monkeypatch.setattr(neighbors, "_index", None)
+    monkeypatch.setattr(neighbors, "_index_mtime", None)
+
+    assert asyncio.run(neighbors.get_index()) is None
+    index.save(path)
+    first = asyncio.run(neighbors.get_index())
+    assert first.neighbors.tolist() == index.neighbors.tolist()
+    assert asyncio.run(neighbors.get_index()) is first
+
+    NeighborIndex.from_favourites(FAVOURITES[:2], top_k=2).save(path)
+    mtime = os.stat(path).st_mtime + 10
+    os.utime(path, (mtime, mtime))
+    second = asyncio.run(neighbors.get_index())
+    assert second is not first
+    assert second.anime_ids.tolist() == [1, 2]
@@ -0,0 +1,44 @@
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+from anirecs.pagination import check_ids, decode_cursor, encode_cursor, parse_ids
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor((42, 7))
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == [42, 7]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    encode_cursor([1, 2]),
+    encode_cursor(["1"]),
+    encode_cursor([1.5]),
+    base64.urlsafe_b64encode(b'{"id": 1}').decode(),
+])
+def test_decode_cursor_rejects(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor(cursor, 1)
+    assert raised.value.status_code == 400
+
+
+def test_parse_ids_keeps_order_and_repeats():
+    assert parse_ids("3, 1,3,,") == [3, 1, 3]
+
+
+def test_parse_ids_rejects_non_integers():
+    with pytest.raises(HTTPException) as raised:
+        parse_ids("1,x")
+    assert raised.value.status_code == 400
+
+
+def test_check_ids_enforces_the_limit(monkeypatch):
+    from anirecs.config import settings
+
+    monkeypatch.setattr(settings, "batch_get_max_ids", 3)
+    assert check_ids([1, 2, 3]) == [1, 2, 3]
+    with pytest.raises(HTTPException):
+        check_ids([1, 2, 3, 4])
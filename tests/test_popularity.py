@@ -0,0 +1,72 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from anirecs import models, popularity
+from anirecs.config import settings
+from anirecs.popularity import Counters
+
+pytest.importorskip("aiosqlite")
+
+
+def test_trending_key_orders_like_the_decayed_score():
+    # One half-life later a score counts half; the key itself never has to change.
+    key = popularity.trending_key(8.0, 100.0)
+    assert popularity.decayed(key, 100.0) == pytest.approx(8.0)
+    assert popularity.decayed(key, 101.0) == pytest.approx(4.0)
+    assert popularity.decayed(key, 103.0) == pytest.approx(1.0)
+    # An older, bigger score and a newer, smaller one rank the same way at any later time.
+    older, newer = popularity.trending_key(8.0, 100.0), popularity.trending_key(3.0, 102.0)
+    assert older < newer
+    assert popularity.decayed(older, 110.0) < popularity.decayed(newer, 110.0)
+
+
+def test_trending_key_drops_scores_below_the_floor():
+    assert popularity.trending_key(popularity.TRENDING_FLOOR / 2, 100.0) is None
+    assert popularity.decayed(None, 100.0) == 0.0
+
+
+def test_counters_only_count_when_enabled(monkeypatch):
+    counters = Counters()
+    counters.viewed(1)
+    assert not any(counters.drain())
+    monkeypatch.setattr(settings, "popularity_enabled", True)
+    counters.favourited(1)
+    counters.favourited(1, -1)
+    counters.favourited(2)
+    counters.viewed(2)
+    favourites, views, trending = counters.drain()
+    assert (favourites, views) == ({1: 0, 2: 1}, {2: 1})
+    assert trending[2] == pytest.approx(settings.trending_favourite_weight + settings.trending_view_weight)
+    assert not any(counters.drain())
+
+
+def test_flush_adds_to_the_stored_counts(monkeypatch):
+    clock = iter([100.0, 101.0])
+    monkeypatch.setattr(popularity, "_now", lambda: next(clock))
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            async with engine.begin() as connection:
+                await connection.run_sync(models.Base.metadata.create_all)
+            async with AsyncSession(engine) as db:
+                db.add_all([models.Anime(id=anime_id, title=f"anime{anime_id}", description="", rating=5) for anime_id in (1, 2)])
+                await db.commit()
+                # Anime 9 was deleted after it was counted: it's skipped, not inserted.
+                first = await popularity.flush(db, Counter({1: 2, 9: 1}), Counter({1: 3}), Counter({1: 4.0, 9: 1.0}))
+                second = await popularity.flush(db, Counter({1: -5, 2: 1}), Counter(), Counter({1: 2.0, 2: 1.0}))
+                rows = (await db.execute(select(models.AnimeStat).order_by(models.AnimeStat.anime_id))).scalars().all()
+                return first, second, [(row.anime_id, row.favourites, row.views, row.trending) for row in rows]
+        finally:
+            await engine.dispose()
+
+    first, second, rows = asyncio.run(run())
+    assert (first, second) == (1, 2)
+    assert [row[:3] for row in rows] == [(1, 0, 3), (2, 1, 0)]
+    # Anime 1's 4.0 halved over one half-life before the new 2.0 was added.
+    assert popularity.decayed(rows[0][3], 101.0) == pytest.approx(4.0)
+    assert popularity.decayed(rows[1][3], 101.0) == pytest.approx(1.0)
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from anirecs import ratelimit
+from anirecs.ratelimit import Limit, MemoryLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+def test_limit_parse():
+    limit = Limit.parse(" 10 / minute ")
+    assert (limit.count, limit.interval, limit.tolerance) == (10, 6.0, 60.0)
+
+
+@pytest.mark.parametrize("text", ["0/second", "10/fortnight", "ten/second", "10"])
+def test_limit_parse_rejects(text):
+    with pytest.raises(ValueError):
+        Limit.parse(text)
+
+
+def test_memory_limiter_allows_a_burst_then_refills(clock):
+    limiter = MemoryLimiter(max_keys=100)
+    limit = Limit(3, 3.0)
+
+    def hit(key="a"):
+        return asyncio.run(limiter.hit(key, limit))
+
+    assert [hit()[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = hit()
+    assert not allowed and retry_after == pytest.approx(1.0)
+    assert hit("b")[0]
+    clock.now += 1.0
+    assert hit()[0]
+    assert not hit()[0]
+    clock.now += 3.0
+    assert [hit()[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_memory_limiter_stays_within_max_keys(clock):
+    limiter = MemoryLimiter(max_keys=4)
+    limit = Limit(1, 60.0)
+    for key in range(10):
+        assert asyncio.run(limiter.hit(str(key), limit))[0]
+        assert len(limiter._tat) <= 4
+    # Buckets whose time has passed go first.
+    clock.now += 60.0
+    asyncio.run(limiter.hit("new", limit))
+    assert list(limiter._tat) == ["new"]
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from anirecs import recommender
+from anirecs.recommender import GenreAffinityRecommender
+
+# anime 10: genres 1, 2; 11: genre 1; 12: genre 3; 13: genres 1, 3
+LINKS = [(10, 1), (10, 2), (11, 1), (12, 3), (13, 1), (13, 3)]
+
+
+@pytest.fixture
+def engine():
+    return GenreAffinityRecommender.from_rows(LINKS, [(1, 1), (2, 3)], [(1, 10), (3, 12)])
+
+
+def test_recommend_ranks_by_genre_affinity_and_skips_favourites(engine):
+    animes, scores = engine.recommend(1, 10)
+    # 12 shares no genre with user 1, so it scores 0 and is dropped.
+    assert animes == [11, 13]
+    assert scores[0] > scores[1] > 0
+    assert engine.recommend(1, 1)[0] == [11]
+
+
+def test_recommend_uses_favourites_without_preferences(engine):
+    assert engine.recommend(3, 10)[0] == [13]
+
+
+def test_recommend_unknown_user(engine):
+    assert engine.recommend(99, 10) == ([], [])
+
+
+def test_recommend_for_scores_a_fresh_profile(engine):
+    assert engine.recommend_for([3], [], 2)[0] == [12, 13]
+    assert engine.recommend_for([3], [12], 2)[0] == [13]
+    assert engine.recommend_for([99], [], 2) == ([], [])
+
+
+def test_get_recommender_rebuilds_after_invalidate(monkeypatch):
+    links = [(10, 1)]
+    builds = []
+
+    class Session:
+        async def close(self):
+            pass
+
+    async def build(db):
+        builds.append(list(links))
+        return GenreAffinityRecommender.from_rows(list(links), [(1, 1)], [])
+
+    monkeypatch.setattr(recommender.database, "open_session", Session)
+    monkeypatch.setattr(GenreAffinityRecommender, "build", build)
+    for name, value in {"_recommender": None, "_generation": 0, "_built_generation": -1, "_task": None, "_task_generation": None}.items():
+        monkeypatch.setattr(recommender, name, value)
+
+    async def run():
+        first = await recommender.get_recommender()
+        links.append((11, 1))
+        recommender.invalidate()
+        # The old engine keeps serving while the rebuild runs in the background.
+        stale = await recommender.get_recommender()
+        fresh = await recommender.get_recommender(fresh=True)
+        again = await recommender.get_recommender()
+        await recommender.stop()
+        return first, stale, fresh, again
+
+    first, stale, fresh, again = asyncio.run(run())
+    assert stale is first
+    assert first.anime_ids.tolist() == [10]
+    assert fresh.anime_ids.tolist() == [10, 11]
+    assert again is fresh
+    assert len(builds) == 2
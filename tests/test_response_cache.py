@@ -0,0 +1,70 @@
+import asyncio
+
+from fastapi import Request, Response
+
+from anirecs.cache import MemoryBackend
+from anirecs.pagination import NEXT_CURSOR_HEADER
+from anirecs.response_cache import ResponseCache
+
+
+def request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/genres", "headers": headers})
+
+
+def test_respond_caches_and_answers_if_none_match():
+    cache = ResponseCache(MemoryBackend(100, 60), 60)
+    loads = []
+
+    async def load(response: Response):
+        loads.append(response)
+        response.headers[NEXT_CURSOR_HEADER] = "abc"
+        return [{"id": 1, "name": "Action"}]
+
+    async def run():
+        first = await cache.respond(request(), "genres", "list", load)
+        second = await cache.respond(request(first.headers["ETag"]), "genres", "list", load)
+        other = await cache.respond(request('"stale", ' + first.headers["ETag"]), "genres", "list", load)
+        return first, second, other
+
+    first, second, other = asyncio.run(run())
+    assert first.status_code == 200
+    assert first.body == b'[{"id":1,"name":"Action"}]'
+    assert first.headers[NEXT_CURSOR_HEADER] == "abc"
+    assert second.status_code == 304 and not second.body
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert other.status_code == 304
+    assert len(loads) == 1
+
+
+def test_invalidate_changes_the_etag():
+    cache = ResponseCache(MemoryBackend(100, 60), 60)
+    names = iter(["Action", "Adventure"])
+
+    async def load(response: Response):
+        return {"id": 1, "name": next(names)}
+
+    async def run():
+        before = await cache.respond(request(), "genres", "id:1", load)
+        await cache.invalidate("anime:1")
+        unchanged = await cache.respond(request(before.headers["ETag"]), "genres", "id:1", load)
+        await cache.invalidate("genres")
+        after = await cache.respond(request(before.headers["ETag"]), "genres", "id:1", load)
+        return before, unchanged, after
+
+    before, unchanged, after = asyncio.run(run())
+    assert unchanged.status_code == 304
+    assert after.status_code == 200
+    assert after.body == b'{"id":1,"name":"Adventure"}'
+    assert after.headers["ETag"] != before.headers["ETag"]
+
+
+def test_genre_detail_is_revalidated_after_an_update(client, auth_headers):
+    client.post("/genres", json={"name": "Action"}, headers=auth_headers)
+    first = client.get("/genres/1", headers=auth_headers)
+    etag = first.headers["ETag"]
+    assert client.get("/genres/1", headers={**auth_headers, "If-None-Match": etag}).status_code == 304
+    client.put("/genres/1", json={"name": "Adventure"}, headers=auth_headers)
+    after = client.get("/genres/1", headers={**auth_headers, "If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.json()["name"] == "Adventure"
@@ -0,0 +1,26 @@
+import sys
+
+import pytest
+
+from anirecs.config import settings
+from anirecs.main import create_app
+
+
+def test_fast_json_without_orjson_fails_at_startup(monkeypatch):
+    monkeypatch.setattr(settings, "response_fast_json", True)
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    monkeypatch.delitem(sys.modules, "anirecs.responses", raising=False)
+    with pytest.raises(RuntimeError, match="orjson"):
+        create_app()
+
+
+def test_fast_json_returns_the_same_body(client, auth_headers, monkeypatch):
+    pytest.importorskip("orjson")
+    client.post("/animes/bulk", json=[{"title": f"Anime {i}", "description": "words", "rating": i} for i in range(3)], headers=auth_headers)
+    for params in ({}, {"fields": "id,title"}, {"limit": 2}):
+        slow = client.get("/animes", params=params, headers=auth_headers)
+        monkeypatch.setattr(settings, "response_fast_json", True)
+        fast = client.get("/animes", params=params, headers=auth_headers)
+        monkeypatch.setattr(settings, "response_fast_json", False)
+        assert fast.content == slow.content
+        assert fast.headers.get("X-Next-Cursor") == slow.headers.get("X-Next-Cursor")
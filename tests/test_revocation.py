@@ -0,0 +1,92 @@
+import pytest
+
+from anirecs import oauth2, revocation
+from anirecs.config import settings
+from anirecs.revocation import BloomFilter, RevocationList
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    keys = [f"key{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f"key{i}")
+    false_positives = sum(f"other{i}" in bloom for i in range(10000))
+    # Sized for 1%; allow for the randomness of 10000 probes.
+    assert false_positives < 200
+
+
+@pytest.fixture
+def small_bloom(monkeypatch):
+    monkeypatch.setattr(settings, "token_revocation_bloom_capacity", 4)
+    monkeypatch.setattr(settings, "token_revocation_bloom_error_rate", 0.01)
+
+
+def test_revocation_list_matches_token_or_session(small_bloom):
+    revoked = RevocationList()
+    revoked.add("session", 2000.0)
+    assert revoked.is_revoked("token", "session")
+    assert revoked.is_revoked("session")
+    assert not revoked.is_revoked("token", "other")
+    assert not revoked.is_revoked(None, None)
+
+
+def test_revocation_list_grows_past_capacity(small_bloom):
+    revoked = RevocationList()
+    for i in range(10):
+        revoked.add(f"jti{i}", 2000.0)
+    assert revoked.bloom.capacity >= 10
+    assert all(revoked.is_revoked(f"jti{i}") for i in range(10))
+
+
+def test_revocation_list_prune_forgets_expired(small_bloom):
+    revoked = RevocationList()
+    revoked.add("old", 1000.0)
+    revoked.add("new", 3000.0)
+    revoked.prune(2000.0)
+    assert not revoked.is_revoked("old")
+    assert revoked.is_revoked("new")
+    assert list(revoked.expires) == ["new"]
+
+
+@pytest.fixture
+def session(client, monkeypatch):
+    monkeypatch.setattr(revocation, "revoked", RevocationList())
+    monkeypatch.setattr(oauth2, "revoked", revocation.revoked)
+    client.post("/register", json={"username": "tester", "password": "secret"})
+    tokens = client.post("/login", params={"username": "tester", "password": "secret"}).json()
+    return {"Authorization": f"Bearer {tokens['access_token']}"}, tokens["refresh_token"]
+
+
+def test_deleting_the_user_ends_the_session(client, session):
+    headers, refresh_token = session
+    assert client.post("/refresh", params={"refresh_token": refresh_token}).status_code == 200
+    assert client.delete("/users/me", headers=headers).status_code == 204
+    assert client.post("/refresh", params={"refresh_token": refresh_token}).status_code == 401
+    assert client.get("/users/me", headers=headers).status_code == 401
+
+
+def test_renaming_the_user_ends_the_session_in_claims_mode(client, session, monkeypatch):
+    monkeypatch.setattr(settings, "auth_user_mode", "claims")
+    headers, refresh_token = session
+    response = client.put("/users/1", json={"username": "renamed"}, headers=headers)
+    assert response.json()["username"] == "renamed"
+    assert client.post("/refresh", params={"refresh_token": refresh_token}).status_code == 401
+    tokens = client.post("/login", params={"username": "renamed", "password": "secret"}).json()
+    assert client.get("/users/me", headers={"Authorization": f"Bearer {tokens['access_token']}"}).json()["username"] == "renamed"
+
+
+def test_refresh_reads_the_user_without_revocation(client, session, monkeypatch):
+    monkeypatch.setattr(settings, "token_revocation", False)
+    headers, refresh_token = session
+    client.put("/users/1", json={"username": "renamed"}, headers=headers)
+    access_token = client.post("/refresh", params={"refresh_token": refresh_token}).json()["access_token"]
+    assert oauth2.verify_token(access_token, credentials_exception=ValueError())["username"] == "renamed"
+    client.delete("/users/me", headers=headers)
+    assert client.post("/refresh", params={"refresh_token": refresh_token}).status_code == 404
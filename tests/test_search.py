@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from anirecs import models, search
+from anirecs.search import NGramIndex, trigrams
+
+pytest.importorskip("aiosqlite")
+
+
+def test_trigrams_pad_like_pg_trgm():
+    assert trigrams("Cat") == {"  c", " ca", "cat", "at "}
+    assert trigrams("  ") == set()
+
+
+def test_index_ranks_by_weighted_overlap():
+    index = NGramIndex({"title": 1.0, "description": 0.5})
+    index.add(1, {"title": "Cowboy Bebop", "description": "Bounty hunters in space"})
+    index.add(2, {"title": "Space Dandy", "description": "An alien hunter"})
+    index.add(3, {"title": "Planetes", "description": "Debris collectors in space"})
+    assert index.search("space", 10, 0.3) == [2, 1, 3]
+    assert index.search("bebpo", 10, 0.3) == [1]
+    assert index.search("", 10, 0.3) == []
+
+
+def test_index_add_replaces_and_remove_forgets():
+    index = NGramIndex({"name": 1.0})
+    index.add(1, {"name": "Action"})
+    index.add(1, {"name": "Drama"})
+    assert index.search("action", 10, 0.3) == []
+    assert index.search("drama", 10, 0.3) == [1]
+    index.remove(1)
+    assert index.search("drama", 10, 0.3) == []
+    assert not any(index.postings["name"].values())
+
+
+def test_search_ids_on_sqlite_uses_the_memory_index(monkeypatch):
+    monkeypatch.setattr(search, "_indexes", {})
+    monkeypatch.setattr(search, "_built_at", {})
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            async with engine.begin() as connection:
+                await connection.run_sync(models.Base.metadata.create_all)
+            async with AsyncSession(engine) as db:
+                db.add_all([models.Genre(name=name) for name in ("Action", "Adventure", "Drama")])
+                await db.commit()
+                first = await search.search_ids(db, models.Genre, "actoin", 10)
+                search.index_row(models.Genre, models.Genre(id=4, name="Action Comedy"))
+                second = await search.search_ids(db, models.Genre, "action", 10)
+                return first, second
+        finally:
+            await engine.dispose()
+
+    first, second = asyncio.run(run())
+    assert first == [1]
+    assert second == [1, 4]
+
+
+class Session:
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def genre_index(monkeypatch):
+    index = NGramIndex(search.SEARCH_FIELDS[models.Genre])
+    index.add(1, {"name": "Action"})
+    monkeypatch.setattr(search, "_indexes", {models.Genre: index})
+    monkeypatch.setattr(search, "_built_at", {models.Genre: 0.0})
+    monkeypatch.setattr(search, "_rebuilds", {})
+    monkeypatch.setattr(search.database, "open_session", Session)
+    return index
+
+
+def test_rebuild_replays_writes_made_while_it_runs(monkeypatch, genre_index):
+    async def build(db, model):
+        # Lands after the rows were read, so the rebuilt index wouldn't have it.
+        search.index_row(models.Genre, models.Genre(id=2, name="Drama"))
+        search.remove_row(models.Genre, 1)
+        index = NGramIndex(search.SEARCH_FIELDS[model])
+        index.add(1, {"name": "Action"})
+        return index
+
+    monkeypatch.setattr(search, "_build_index", build)
+    asyncio.run(search._rebuild(models.Genre))
+    rebuilt = search._indexes[models.Genre]
+    assert rebuilt is not genre_index
+    assert rebuilt.search("drama", 10, 0.3) == [2]
+    assert rebuilt.search("action", 10, 0.3) == []
+    assert genre_index.search("drama", 10, 0.3) == [2]
+    assert search._pending == {}
+
+
+def test_failed_rebuild_waits_an_interval_before_retrying(monkeypatch, genre_index):
+    builds = []
+
+    async def build(db, model):
+        builds.append(model)
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(search, "_build_index", build)
+
+    async def run():
+        for _ in range(3):
+            assert await search._memory_index(None, models.Genre) is genre_index
+            await asyncio.gather(*search._rebuilds.values(), return_exceptions=True)
+
+    asyncio.run(run())
+    assert builds == [models.Genre]
+    assert search._indexes[models.Genre] is genre_index
+
+
+def test_search_rejects_a_cursor(client, auth_headers):
+    response = client.get("/genres", params={"search": "action", "after": "MQ"}, headers=auth_headers)
+    assert response.status_code == 400
+    assert client.get("/genres", params={"search": "action"}, headers=auth_headers).json() == []
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+
+import pytest
+
+from anirecs import utils
+from anirecs.config import settings
+from anirecs.utils import PasswordPool, PasswordPoolSaturated
+
+
+def test_password_pool_rejects_past_capacity():
+    pool = PasswordPool("thread", workers=1, queue_size=1)
+    release = threading.Event()
+
+    async def run():
+        running = [asyncio.ensure_future(pool.run("hash", release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert pool.pending == 2
+        with pytest.raises(PasswordPoolSaturated):
+            await pool.run("hash", release.wait)
+        release.set()
+        await asyncio.gather(*running)
+        # Finished work frees its slot.
+        return await pool.run("hash", len, "abc")
+
+    try:
+        assert asyncio.run(run()) == 3
+        assert pool.pending == 0
+    finally:
+        pool.shutdown()
+
+
+def test_saturated_pool_returns_503_with_retry_after(client, monkeypatch):
+    monkeypatch.setattr(utils.password_pool, "pending", utils.password_pool.capacity)
+    response = client.post("/register", json={"username": "tester", "password": "secret"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(settings.password_retry_after_seconds)
+    monkeypatch.setattr(utils.password_pool, "pending", 0)
+    assert client.post("/register", json={"username": "tester", "password": "secret"}).status_code == 201